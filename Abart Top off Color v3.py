@@ -4,13 +4,59 @@ import numpy as np
 import os
 from datetime import datetime
 import csv
+import threading
+import time
 import pygame
+from bart_engine import (BartEngine, BASE_BALLOON_SIZE, BALLOON_GROWTH_PER_PUMP, CSV_FIELDNAMES,
+                         PUMPED, POPPED, TOPOFF_OFFERED, COLLECTED, simplified_row)
+from bart_replay import (ActionLog, load_action_log, data_file_for_log, verify_against_csv, check_pump_action,
+                         SELECT, PUMP, TOPOFF, COLLECT)
+from frame_profiler import FrameProfiler
+from bart_schedules import normal_sequence, fallback_sequence
+from stim_allocation import StimulusAllocationCheck
+from trajectory_buffer import TrajectoryBuffer, slider_decision_metrics
+
+# Phases timed on every frame of run_trial_loop, each marked once per frame. Frames that run the
+# blocking explosion or money collection animations are left out of the timings
+FRAME_PHASES = ['input', 'slider', 'click', 'pump_simulation', 'draw_balloon', 'draw_ui', 'flip', 'wait']
+(PHASE_INPUT, PHASE_SLIDER, PHASE_CLICK, PHASE_PUMP_SIMULATION, PHASE_DRAW_BALLOON,
+ PHASE_DRAW_UI, PHASE_FLIP, PHASE_WAIT) = range(len(FRAME_PHASES))
 
 class BART:
-    def __init__(self):
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=1024)
+    def __init__(self, replay_path=None, replay_speed=1.0):
+        # Startup phase durations in seconds (printed once the first balloon is ready)
+        self.startup_times = {}
+        phase_start = time.perf_counter()
+        
+        # Replay mode feeds a recorded action log instead of the mouse
+        self.replay_path = replay_path
+        self.replay_log = load_action_log(replay_path) if replay_path else None
+        self.replay_speed = replay_speed
+        self.replay_index = 0
+        
         # Get participant info
-        self.get_participant_info()
+        if self.replay_log:
+            self.participant_id = self.replay_log['participant_id']
+            self.treatment = self.replay_log['treatment']
+        else:
+            self.get_participant_info()
+        phase_start = self.record_startup_phase('participant_info', phase_start)
+        
+        # Automatic BART parameters
+        self.array_size = 128
+        self.points_per_pump = 0.01  # 1 cent per pump
+        self.total_trials = 30
+        
+        # Sounds, break points and the top-off assignment are loaded in the
+        # background while the instructions are shown (see load_assets)
+        self.pump_sound = None
+        self.pop_sound = None
+        self.collect_sound = None
+        self.engine = None
+        self.asset_error = None
+        self.assets_ready = threading.Event()
+        self.asset_thread = threading.Thread(target=self.load_assets, name='BART asset loader', daemon=True)
+        self.asset_thread.start()
         
         # Initialize window FIRST - FULLSCREEN
         self.win = visual.Window(
@@ -30,60 +76,116 @@ class BART:
 
         self.win.mouseVisible = True
         self.calculate_text_scaling()
-
-        # Automatic BART parameters
-        self.array_size = 128
-        self.points_per_pump = 0.01  # 1 cent per pump
-        self.total_trials = 30
-        
-        # Generate break points for 30 trials with average of 64
-        self.break_points = self.generate_break_points()
+        phase_start = self.record_startup_phase('window', phase_start)
         
         # Slider control variables
-        self.selected_pumps = 1
         self.slider_dragging = False
         
         # Pumping animation variables
-        self.is_pumping = False
-        self.pumps_to_simulate = 0
-        self.pumps_simulated = 0
         self.pump_timer = 0
-        self.pump_interval = 0.1  # Time between simulated pumps
-        self.in_topoff_mode = False  # Track if we're in top-off mode
-        
-        # Initialize display elements
-        self.setup_display()
+        self.pump_interval = 0.1 / replay_speed  # Time between simulated pumps
         
-        # Data storage
-        self.trial_data = []
-        self.total_earned = 0.0
-        self.last_balloon_earned = 0.0
-        self.temporary_bank = 0.0
+        # Display elements are built by prepare_display() once the first instruction page is up
+        self.display_ready = False
         
-        # Current trial variables
-        self.current_trial = 0
-        self.current_pumps = 0
-        self.current_balloon_size = 50
+        # Balloon appearance (game state lives in self.engine)
+        self.current_balloon_size = BASE_BALLOON_SIZE
         self.balloon_exploded = False
         
-        # Track pump sessions within a trial
-        self.pump_sessions = []  # List of individual pump sessions
-        self.session_number = 0  # Current session number within trial
-        self.has_topped_off = False  # Track if user has already topped off
-
-        # Tracking variables for proper top-off logging
-        self.intended_pumps_total = 0  # Track total intended pumps (initial + topoff)
-        self.initial_pumps_selected = 0  # Track first session selection
-        self.topoff_pumps_selected = 0  # Track topoff session selection
-        self.current_session_is_topoff = False  # Track if current session is top-off
-        
-        # Trial sequence - 30 balloons total
-        self.trial_sequence = self.create_trial_sequence()
-
-        # Pre-generate top-off assignment: 15 True, 15 False, shuffled
-        self.topoff_assignment = [True]*15 + [False]*15
-        random.shuffle(self.topoff_assignment)
+        # Timestamped log of accepted actions, saved with the data for replay
+        self.action_log = ActionLog()
+        self.action_clock = core.Clock()
+        
+        # Per-phase frame timing of run_trial_loop (F12 toggles it during the task)
+        self.frame_profiler = FrameProfiler(FRAME_PHASES)
+        
+        # Mouse trajectory, one sample per frame while the participant uses the slider
+        self.slider_trajectory = TrajectoryBuffer()
+        self.decision_start_count = 0
+        self.decision_start_time = 0.0
+        self.slider_decisions = []  # one metrics row per pump, top-off or collect decision
+        
+        # Every stimulus is built in setup_display; the trial loop must not construct new ones
+        self.stim_allocation_check = StimulusAllocationCheck()
+    
+    def record_startup_phase(self, name, phase_start):
+        """Store how long a startup phase took; returns the time to start the next phase from"""
+        now = time.perf_counter()
+        self.startup_times[name] = now - phase_start
+        return now
+    
+    def load_assets(self):
+        """Background startup work: audio mixer, sound decoding, break points and top-off assignment"""
+        try:
+            phase_start = time.perf_counter()
+            pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=1024)
+            try:
+                self.pump_sound = pygame.mixer.Sound("./Sound Effects/pump.mp3")
+                self.pop_sound = pygame.mixer.Sound("./Sound Effects/pop.mp3") 
+                self.collect_sound = pygame.mixer.Sound("./Sound Effects/collect.mp3")
+                print("Sounds loaded successfully")
+            except Exception as e:
+                print(f"Warning: Could not load sounds: {e}")
+                self.pump_sound = None
+                self.pop_sound = None
+                self.collect_sound = None
+            phase_start = self.record_startup_phase('sounds (background)', phase_start)
+            
+            # Generate break points for 30 trials with average of 64 (or reuse the recorded ones)
+            if self.replay_log:
+                self.break_points = list(self.replay_log['break_points'])
+            else:
+                self.break_points = self.generate_break_points()
+            
+            # Trial sequence - 30 balloons total
+            self.trial_sequence = self.create_trial_sequence()
+            
+            # Top-off assignment (recorded one when replaying)
+            if self.replay_log:
+                self.topoff_assignment = list(self.replay_log['topoff_assignment'])
+            else:
+                self.topoff_assignment = self.create_topoff_assignment()
+            self.record_startup_phase('break_points (background)', phase_start)
+        except Exception as e:
+            self.asset_error = e
+        finally:
+            self.assets_ready.set()
+    
+    def wait_for_assets(self):
+        """Block until the background assets are loaded, then create the game engine"""
+        if self.engine is not None:
+            return
+        phase_start = time.perf_counter()
+        self.assets_ready.wait()
+        self.record_startup_phase('asset_wait', phase_start)
+        if self.asset_error is not None:
+            raise self.asset_error
+        
+        # Display-free game state: pumps, banks, top-off logic and trial records
+        self.engine = BartEngine(
+            self.break_points,
+            self.topoff_assignment,
+            participant_id=self.participant_id,
+            treatment=self.treatment,
+            points_per_pump=self.points_per_pump,
+            array_size=self.array_size
+        )
         
+        print("Startup phases:")
+        for name, duration in self.startup_times.items():
+            print(f"  {name}: {duration * 1000:.1f} ms")
+    
+    def prepare_display(self):
+        """Build the task stimuli if they have not been built yet"""
+        if self.display_ready:
+            return
+        phase_start = time.perf_counter()
+        self.setup_display()
+        self.display_ready = True
+        self.record_startup_phase('setup_display', phase_start)
+    
+    def create_topoff_assignment(self):
+        """Offer a top-off on 15 of the 30 balloons, always including the 3 highest break points"""
         # 1. Find indices of the three highest break points
         break_points = [trial['explosion_point'] for trial in self.trial_sequence]
         sorted_indices = sorted(range(len(break_points)), key=lambda i: break_points[i], reverse=True)
@@ -97,18 +199,9 @@ class BART:
         final_topoff_indices = set(guaranteed_topoff_indices + random_topoff_indices)
 
         # 4. Create the assignment list
-        self.topoff_assignment = [i in final_topoff_indices for i in range(len(break_points))]
-        print(self.topoff_assignment)
-        try:
-            self.pump_sound = pygame.mixer.Sound("./Sound Effects/pump.mp3")
-            self.pop_sound = pygame.mixer.Sound("./Sound Effects/pop.mp3") 
-            self.collect_sound = pygame.mixer.Sound("./Sound Effects/collect.mp3")
-            print("Sounds loaded successfully")
-        except Exception as e:
-            print(f"Warning: Could not load sounds: {e}")
-            self.pump_sound = None
-            self.pop_sound = None
-            self.collect_sound = None
+        topoff_assignment = [i in final_topoff_indices for i in range(len(break_points))]
+        print(topoff_assignment)
+        return topoff_assignment
     
     def get_participant_info(self):
         """Get participant information"""
@@ -196,64 +289,12 @@ class BART:
         return all_break_points
 
     def generate_sequence_with_exact_average(self, array_size, target_avg, sequence_length):
-        """
-        Generate a sequence of break points sampled from a normal distribution (bell curve)
-        with the specified target average (mean/median), clamped to [1, array_size].
-        The final sequence is adjusted so the average is as close as possible to target_avg.
-        """
-        mu = target_avg
-        sigma = array_size / 6  # 99.7% of values within [mu-3*sigma, mu+3*sigma]
-        # Sample from normal distribution
-        sequence = np.random.normal(loc=mu, scale=sigma, size=sequence_length)
-        # Clamp to valid range and round
-        sequence = [int(round(max(1, min(array_size, x)))) for x in sequence]
-        # Adjust to get exact average if needed
-        current_avg = np.mean(sequence)
-        target_sum = target_avg * sequence_length
-        current_sum = sum(sequence)
-        difference = int(round(target_sum - current_sum))
-        # Distribute difference to bring average closer to target
-        indices = list(range(sequence_length))
-        random.shuffle(indices)
-        for i in indices:
-            if difference == 0:
-                break
-            if difference > 0 and sequence[i] < array_size:
-                sequence[i] += 1
-                difference -= 1
-            elif difference < 0 and sequence[i] > 1:
-                sequence[i] -= 1
-                difference += 1
-        # Final clamp
-        sequence = [max(1, min(array_size, x)) for x in sequence]
-        return sequence
+        """Generate a sequence of normally distributed break points around target_avg (bart_schedules, shared with bart_montecarlo)"""
+        return normal_sequence(array_size, target_avg, sequence_length)
 
     def create_fallback_sequence(self, array_size, target_avg, sequence_length):
         """Create a sequence with exact average using a deterministic method"""
-        target_sum = target_avg * sequence_length
-        
-        # Start with all values at target_avg (rounded down)
-        base_value = int(target_avg)
-        sequence = [base_value] * sequence_length
-        
-        # Calculate how much we need to add to reach the exact sum
-        current_sum = sum(sequence)
-        remainder = target_sum - current_sum
-        
-        # Distribute the remainder
-        positions = list(range(sequence_length))
-        random.shuffle(positions)
-        
-        for i, pos in enumerate(positions):
-            if remainder <= 0:
-                break
-            
-            if sequence[pos] < array_size:
-                add_amount = min(1, remainder, array_size - sequence[pos])
-                sequence[pos] += add_amount
-                remainder -= add_amount
-        
-        return sequence
+        return fallback_sequence(array_size, target_avg, sequence_length)
 
     def create_trial_sequence(self):
         """Create the trial sequence: 30 balloons total"""
@@ -291,12 +332,8 @@ class BART:
 
     def update_slider_position(self):
         """Update slider handle position based on selected pumps"""
-        if self.in_topoff_mode:
-            # Top-off mode: 1-9 pumps
-            pump_ratio = (self.selected_pumps - 1) / 8  # 8 = range from 1-9
-        else:
-            # Normal mode: 1-128 pumps
-            pump_ratio = (self.selected_pumps - 1) / 127  # 127 = range from 1-128
+        # Top-off mode: 1-9 pumps, normal mode: 1-128 pumps
+        pump_ratio = (self.engine.selected_pumps - 1) / (self.engine.max_selectable_pumps - 1)
         
         # Calculate handle position along slider track
         handle_x = self.slider_left + pump_ratio * self.slider_width
@@ -304,15 +341,8 @@ class BART:
 
     def calculate_predicted_balloon_size(self):
         """Calculate what balloon size would be after pumping selected amount"""
-        if self.in_topoff_mode:
-            # For top-off, show what size would be after adding more pumps to current total
-            total_pumps_after_topoff = self.current_pumps + self.selected_pumps
-            predicted_size = 50 + (total_pumps_after_topoff * 8)
-        else:
-            # For initial pump, start from base balloon size (50)
-            predicted_size = 50 + (self.selected_pumps * 8)
-        
-        return predicted_size
+        # For top-off this adds the selection to the current total
+        return BASE_BALLOON_SIZE + self.engine.predicted_pumps() * BALLOON_GROWTH_PER_PUMP
 
     def setup_display(self):
         """Setup all display elements with slider control and balloon preview"""
@@ -488,6 +518,23 @@ class BART:
             wrapWidth=screen_width * 0.8,
             alignText='center'
         )
+        
+        # Explosion feedback (repositioned and resized on each pop)
+        self.explosion = visual.Circle(
+            self.win,
+            radius=50,
+            pos=[0, balloon_y],
+            fillColor='red',
+            lineColor='darkred'
+        )
+        
+        self.pop_text = visual.TextStim(
+            self.win,
+            text='POP!',
+            pos=[0, balloon_y],
+            color='white',
+            height=self.text_sizes['huge']
+        )
             
     def show_instructions(self):
         """Show task instructions"""
@@ -528,39 +575,28 @@ class BART:
             wrapWidth=1200
         )
         
-        for instruction in instructions:
+        for page, instruction in enumerate(instructions):
             instruction_display.text = instruction
             instruction_display.draw()
             self.win.flip()
             
+            if page == 0:
+                # Build the task stimuli while the first page is being read
+                self.prepare_display()
+            
             keys = event.waitKeys(keyList=['space', 'escape'])
             if keys and 'escape' in keys:
                 self.quit_experiment()
 
     def start_new_balloon(self):
-        """Initialize a new balloon"""
-        if self.current_trial >= self.total_trials:
+        """Show a fresh balloon for the engine's current trial"""
+        if self.engine.finished:
             self.end_experiment()
             return
         
-        # Reset balloon state
-        self.current_pumps = 0
-        self.current_balloon_size = 50
-        self.temporary_bank = 0.0
+        # Reset balloon appearance (the engine has already reset its state)
+        self.current_balloon_size = BASE_BALLOON_SIZE
         self.balloon_exploded = False
-        self.is_pumping = False
-        self.in_topoff_mode = False
-        self.has_topped_off = False
-        
-        # Reset intended pump tracking
-        self.intended_pumps_total = 0
-        self.initial_pumps_selected = 0
-        self.topoff_pumps_selected = 0
-        self.current_session_is_topoff = False
-        
-        # Reset session tracking
-        self.pump_sessions = []
-        self.session_number = 0
         
         # Reset balloon appearance to green (0 pumps)
         self.balloon.fillColor = [-1, 1, -1]  # Green in PsychoPy coordinates
@@ -570,16 +606,16 @@ class BART:
         # Reset preview to green
         self.balloon_preview.lineColor = [-1, 1, -1]  # Green
         
-        # Reset slider to 1
-        self.selected_pumps = 1
+        # Slider starts at 1
         self.update_slider_position()
         
         # Update displays
         self.update_displays()
+        self.begin_slider_decision()
 
     def handle_slider_interaction(self, mouse_pos, mouse_pressed):
         """Handle slider interaction for selecting pump count"""
-        if self.is_pumping:  # Don't allow slider interaction during pumping
+        if self.engine.is_pumping:  # Don't allow slider interaction during pumping
             return
             
         mouse_x, mouse_y = mouse_pos
@@ -597,336 +633,203 @@ class BART:
                 relative_x = max(0, min(self.slider_width, mouse_x - self.slider_left))
                 slider_ratio = relative_x / self.slider_width
                 
-                if self.in_topoff_mode:
-                    # Top-off mode: 1-9 pumps (9 total values)
-                    new_pumps = max(1, min(9, int(1 + slider_ratio * 8 + 0.5)))  # +0.5 for rounding
-                else:
-                    # Normal mode: 1-128 pumps (128 total values)
-                    new_pumps = max(1, min(128, int(1 + slider_ratio * 127 + 0.5)))  # +0.5 for rounding
+                # Top-off mode: 1-9 pumps, normal mode: 1-128 pumps
+                max_pumps = self.engine.max_selectable_pumps
+                new_pumps = int(1 + slider_ratio * (max_pumps - 1) + 0.5)  # +0.5 for rounding
                 
-                if new_pumps != self.selected_pumps:
-                    self.selected_pumps = new_pumps
-                    self.update_slider_position()
-                    
-                    # UPDATE BOTH SIZE AND COLOR FOR PREVIEW
-                    predicted_size = self.calculate_predicted_balloon_size()
-                    self.balloon_preview.radius = predicted_size
-                    
-                    # Calculate predicted pump count for preview color
-                    if self.in_topoff_mode:
-                        predicted_pumps = self.current_pumps + self.selected_pumps
-                    else:
-                        predicted_pumps = self.selected_pumps
-                    
-                    # Update preview circle color
-                    preview_color = self.calculate_balloon_color(predicted_pumps)
-                    self.balloon_preview.lineColor = preview_color
-                    
-                    print(f"DEBUG: Updated preview to {predicted_size} pixels, color for {predicted_pumps} pumps")
-                    
-                    # Update text
-                    self.pump_count_text.text = f'Pumps: {self.selected_pumps}'
+                self.set_selected_pumps(new_pumps)
         
         if not mouse_pressed:
             self.slider_dragging = False
+    
+    def set_selected_pumps(self, pumps):
+        """Select a pump count and update the slider, preview and pump count text"""
+        if not self.engine.select_pumps(pumps):
+            return
+        self.log_action(SELECT, self.engine.selected_pumps)
+        self.update_slider_position()
+        
+        # UPDATE BOTH SIZE AND COLOR FOR PREVIEW
+        predicted_size = self.calculate_predicted_balloon_size()
+        self.balloon_preview.radius = predicted_size
+        
+        # Predicted pump count for preview color
+        predicted_pumps = self.engine.predicted_pumps()
+        
+        # Update preview circle color
+        preview_color = self.calculate_balloon_color(predicted_pumps)
+        self.balloon_preview.lineColor = preview_color
+        
+        print(f"DEBUG: Updated preview to {predicted_size} pixels, color for {predicted_pumps} pumps")
+        
+        # Update text
+        self.pump_count_text.text = f'Pumps: {self.engine.selected_pumps}'
+    
+    def log_action(self, action, value=None):
+        """Record an accepted participant action for later replay"""
+        self.action_log.record(self.action_clock.getTime(), action, value)
+    
+    def begin_slider_decision(self):
+        """Mark the start of a new slider decision (new balloon or top-off offer)"""
+        self.decision_start_count = self.slider_trajectory.count
+        self.decision_start_time = core.getTime()
+    
+    def current_decision_metrics(self):
+        """Trial, decision number, dwell time, reversals and max value of the slider decision in progress"""
+        samples = self.slider_trajectory.since(self.decision_start_count)
+        metrics = {
+            'Trial': self.engine.current_trial + 1,
+            'Decision_Number': self.engine.session_number + 1
+        }
+        metrics.update(slider_decision_metrics(samples, self.decision_start_time, core.getTime()))
+        return metrics
+    
+    def record_slider_decision(self, decision, metrics):
+        """Keep the metrics of a finished decision for the slider CSV"""
+        row = {'Trial': metrics['Trial'], 'Decision_Number': metrics['Decision_Number'], 'Decision': decision}
+        row.update(metrics)
+        self.slider_decisions.append(row)
+    
     def start_pump_simulation(self):
         """Start the automatic pumping simulation"""
-        if self.is_pumping:
+        if self.engine.is_pumping:
             return
         
-        # Track intended pumps based on session
-        if self.session_number == 0:  # First session
-            self.initial_pumps_selected = self.selected_pumps
-            self.intended_pumps_total = self.selected_pumps
-            self.current_session_is_topoff = False
-        elif self.in_topoff_mode:  # Top-off session
-            self.topoff_pumps_selected = self.selected_pumps
-            self.intended_pumps_total = self.initial_pumps_selected + self.selected_pumps
-            self.current_session_is_topoff = True
-        
-        # Validate pump selection for top-off mode
-        if self.in_topoff_mode and self.selected_pumps > 9:
-            self.selected_pumps = 9
-            self.topoff_pumps_selected = 9
-            self.intended_pumps_total = self.initial_pumps_selected + 9
-            self.update_slider_position()
-            
-        # Start pumping simulation
-        self.is_pumping = True
-        self.pumps_to_simulate = self.selected_pumps
-        self.pumps_simulated = 0
+        # Slider decision metrics are stored with the pump session
+        decision_metrics = self.current_decision_metrics()
+        session_metrics = {key: value for key, value in decision_metrics.items() if key.startswith('slider_')}
+        if not self.engine.start_pumping(annotations=session_metrics):
+            return
+        decision = TOPOFF if self.engine.current_session_is_topoff else PUMP
+        self.record_slider_decision(decision, decision_metrics)
+        self.log_action(decision, self.engine.selected_pumps)
+        
+        # Top-off selection may have been clamped to the top-off limit
+        self.update_slider_position()
         self.pump_timer = core.getTime()
         
-        print(f"Adding {self.pumps_to_simulate} more pumps. Current total: {self.current_pumps}")
-        print(f"Intended total: {self.intended_pumps_total}")
-        print(f"Is top-off session: {self.current_session_is_topoff}")
+        print(f"Adding {self.engine.pumps_to_simulate} more pumps. Current total: {self.engine.current_pumps}")
+        print(f"Intended total: {self.engine.intended_pumps_total}")
+        print(f"Is top-off session: {self.engine.current_session_is_topoff}")
 
     def update_pump_simulation(self):
-        """Update the pumping simulation"""
-        if not self.is_pumping:
+        """Animate the next engine pump once the pump interval has elapsed"""
+        if not self.engine.is_pumping:
             return False
             
         current_time = core.getTime()
         
         if current_time - self.pump_timer >= self.pump_interval:
             # Time for next pump
-            self.pumps_simulated += 1
-            self.current_pumps += 1
-            
-            # Check explosion first
-            trial_info = self.trial_sequence[self.current_trial]
-            explosion_point = trial_info['explosion_point']
+            transition = self.engine.pump_once()
+            self.current_balloon_size += BALLOON_GROWTH_PER_PUMP
             
-            if self.current_pumps >= explosion_point:
+            if transition == POPPED:
                 # Balloon pops during simulation
-                self.temporary_bank += self.points_per_pump
-                self.current_balloon_size += 8
                 self.balloon_pop()
                 return False
             
             # Successful pump
             self.play_sound("pump.mp3")
-            
-            # Increase balloon size
-            self.current_balloon_size += 8
             self.balloon.radius = self.current_balloon_size
             
-            # Add money to temporary bank
-            self.temporary_bank += self.points_per_pump
-            
-            # Update display
-            self.update_displays()
-            
             # Reset timer
             self.pump_timer = current_time
             
-            # Check if simulation complete
-            if self.pumps_simulated >= self.pumps_to_simulate:
-                self.is_pumping = False
-                
-                # Record this pump session with INTENDED pumps
-                self.record_pump_session_data_only()
-                
-                # Handle post-session logic based on session type
-                if self.current_session_is_topoff:
-                    # Top-off session completed - auto-collect
-                    print("Top-off session completed - auto-collecting money")
-                    core.wait(0.5)
-                    self.collect_money_after_topoff()
-                else:
-                    # First session completed - show top-off option if assigned for this trial
-                    if self.session_number == 1 and not self.has_topped_off:
-                        # Use pre-generated assignment for this trial
-                        if self.topoff_assignment[self.current_trial]:
-                            print("DEBUG: Showing top-off option (assigned)")
-                            self.show_topoff_option()
-                        else:
-                            print("DEBUG: Skipping top-off, auto-collecting (assigned)")
-                            core.wait(0.5)
-                            self.collect_money()
-                    else:
-                        print("DEBUG: Not showing top-off")
-                
-                return False
+            if transition == PUMPED:
+                self.update_displays()
+                return True
+            
+            # Session complete - the engine has decided what happens next
+            if transition == TOPOFF_OFFERED:
+                print("DEBUG: Showing top-off option (assigned)")
+                self.show_topoff_option()
+            elif transition == COLLECTED:
+                # Top-off session finished or no top-off assigned - auto-collect
+                print("DEBUG: Session complete, auto-collecting money")
+                self.animation_wait(0.5)
+                self.animate_money_collection()
+                self.start_new_balloon()
+            else:
+                print("DEBUG: Not showing top-off")
+                self.update_displays()
+            
+            return False
         
         return True
 
-    def record_pump_session_data_only(self):
-        """Record pump session data without triggering any other actions"""
-        trial_info = self.trial_sequence[self.current_trial]
-        
-        self.session_number += 1
-        was_topoff_session = self.current_session_is_topoff
-        
-        print(f"Recording session {self.session_number}: was_topoff={was_topoff_session}, INTENDED_pumps={self.selected_pumps}")
-        
-        # Record the session data with INTENDED pumps
-        session_data = {
-            'participant_id': self.participant_id,
-            'treatment': self.treatment,
-            'trial': self.current_trial + 1,
-            'session': self.session_number,
-            'explosion_point': trial_info['explosion_point'],
-            'pumps_selected_this_session': self.selected_pumps,  # INTENDED pumps
-            'pumps_actual_this_session': self.pumps_simulated,   # ACTUAL pumps
-            'total_pumps_so_far': self.current_pumps,
-            'temporary_bank': self.temporary_bank,
-            'was_topoff': was_topoff_session,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        self.pump_sessions.append(session_data)
-        print(f"Session {self.session_number}: INTENDED {self.selected_pumps}, ACTUAL {self.pumps_simulated}, was_topoff: {was_topoff_session}")
-        
-        # Mark top-off as used if this was a top-off session
-        if was_topoff_session:
-            self.has_topped_off = True
-            self.in_topoff_mode = False
-
     def show_topoff_option(self):
         """Show option to add 1-9 more pumps after first session"""
-        # Limit slider to 1-9 pumps for top-off
-        self.in_topoff_mode = True
-        self.selected_pumps = 1  # Reset to 1
+        # The engine has limited the selection to 1-9 pumps and reset it to 1
         self.update_slider_position()
         
         # Update displays to show top-off mode
         self.update_displays()
+        self.begin_slider_decision()
 
     def collect_money(self):
         """Collect money from temporary bank"""
-        if self .temporary_bank > 0 and not self.is_pumping:
-            # Exit top-off mode
-            self.in_topoff_mode = False
-            
-            # Track last balloon info
-            self.last_balloon_pumps = self.intended_pumps_total
-            self.last_balloon_exploded = False
-            print(f"DEBUG: Collecting - tracking INTENDED {self.intended_pumps_total} pumps (actual: {self.current_pumps})")
-            
-            # Play collection sound and animate money transfer
-            self.animate_money_collection()
-            
-            # Transfer money
-            self.last_balloon_earned = self.temporary_bank
-            self.total_earned += self.temporary_bank
-            
-            # Record trial data
-            self.record_trial_data(exploded=False)
-            
-            # Reset temporary bank
-            self.temporary_bank = 0.0
-            
-            # Move to next trial
-            self.current_trial += 1
-            self.start_new_balloon()
-
-    def collect_money_after_topoff(self):
-        """Auto-collect money after top-off session"""
-        if self.temporary_bank > 0:
-            # Track last balloon info
-            self.last_balloon_pumps = self.intended_pumps_total
-            self.last_balloon_exploded = False
-            print(f"DEBUG: Auto-collecting after topoff - tracking INTENDED {self.intended_pumps_total} pumps (actual: {self.current_pumps})")
-            
-            # Play collection sound and animate money transfer
-            self.animate_money_collection()
-            
-            # Transfer money
-            self.last_balloon_earned = self.temporary_bank
-            self.total_earned += self.temporary_bank
-            
-            # Record trial data
-            self.record_trial_data(exploded=False)
-            
-            # Reset temporary bank
-            self.temporary_bank = 0.0
-            
-            # Move to next trial
-            self.current_trial += 1
-            self.start_new_balloon()
+        decision_metrics = self.current_decision_metrics()
+        record = self.engine.collect()
+        if record is None:
+            return
+        self.record_slider_decision(COLLECT, decision_metrics)
+        self.log_action(COLLECT)
+        print(f"DEBUG: Collecting - tracking INTENDED {self.engine.last_balloon_pumps} pumps (actual: {record.total_pumps})")
+        
+        # Play collection sound and animate money transfer
+        self.animate_money_collection()
+        
+        # Move to next trial
+        self.start_new_balloon()
 
     def balloon_pop(self):
-        """Handle balloon explosion"""
+        """Show the explosion of the balloon the engine just popped"""
+        self.frame_profiler.discard_frame()
         self.balloon_exploded = True
-        self.is_pumping = False
         self.play_sound("pop.mp3")
-        
-        # Record the current pump session with INTENDED pumps (for explosions)
-        self.record_explosion_session()
-        
-        # Track last balloon info
-        self.last_balloon_pumps = self.intended_pumps_total
-        self.last_balloon_exploded = True
-        self.last_balloon_earned = 0.0
-        print(f"DEBUG: Exploding - tracking INTENDED {self.intended_pumps_total} pumps (actual: {self.current_pumps})")
+        print(f"DEBUG: Exploding - tracking INTENDED {self.engine.last_balloon_pumps} pumps")
         
         # Show explosion effect
         self.show_explosion()
         
-        # Record trial data
-        self.record_trial_data(exploded=True)
-        
-        # Reset temporary bank
-        self.temporary_bank = 0.0
-        
         # Move to next trial
-        self.current_trial += 1
-        core.wait(1.0)
+        self.animation_wait(1.0)
         self.start_new_balloon()
 
-    def record_explosion_session(self):
-        """Record pump session when balloon explodes during pumping"""
-        trial_info = self.trial_sequence[self.current_trial]
-        
-        self.session_number += 1
-        was_topoff_session = self.current_session_is_topoff
-        
-        print(f"Recording EXPLOSION session {self.session_number}: was_topoff={was_topoff_session}, INTENDED_pumps={self.selected_pumps}")
-        
-        # Record the INTENDED pumps, not what actually happened
-        session_data = {
-            'participant_id': self.participant_id,
-            'treatment': self.treatment,
-            'trial': self.current_trial + 1,
-            'session': self.session_number,
-            'explosion_point': trial_info['explosion_point'],
-            'pumps_selected_this_session': self.selected_pumps,  # INTENDED pumps
-            'pumps_actual_this_session': self.pumps_simulated,   # ACTUAL pumps before explosion
-            'total_pumps_so_far': self.current_pumps,
-            'temporary_bank': self.temporary_bank,
-            'was_topoff': was_topoff_session,
-            'exploded_during_session': True,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        self.pump_sessions.append(session_data)
-        print(f"EXPLOSION Session {self.session_number}: INTENDED {self.selected_pumps}, ACTUAL {self.pumps_simulated}, was_topoff: {was_topoff_session}")
-        
-        # Mark top-off as used if this was a top-off session that exploded
-        if was_topoff_session:
-            self.has_topped_off = True
-            self.in_topoff_mode = False
+    def animation_wait(self, seconds):
+        """Pause inside a blocking animation, shortened by the replay speed"""
+        core.wait(seconds / self.replay_speed)
 
     def show_explosion(self):
         """Show balloon explosion animation"""
-        explosion = visual.Circle(
-            self.win,
-            radius=self.current_balloon_size * 1.5,
-            pos=self.balloon.pos,
-            fillColor='red',
-            lineColor='darkred'
-        )
-        
-        pop_text = visual.TextStim(
-            self.win,
-            text='POP!',
-            pos=self.balloon.pos,
-            color='white',
-            height=self.text_sizes['huge']
-        )
+        self.explosion.radius = self.current_balloon_size * 1.5
+        self.explosion.pos = self.balloon.pos
+        self.pop_text.pos = self.balloon.pos
         
         # Flash effect
         for _ in range(3):
-            explosion.draw()
-            pop_text.draw()
+            self.explosion.draw()
+            self.pop_text.draw()
             self.draw_ui()
             self.win.flip()
-            core.wait(0.1)
+            self.animation_wait(0.1)
             
             self.draw_ui()
             self.win.flip()
-            core.wait(0.1)
+            self.animation_wait(0.1)
 
     def animate_money_collection(self):
-        """Animate money being transferred to total"""
+        """Animate the last collected balloon being transferred to total"""
+        self.frame_profiler.discard_frame()
         self.play_sound("collect.mp3")
         
-        original_total = self.total_earned
+        amount = self.engine.last_balloon_earned
+        original_total = self.engine.total_earned - amount
         steps = 20
         
         for i in range(steps + 1):
-            current_transfer = (self.temporary_bank / steps) * i
+            current_transfer = (amount / steps) * i
             display_total = original_total + current_transfer
             
             temp_text = f'Total Earned: ${display_total:.2f}'
@@ -935,120 +838,84 @@ class BART:
             self.draw_balloon()
             self.draw_ui()
             self.win.flip()
-            core.wait(0.05)
+            self.animation_wait(0.05)
     
-    def record_trial_data(self, exploded):
-        """Record data for current trial including all pump sessions"""
-        trial_info = self.trial_sequence[self.current_trial]
-        
-        print(f"Recording trial data for trial {self.current_trial + 1}")
-        print(f"Current pump_sessions: {self.pump_sessions}")
-        print(f"Has topped off: {self.has_topped_off}")
-        
-        # Main trial record
-        # Determine if top-off was offered for this trial
-        topoff_option = self.topoff_assignment[self.current_trial] if self.current_trial < len(self.topoff_assignment) else False
-
-        data_row = {
-            'participant_id': self.participant_id,
-            'treatment': self.treatment,
-            'trial': self.current_trial + 1,
-            'explosion_point': trial_info['explosion_point'],
-            'total_pump_sessions': len(self.pump_sessions),
-            'total_pumps_final': self.current_pumps,
-            'exploded': exploded,
-            'earned_this_balloon': 0.0 if exploded else self.temporary_bank,
-            'total_earned': self.total_earned,
-            'used_topoff': self.has_topped_off,
-            'topoff_option': topoff_option,  # TRUE if user had the option to top off, FALSE otherwise
-            'pump_sessions_detail': str(self.pump_sessions),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-        self.trial_data.append(data_row)
-        print(f"Trial {self.current_trial + 1} recorded with {len(self.pump_sessions)} sessions. Top-off option: {topoff_option}")
-
     def update_displays(self):
-        """Update all display texts and balloon preview"""
-        self.total_earned_text.text = f'Total Earned: ${self.total_earned:.2f}'
+        """Update all display texts and balloon preview from the engine state"""
+        engine = self.engine
+        self.total_earned_text.text = f'Total Earned: ${engine.total_earned:.2f}'
         
         # Enhanced last balloon display
-        if self.current_trial > 0:
-            if hasattr(self, 'last_balloon_exploded') and self.last_balloon_exploded:
-                trial_info = self.trial_sequence[self.current_trial - 1]
+        if engine.current_trial > 0:
+            if engine.last_balloon_exploded:
+                trial_info = self.trial_sequence[engine.current_trial - 1]
                 explosion_point = trial_info['explosion_point']
-                self.last_balloon_text.text = f'Last: ${self.last_balloon_earned:.2f}\nYou pumped: {getattr(self, "last_balloon_pumps", 0)}\nPopped at: {explosion_point}'
+                self.last_balloon_text.text = f'Last: ${engine.last_balloon_earned:.2f}\nYou pumped: {engine.last_balloon_pumps}\nPopped at: {explosion_point}'
             else:
-                self.last_balloon_text.text = f'Last: ${getattr(self, "last_balloon_earned", 0.0):.2f}\nYou pumped: {getattr(self, "last_balloon_pumps", 0)}'
+                self.last_balloon_text.text = f'Last: ${engine.last_balloon_earned:.2f}\nYou pumped: {engine.last_balloon_pumps}'
         else:
             self.last_balloon_text.text = 'Last Balloon: $0.00'
         
-        self.trial_number_text.text = f'Balloon {self.current_trial + 1} of {self.total_trials}'
+        self.trial_number_text.text = f'Balloon {engine.current_trial + 1} of {engine.total_trials}'
         
         # Update pump count display
-        if self.in_topoff_mode:
-            self.pump_count_text.text = f'Pumps: {self.selected_pumps}'
-        else:
-            self.pump_count_text.text = f'Pumps: {self.selected_pumps}'
+        self.pump_count_text.text = f'Pumps: {engine.selected_pumps}'
         
         # Update balloon preview size and colors (ONLY when not pumping)
-        if not self.is_pumping:
+        if not engine.is_pumping:
             # Update preview circle size
             predicted_size = self.calculate_predicted_balloon_size()
             self.balloon_preview.radius = predicted_size
             
-            # Calculate predicted pump count for preview color
-            if self.in_topoff_mode:
-                predicted_pumps = self.current_pumps + self.selected_pumps
-            else:
-                predicted_pumps = self.selected_pumps
+            # Predicted pump count for preview color
+            predicted_pumps = engine.predicted_pumps()
             
             # Update preview circle color
             preview_color = self.calculate_balloon_color(predicted_pumps)
             self.balloon_preview.lineColor = preview_color
         
         # Update actual balloon color based on current pumps (always update)
-        if self.current_pumps > 0:
-            balloon_color = self.calculate_balloon_color(self.current_pumps)
+        if engine.current_pumps > 0:
+            balloon_color = self.calculate_balloon_color(engine.current_pumps)
             self.balloon.fillColor = balloon_color
             # Make outline slightly darker
             outline_color = [c * 0.7 for c in balloon_color]
             self.balloon.lineColor = outline_color
         
         # Instruction text
-        if self.is_pumping:
+        if engine.is_pumping:
             instruction_lines = [
-                f'Pumping: {self.pumps_simulated}/{self.pumps_to_simulate}',
-                f'Total: {self.current_pumps}',
-                f'Temp Bank: ${self.temporary_bank:.2f}'
+                f'Pumping: {engine.pumps_simulated}/{engine.pumps_to_simulate}',
+                f'Total: {engine.current_pumps}',
+                f'Temp Bank: ${engine.temporary_bank:.2f}'
             ]
             self.instruction_text.text = '\n'.join(instruction_lines)
-        elif self.in_topoff_mode:
+        elif engine.in_topoff_mode:
             instruction_lines = [
                 'TOP-OFF: Add 1-9 more pumps?',
-                f'Total: {self.current_pumps}',
-                f'Temp Bank: ${self.temporary_bank:.2f}',
+                f'Total: {engine.current_pumps}',
+                f'Temp Bank: ${engine.temporary_bank:.2f}',
                 'PUMP to add or COLLECT to finish'
             ]
             self.instruction_text.text = '\n'.join(instruction_lines)
-        elif self.current_pumps > 0:
-            if self.has_topped_off:
+        elif engine.current_pumps > 0:
+            if engine.has_topped_off:
                 instruction_lines = [
-                    f'Total: {self.current_pumps}',
-                    f'Temp Bank: ${self.temporary_bank:.2f}',
+                    f'Total: {engine.current_pumps}',
+                    f'Temp Bank: ${engine.temporary_bank:.2f}',
                     'Top-off used - COLLECT to finish'
                 ]
             else:
                 instruction_lines = [
-                    f'Total: {self.current_pumps}',
-                    f'Temp Bank: ${self.temporary_bank:.2f}',
+                    f'Total: {engine.current_pumps}',
+                    f'Temp Bank: ${engine.temporary_bank:.2f}',
                     'COLLECT to finish'
                 ]
             self.instruction_text.text = '\n'.join(instruction_lines)
         else:
             instruction_lines = [
                 'Drag slider to select pumps, then PUMP',
-                f'Temp Bank: ${self.temporary_bank:.2f}'
+                f'Temp Bank: ${engine.temporary_bank:.2f}'
             ]
             self.instruction_text.text = '\n'.join(instruction_lines)
     def draw_balloon(self):
@@ -1079,7 +946,7 @@ class BART:
     
     def handle_mouse_click(self, pos):
         """Handle mouse clicks on buttons"""
-        if self.is_pumping:
+        if self.engine.is_pumping:
             return
             
         mouse_x, mouse_y = pos
@@ -1088,7 +955,7 @@ class BART:
         pump = self.pump_button_info
         if (pump['x'] - pump['width']//2 < mouse_x < pump['x'] + pump['width']//2 and
             pump['y'] - pump['height']//2 < mouse_y < pump['y'] + pump['height']//2):
-            print(f"Pump button clicked! Starting simulation with {self.selected_pumps} pumps")
+            print(f"Pump button clicked! Starting simulation with {self.engine.selected_pumps} pumps")
             self.start_pump_simulation()
             return
         
@@ -1103,62 +970,124 @@ class BART:
     def run_trial_loop(self):
         """Main trial loop"""
         mouse_pressed = False
+        self.action_clock.reset()
+        profiler = self.frame_profiler
+        self.stim_allocation_check.start()
         
-        while self.current_trial < self.total_trials:
+        while not self.engine.finished:
+            profiler.start_frame()
+            
             # Handle events
-            mouse = event.Mouse()
-            keys = event.getKeys(keyList=['escape'])
+            keys = event.getKeys(keyList=['escape', 'f12'])
             
             # Handle keyboard input
             if keys:
                 if 'escape' in keys:
                     self.quit_experiment()
+                if 'f12' in keys:
+                    print(f"Frame profiler {'enabled' if profiler.toggle() else 'disabled'}")
             
-            # Handle mouse interactions
-            mouse_pos = mouse.getPos()
-            mouse_buttons = mouse.getPressed()
-            current_mouse_pressed = mouse_buttons[0]
-            
-            # Handle slider interaction
-            self.handle_slider_interaction(mouse_pos, current_mouse_pressed)
-            
-            # Handle mouse clicks (only on button press, not hold)
-            if current_mouse_pressed and not mouse_pressed:
-                self.handle_mouse_click(mouse_pos)
-            
-            mouse_pressed = current_mouse_pressed
+            if self.replay_log:
+                # Recorded actions stand in for the mouse
+                self.apply_replay_actions()
+                profiler.mark(PHASE_INPUT)
+                profiler.mark(PHASE_SLIDER)
+                profiler.mark(PHASE_CLICK)
+            else:
+                # Handle mouse interactions
+                mouse = event.Mouse()
+                mouse_pos = mouse.getPos()
+                mouse_buttons = mouse.getPressed()
+                current_mouse_pressed = mouse_buttons[0]
+                profiler.mark(PHASE_INPUT)
+                
+                # Handle slider interaction
+                self.handle_slider_interaction(mouse_pos, current_mouse_pressed)
+                if not self.engine.is_pumping:
+                    self.slider_trajectory.append(core.getTime(), mouse_pos[0], mouse_pos[1],
+                                                  self.engine.selected_pumps, current_mouse_pressed)
+                profiler.mark(PHASE_SLIDER)
+                
+                # Handle mouse clicks (only on button press, not hold)
+                if current_mouse_pressed and not mouse_pressed:
+                    self.handle_mouse_click(mouse_pos)
+                
+                mouse_pressed = current_mouse_pressed
+                profiler.mark(PHASE_CLICK)
             
             # Update pumping simulation
             self.update_pump_simulation()
+            profiler.mark(PHASE_PUMP_SIMULATION)
             
             # Draw everything
             self.draw_balloon()
+            profiler.mark(PHASE_DRAW_BALLOON)
             self.draw_ui()
+            profiler.mark(PHASE_DRAW_UI)
             self.win.flip()
+            profiler.mark(PHASE_FLIP)
             
             # Small delay to prevent excessive CPU usage
             core.wait(0.01)
+            profiler.mark(PHASE_WAIT)
+            profiler.end_frame()
+
+    def apply_replay_actions(self):
+        """Apply recorded actions that are due at the replay speed, never during a pump session"""
+        actions = self.replay_log['actions']
+        while self.replay_index < len(actions) and not self.engine.is_pumping:
+            time_s, action, value = actions[self.replay_index]
+            if time_s / self.replay_speed > self.action_clock.getTime():
+                break
+            self.replay_index += 1
+            
+            if action == SELECT:
+                self.set_selected_pumps(value)
+            elif action in (PUMP, TOPOFF):
+                check_pump_action(self.engine, action, value)
+                self.start_pump_simulation()
+            elif action == COLLECT:
+                self.collect_money()
+    
+    def verify_replay(self):
+        """Check the replayed trial data against the CSV saved with the recorded session"""
+        csv_path = data_file_for_log(self.replay_log, self.replay_path)
+        if not os.path.exists(csv_path):
+            print(f"No saved data found at {csv_path}; skipping verification")
+            return
+        
+        mismatches = verify_against_csv(self.engine.trial_data, csv_path)
+        if mismatches:
+            print(f"❌ Replay does not match {csv_path}:")
+            for mismatch in mismatches:
+                print(f"  {mismatch}")
+        else:
+            print(f"✅ Replay matches {csv_path}")
 
     def end_experiment(self):
         """End the experiment and show results"""
+        # The trial loop ends here once the last balloon is resolved
+        if self.stim_allocation_check.active:
+            self.stim_allocation_check.report('run_trial_loop')
+        
         # Calculate statistics
-        all_pumps = [trial['total_pumps_final'] for trial in self.trial_data]
+        all_pumps = [trial['total_pumps_final'] for trial in self.engine.trial_data]
         mean_total_pumps = np.mean(all_pumps) if all_pumps else 0
         
         # Block analysis
-        block1_pumps = [trial['total_pumps_final'] for trial in self.trial_data[0:10]]
-        block2_pumps = [trial['total_pumps_final'] for trial in self.trial_data[10:20]]
-        block3_pumps = [trial['total_pumps_final'] for trial in self.trial_data[20:30]]
+        block1_pumps = [trial['total_pumps_final'] for trial in self.engine.trial_data[0:10]]
+        block2_pumps = [trial['total_pumps_final'] for trial in self.engine.trial_data[10:20]]
+        block3_pumps = [trial['total_pumps_final'] for trial in self.engine.trial_data[20:30]]
         
         mean_block1 = np.mean(block1_pumps) if block1_pumps else 0
         mean_block2 = np.mean(block2_pumps) if block2_pumps else 0
         mean_block3 = np.mean(block3_pumps) if block3_pumps else 0
         
         # Explosion analysis
-        total_explosions = sum(1 for trial in self.trial_data if trial['exploded'])
+        total_explosions = sum(1 for trial in self.engine.trial_data if trial['exploded'])
         
         # Top-off usage analysis
-        topoff_usage = sum(1 for trial in self.trial_data if trial.get('used_topoff', False))
+        topoff_usage = sum(1 for trial in self.engine.trial_data if trial.get('used_topoff', False))
         
         # Show final results
         results_text = f"""Experiment Complete!
@@ -1171,7 +1100,7 @@ class BART:
     Block 2 (11-20): {mean_block2:.2f} pumps  
     Block 3 (21-30): {mean_block3:.2f} pumps
     
-    Total Earned: ${self.total_earned:.2f}
+    Total Earned: ${self.engine.total_earned:.2f}
     Total Explosions: {total_explosions}
     Top-offs Used: {topoff_usage} balloons
     
@@ -1197,16 +1126,20 @@ class BART:
         # Wait for spacebar
         event.waitKeys(keyList=['space'])
         
-        # Save data
-        self.save_data()
+        # Save data (a replay is checked against the original data instead)
+        if self.replay_log:
+            self.verify_replay()
+        else:
+            self.save_data()
         
         # Close
         self.win.close()
         core.quit()
 
     def save_data(self):
-        """Save experimental data to single simplified CSV file"""
-        filename = f"BART_TopOff_data_{self.participant_id}_{self.treatment}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        """Save experimental data to single simplified CSV file, plus the action log for replay"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"BART_TopOff_data_{self.participant_id}_{self.treatment}_{timestamp}.csv"
         
         # Create data directory if it doesn't exist
         if not os.path.exists('Bart Data'):
@@ -1217,80 +1150,63 @@ class BART:
         # Create simplified data structure
         simplified_data = []
         
-        for trial in self.trial_data:
-            # Parse pump sessions to extract initial and topoff pumps
-            initial_pump = 0
-            top_off = 0
-
-            print(f"\n=== Processing Trial {trial['trial']} ===")
-            print(f"used_topoff flag: {trial.get('used_topoff', False)}")
-            print(f"topoff_option: {trial.get('topoff_option', False)}")
-            print(f"pump_sessions_detail: {trial.get('pump_sessions_detail', 'None')}")
-
-            if 'pump_sessions_detail' in trial and trial['pump_sessions_detail'] != '[]':
-                try:
-                    import ast
-                    sessions = ast.literal_eval(trial['pump_sessions_detail'])
-
-                    print(f"Successfully parsed {len(sessions)} sessions:")
-                    for i, session in enumerate(sessions):
-                        session_topoff = session.get('was_topoff', False)
-                        session_pumps = session.get('pumps_selected_this_session', 0)
-                        print(f"  Session {i+1}: was_topoff={session_topoff}, pumps={session_pumps}")
-
-                        if session_topoff:
-                            top_off = session_pumps
-                            print(f"    -> Found TOP-OFF session with {top_off} pumps")
-                        else:
-                            initial_pump = session_pumps
-                            print(f"    -> Found INITIAL session with {initial_pump} pumps")
-
-                except Exception as e:
-                    print(f"ERROR parsing sessions: {e}")
-                    # Fallback: use total pumps as initial if can't parse sessions
-                    initial_pump = trial.get('total_pumps_final', 0)
-                    top_off = 0
-                    print(f"Using fallback: initial_pump={initial_pump}, top_off=0")
-            else:
-                # No sessions recorded, use total pumps as initial
-                initial_pump = trial.get('total_pumps_final', 0)
-                top_off = 0
-                print(f"No sessions found, using total_pumps_final={initial_pump}")
+        for trial in self.engine.trial_data:
+            # Initial and top-off pumps come from the trial's pump sessions
+            row = simplified_row(trial)
 
             # Validation check
-            if trial.get('used_topoff', False) and top_off == 0:
+            if trial.get('used_topoff', False) and row['Top Off'] == 0:
                 print(f"⚠️  WARNING: Trial {trial['trial']} has used_topoff=True but extracted top_off=0")
 
-            row = {
-                'Timestamp': trial.get('timestamp', ''),
-                'ID': trial.get('participant_id', ''),
-                'Treatment': trial.get('treatment', ''),
-                'Trial': trial.get('trial', 0),
-                'Explosion Point': trial.get('explosion_point', 0),
-                'Initial Pump': initial_pump,
-                'Top Off': top_off,
-                'Topoff Option': trial.get('topoff_option', False)  # TRUE if user had the option to top off, FALSE otherwise
-            }
-
-            print(f"Final CSV row: Initial={initial_pump}, TopOff={top_off}, Topoff Option={trial.get('topoff_option', False)}")
+            print(f"Trial {row['Trial']} CSV row: Initial={row['Initial Pump']}, TopOff={row['Top Off']}, Topoff Option={row['Topoff Option']}")
             simplified_data.append(row)
         
         # Write simplified data
         try:
             with open(filepath, 'w', newline='') as csvfile:
                 if simplified_data:
-                    fieldnames = ['Timestamp', 'ID', 'Treatment', 'Trial', 'Explosion Point', 'Initial Pump', 'Top Off', 'Topoff Option']
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                    writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
                     writer.writeheader()
                     writer.writerows(simplified_data)
             
             print(f"\n✅ Simplified data saved to: {filepath}")
         except Exception as e:
             print(f"❌ Error saving data: {e}")
+        
+        # Write the action log next to the data so the session can be replayed
+        log_filepath = os.path.join('Bart Data', f"BART_TopOff_actions_{self.participant_id}_{self.treatment}_{timestamp}.json")
+        try:
+            self.action_log.save(log_filepath, self.engine, data_file=filepath)
+            print(f"✅ Action log saved to: {log_filepath}")
+        except Exception as e:
+            print(f"❌ Error saving action log: {e}")
+        
+        # Slider trajectory samples and per-decision metrics
+        trajectory_filepath = os.path.join('Bart Data', f"BART_SliderTrajectory_{self.participant_id}_{self.treatment}_{timestamp}.npz")
+        decisions_filepath = os.path.join('Bart Data', f"BART_SliderDecisions_{self.participant_id}_{self.treatment}_{timestamp}.csv")
+        try:
+            self.slider_trajectory.save(trajectory_filepath)
+            if self.slider_decisions:
+                with open(decisions_filepath, 'w', newline='') as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=list(self.slider_decisions[0].keys()))
+                    writer.writeheader()
+                    writer.writerows(self.slider_decisions)
+            print(f"✅ Slider trajectory saved to: {trajectory_filepath}")
+        except Exception as e:
+            print(f"❌ Error saving slider trajectory: {e}")
+        
+        # Frame time percentiles per loop phase
+        profile_filepath = os.path.join('Bart Data', f"BART_FrameTimes_{self.participant_id}_{self.treatment}_{timestamp}.csv")
+        try:
+            if self.frame_profiler.write_summary(profile_filepath):
+                print(f"✅ Frame timing saved to: {profile_filepath} "
+                      f"({self.frame_profiler.frames_discarded} animation frames left out)")
+        except Exception as e:
+            print(f"❌ Error saving frame timing: {e}")
     
     def quit_experiment(self):
         """Quit the experiment early"""
-        if self.trial_data:  # Save if there's any data
+        if self.engine and self.engine.trial_data and not self.replay_log:  # Save if there's any data
             self.save_data()
         self.win.close()
         core.quit()
@@ -1298,7 +1214,10 @@ class BART:
     def run(self):
         """Run the complete BART experiment"""
         try:
-            self.show_instructions()
+            if not self.replay_log:
+                self.show_instructions()
+            self.prepare_display()
+            self.wait_for_assets()
             self.start_new_balloon()
             self.run_trial_loop()
         except Exception as e:
@@ -1307,8 +1226,14 @@ class BART:
 
 # Main execution
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Automatic BART with top-off")
+    parser.add_argument('--replay', help="re-run a recorded BART_TopOff_actions_*.json log instead of live input")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed multiplier, also applied to the explosion and "
+                        "collection animations (default: real time)")
+    args = parser.parse_args()
     try:
-        bart = BART()
+        bart = BART(replay_path=args.replay, replay_speed=args.speed)
         bart.run()
     except Exception as e:
         print(f"Error initializing BART: {e}")
@@ -1,8 +1,53 @@
 from psychopy import visual, event, core, logging, gui
 import numpy as np
-import csv
 import random
 import os
+import sys
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tmt_layout import (poisson_disk_sample, overlapping, layout_bounds, load_layout_bank,
+                        REFERENCE_SIZE)
+from tmt_display import (TrialDisplay, item_labels, render_label_layer, build_shape, shape_pool, SHAPE_COLORS,
+                         PENDING, COMPLETED, LAST_CLICKED, WRONG)
+from tmt_input import CircleMouse, PRESS
+from trajectory_buffer import TrajectoryBuffer, segment_movement_metrics
+from background_csv import BackgroundCSVWriter
+from frame_profiler import FrameProfiler
+from tmt_agent import MouseAgent, trial_timing
+from tmt_sequences import (make_trial, trial_sequence, instruction_rows, standard_tmt_trials,
+                           ASCENDING, DESCENDING)
+
+# Vertical offset of the instruction rows under the text of trials that show the category order
+INSTRUCTION_PANEL_OFFSET = -250
+
+# Append the standard 25-item TMT-A and TMT-B after the experimental trials
+INCLUDE_STANDARD_TMT = False
+
+# Instruction panels already rendered, keyed by window, rows and placement
+instruction_panels = {}
+
+# Worker thread that prepares each trial while its instructions are shown
+trial_preparer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='TMT trial preparation')
+
+# Columns of the master file, one row per connection
+MASTER_HEADER = ['Participant_Treatment', 'Trial_Name', 'Connection', 'Reaction_Time_ms', 'Total_Time_ms',
+                 'Wrong_Guesses_Before_Correct_One', 'Timing_Uncertainty_ms', 'Direction']
+
+# Phases of a trial frame, timed by the frame profiler (F12 switches it on and off)
+FRAME_PHASES = ['escape', 'recolour', 'draw_path', 'draw_circles', 'draw_labels', 'flip', 'hit_test', 'wait']
+(PHASE_ESCAPE, PHASE_RECOLOUR, PHASE_DRAW_PATH, PHASE_DRAW_CIRCLES, PHASE_DRAW_LABELS,
+ PHASE_FLIP, PHASE_HIT_TEST, PHASE_WAIT) = range(len(FRAME_PHASES))
+
+# A flip more than this many refresh periods after the previous one counts as a dropped frame
+DROPPED_FRAME_THRESHOLD = 1.5
+
+# Columns of the frame timing file, one row per trial and phase
+FRAME_HEADER = ['Participant_Treatment', 'Trial_Name', 'Items', 'Phase', 'Frames', 'Mean_ms', 'P50_ms', 'P95_ms',
+                'P99_ms', 'Max_ms', 'Dropped_Frames']
+
+# Per-phase frame timings of the current trial, in buffers allocated once for the session
+frame_profiler = FrameProfiler(FRAME_PHASES)
 
 # Function to calculate scaling factors based on screen size
 def get_scaling_factors(win_size):
@@ -20,150 +65,138 @@ def get_scaling_factors(win_size):
 
 # Function to check overlap between circles
 def check_overlap(new_pos, existing_positions, radius):
-    for (x, y) in existing_positions:
-        if np.sqrt((new_pos[0] - x) ** 2 + (new_pos[1] - y) ** 2) < radius * 2:
-            return True
-    return False
+    """True if a circle at new_pos would overlap any circle centred at existing_positions"""
+    return bool(overlapping(new_pos, existing_positions, radius * 2)[0])
 
 # Function to generate non-overlapping positions
-def generate_positions(num_elements, circle_radius, win_size=(1024, 768), max_attempts=1000, reserve_bottom=False):
-    positions = []
-    attempts = 0
-    margin = circle_radius * 2
-    
+def generate_positions(num_elements, circle_radius, win_size=(1024, 768), max_attempts=10, reserve_bottom=False):
+    """
+    Poisson-disk sample of num_elements non-overlapping circle centres.
+    max_attempts is the number of sampling passes before giving up;
+    raises ValueError if the circles cannot all fit on the screen.
+    """
     # Reserve space at bottom if labels will be shown (scale with screen size)
-    bottom_margin = int(win_size[1] * 0.3) if reserve_bottom else margin
-    
-    while len(positions) < num_elements and attempts < max_attempts:
-        new_pos = (np.random.randint(-win_size[0]//2 + margin, win_size[0]//2 - margin), 
-                   np.random.randint(-win_size[1]//2 + bottom_margin, win_size[1]//2 - margin))
-        
-        if not check_overlap(new_pos, positions, circle_radius):
-            positions.append(new_pos)
-        attempts += 1
-    
-    if len(positions) < num_elements:
-        print(f"Warning: Could only generate {len(positions)} positions out of {num_elements}")
-    
-    return positions
-
-# Function to get shape names
-def get_shape_names(count=6):
-    shapes = ['triangle', 'square', 'pentagon', 'hexagon', 'heptagon', 'octagon']
-    return shapes[:count]
+    bounds = layout_bounds(circle_radius, win_size, reserve_bottom)
+    return poisson_disk_sample(num_elements, circle_radius * 2, bounds, max_passes=max_attempts)
 
 # Function to create a shape stimulus
-def create_shape(win, shape_name, pos, size=35, fillColor='white', lineColor='black', scale_factor=1.0):
-    """Create actual shape stimuli based on shape name with scaling and rainbow colors"""
+def create_shape(win, shape_name, pos, size=35, fillColor='white', lineColor='black', scale_factor=1.0, pool=None):
+    """
+    Shape stimulus for a shape name with scaling and rainbow colors. Vertices come from a
+    cache keyed by shape and scaled size; with a pool, a matching stimulus is reused and
+    repositioned instead of built.
+    """
     scaled_size = size * scale_factor
     scaled_line_width = max(1, int(2 * scale_factor))
     
-    # Define rainbow colors for shapes (in order of increasing sides)
-    shape_colors = {
-        'triangle': 'red',      # 3 sides
-        'square': 'orange',     # 4 sides  
-        'pentagon': 'yellow',   # 5 sides
-        'hexagon': 'green',     # 6 sides
-        'heptagon': 'blue',     # 7 sides
-        'octagon': 'indigo',    # 8 sides
-        'nonagon': 'purple',    # 9 sides (using purple for indigo)
-        'decagon': 'violet'     # 10 sides
-    }
-    
-    # Get the color for this shape, default to white if not found
-    shape_color = shape_colors.get(shape_name, fillColor)
-    
-    if shape_name == 'triangle':
-        vertices = []
-        for i in range(3):
-            angle = i * 2 * np.pi / 3 - np.pi/2  # Start from top
-            x = scaled_size * np.cos(angle)
-            y = scaled_size * np.sin(angle)
-            vertices.append([x, y])
-        return visual.ShapeStim(win, vertices=vertices, pos=pos, 
-                              fillColor=shape_color, lineColor=lineColor, lineWidth=scaled_line_width)
-    
-    elif shape_name == 'square':
-        return visual.Rect(win, width=scaled_size*1.8, height=scaled_size*1.8, pos=pos,
-                          fillColor=shape_color, lineColor=lineColor, lineWidth=scaled_line_width)
-    
-    elif shape_name in ['pentagon', 'hexagon', 'heptagon', 'octagon', 'nonagon', 'decagon']:
-        # Map shape names to number of sides
-        sides_map = {
-            'pentagon': 5, 'hexagon': 6, 'heptagon': 7, 'octagon': 8,
-            'nonagon': 9, 'decagon': 10
-        }
-        n_sides = sides_map[shape_name]
+    # Get the rainbow color for this shape, default to white if not found
+    shape_color = SHAPE_COLORS.get(shape_name, fillColor)
+    
+    if pool is not None:
+        return pool.acquire(shape_name, pos, scaled_size, shape_color, lineColor, scaled_line_width)
+    stim = build_shape(win, shape_name, scaled_size, shape_color, lineColor, scaled_line_width)
+    stim.pos = pos
+    return stim
+
+# Function to save the movement measures and trajectory of a trial
+def save_trial_movement(trajectory, connections, trial_name, sequence, positions, filename_prefix,
+                        movement_log_writer=None, trajectory_folder=None):
+    """Write per-connection movement measures and the trial's raw mouse trajectory"""
+    samples = trajectory.since(0)
+    metrics = segment_movement_metrics(samples, len(connections))
+    
+    if movement_log_writer is not None:
+        for k, connection in enumerate(connections):
+            straightness = metrics['straightness'][k]
+            movement_log_writer.writerow([filename_prefix, trial_name, connection,
+                                          round(float(metrics['path_length'][k]), 1),
+                                          round(float(metrics['pause_time'][k]) * 1000, 1),
+                                          round(float(metrics['peak_speed'][k]), 1),
+                                          '' if np.isnan(straightness) else round(float(straightness), 4),
+                                          int(metrics['sample_count'][k])])
+    
+    if trajectory_folder:
+        trajectory_filepath = os.path.join(trajectory_folder, f'{filename_prefix}_{trial_name}_Trajectory.npz')
+        try:
+            trajectory.save(trajectory_filepath, trial_name=trial_name,
+                            sequence=np.array([str(item) for item in sequence]),
+                            positions=np.asarray(positions, dtype=float),
+                            connections=np.array(connections, dtype=str), **metrics)
+        except Exception as e:
+            print(f"Error saving trajectory for {trial_name}: {e}")
+
+# Function to save the frame timings of a trial
+def save_trial_frame_times(frame_log_writer, filename_prefix, trial_name, num_elements, dropped_frames):
+    """Write the frame profiler's per-phase summary of a trial, with its dropped-frame count"""
+    if frame_log_writer is None:
+        return
+    for row in frame_profiler.summary():
+        frame_log_writer.writerow([filename_prefix, trial_name, num_elements, row['Phase'], row['Frames'],
+                                   row['Mean_ms'], row['P50_ms'], row['P95_ms'], row['P99_ms'], row['Max_ms'],
+                                   dropped_frames])
+
+# Function to prepare a trial's layout and labels away from the main thread
+def prepare_trial(win_size, spec, positions, circle_radius, stimulus_text_size, shape_size,
+                  label_text_size, scale_factor):
+    """Positions, label entries and rendered label layer of a trial; needs no window, so it can run in a worker thread"""
+    sequence = trial_sequence(spec)
+    
+    # Generate positions unless a precomputed layout was given
+    if positions is None:
+        positions = generate_positions(len(sequence), circle_radius, win_size=win_size, reserve_bottom=spec.show_order)
+    
+    # Numbers, letters and shapes are composited into one cached label layer
+    labels = item_labels(sequence, positions, stimulus_text_size, shape_size)
+    
+    # Create bottom-center labels for trials that show the category order
+    if spec.show_order:
+        # Calculate scaled positions for labels
+        label_y_1 = -win_size[1]//2 + int(120 * scale_factor)
+        label_y_2 = -win_size[1]//2 + int(80 * scale_factor)
         
-        vertices = []
-        for i in range(n_sides):
-            angle = i * 2 * np.pi / n_sides - np.pi/2  # Start from top
-            x = scaled_size * np.cos(angle)
-            y = scaled_size * np.sin(angle)
-            vertices.append([x, y])
+        # Order type label - centered at bottom in reserved space
+        labels.append({'pos': (0, label_y_1), 'text': f"Order: {spec.direction.capitalize()}",
+                       'height': label_text_size, 'color': 'red', 'bold': True})
         
-        return visual.ShapeStim(win, vertices=vertices, pos=pos,
-                              fillColor=shape_color, lineColor=lineColor, lineWidth=scaled_line_width)
+        # Category order label - centered at bottom in reserved space, on one line
+        category_text = " → ".join(spec.categories)
+        labels.append({'pos': (0, label_y_2), 'text': f"Categories: {category_text}",
+                       'height': label_text_size, 'color': 'red', 'bold': True})
     
-    else:
-        # Fallback to circle if shape not recognized
-        return visual.Circle(win, radius=scaled_size, pos=pos,
-                           fillColor=shape_color, lineColor=lineColor, lineWidth=scaled_line_width)
-# Function to create trial sequence
-def create_trial_sequence(categories, sequence_type, category_order=None):
+    return positions, labels, render_label_layer(win_size, labels)
+
+# Function to wait for the key that starts a trial while its setup finishes
+def wait_keys_while_binding(preparation, bind, wait=True):
     """
-    Creates a trial sequence based on categories and sequence type
-    categories: list of category types ['numbers', 'letters', 'shapes']
-    sequence_type: 'ascending' or 'descending'
-    category_order: order in which to cycle through categories
+    Wait for any key like event.waitKeys, calling bind with the result of the preparation
+    future on this (main) thread as soon as it is done; returns what bind returned.
+    With wait=False it only waits for the preparation.
     """
-    if 'numbers' in categories:
-        numbers = list(range(1, 7))  # 1-6
-    if 'letters' in categories:
-        letters = ['A', 'B', 'C', 'D', 'E', 'F']
-    if 'shapes' in categories:
-        shapes = get_shape_names(6)
-    
-    sequence = []
-    
-    if len(categories) == 1:
-        # Single category
-        if 'numbers' in categories:
-            sequence = numbers if sequence_type == 'ascending' else numbers[::-1]
-        elif 'letters' in categories:
-            sequence = letters if sequence_type == 'ascending' else letters[::-1]
-        elif 'shapes' in categories:
-            sequence = shapes if sequence_type == 'ascending' else shapes[::-1]
-    else:
-        # Multiple categories - create full sequence using ALL items
-        # Create lists for each category
-        category_items = {}
-        if 'numbers' in categories:
-            category_items['numbers'] = numbers if sequence_type == 'ascending' else numbers[::-1]
-        if 'letters' in categories:
-            category_items['letters'] = letters if sequence_type == 'ascending' else letters[::-1]
-        if 'shapes' in categories:
-            category_items['shapes'] = shapes if sequence_type == 'ascending' else shapes[::-1]
-        
-        # Create the full sequence by cycling through categories
-        # We need 18 items total (6 from each of the 3 categories)
-        total_items = 18
-        items_per_category = 6
-        
-        for i in range(total_items):
-            cat_index = i % len(category_order)
-            category = category_order[cat_index]
-            item_index = i // len(category_order)
-            
-            if item_index < items_per_category:
-                sequence.append(category_items[category][item_index])
-    
-    return sequence
+    if not wait:
+        return bind(preparation.result())
+    event.clearEvents(eventType='keyboard')
+    bound = None
+    while True:
+        if bound is None and preparation.done():
+            bound = bind(preparation.result())
+        if event.getKeys():
+            break
+        core.wait(0.005)
+    if bound is None:
+        bound = bind(preparation.result())
+    return bound
 
 # Function to run a single trial
-# Function to run a single trial
-def run_trial(win, trial_name, sequence, instructions_text, filename_prefix, master_log_writer, sequence_type=None, category_order=None):
-    """Run a single TMT trial with detailed error tracking"""
+def run_trial(win, spec, filename_prefix, master_log_writer, positions=None, movement_log_writer=None, trajectory_folder=None,
+              frame_log_writer=None, agent=None):
+    """
+    Run a single TMT trial (a TrialSpec) with detailed error tracking; positions come from the layout bank when given.
+    With an agent (see tmt_agent.MouseAgent) the mouse is agent.mouse(win, positions, circle_radius) instead of
+    event.Mouse, and the trial starts and ends without waiting for a key. Per-phase frame timings and dropped
+    frames go to frame_log_writer when given.
+    """
+    trial_name = spec.name
+    sequence = trial_sequence(spec)
     
     # Get scaling factors for this screen
     scale_factor = get_scaling_factors(win.size)
@@ -182,216 +215,327 @@ def run_trial(win, trial_name, sequence, instructions_text, filename_prefix, mas
     # Scale wrap width for instructions
     wrap_width = int(1200 * scale_factor)
     
+    # Set up trial parameters
+    num_elements = len(sequence)
+    
+    # Layout, labels and the label layer image are prepared in a worker thread while the
+    # instructions are on screen
+    preparation = trial_preparer.submit(
+        prepare_trial, tuple(win.size), spec, positions, circle_radius, stimulus_text_size,
+        shape_size, label_text_size, scale_factor
+    )
+    
     # Display instructions and visual together (no overlap)
-    if (('Experimental' in trial_name and len(sequence) == 18) or ('Mixed' in trial_name and len(sequence) == 18)):
+    if spec.show_order:
+        # Visual rows below the text come from a cached panel, rendered on first use
+        panel = instruction_panel(win, instruction_rows(spec), scale_factor,
+                                  y_offset=INSTRUCTION_PANEL_OFFSET * scale_factor)
         win.clearBuffer()
+        panel.draw()
         # Draw instructions text higher up
         instructions = visual.TextStim(
             win,
-            text=instructions_text,
+            text=spec.instructions,
             height=instruction_text_size,
             wrapWidth=wrap_width,
             pos=(0, 300 * scale_factor),  # Move text up
             color='white'
         )
         instructions.draw()
-        # Draw visual rows below (but do NOT flip inside the function)
-        draw_instruction_visuals(
-            win,
-            category_order,
-            sequence_type,
-            category_order,
-            scale_factor,
-            y_offset=-250 * scale_factor,  # Lower the visuals
-            do_flip=False
-        )
         win.flip()
-        keys = event.waitKeys()
     else:
         # Default for non-mixed/non-experimental
-        instructions = visual.TextStim(win, text=instructions_text, height=instruction_text_size, wrapWidth=wrap_width)
+        instructions = visual.TextStim(win, text=spec.instructions, height=instruction_text_size, wrapWidth=wrap_width)
         instructions.draw()
         win.flip()
-        keys = event.waitKeys()
     
-    # Set up trial parameters
-    num_elements = len(sequence)
+    # Circles, completed connections and labels are drawn in four batched calls. Only their
+    # GL objects are created here, on the main thread, as soon as the preparation is done
+    normal_outline_width = max(1, int(2 * scale_factor))
+    last_clicked_outline_width = max(1, int(8 * scale_factor))  # Thicker line for last clicked
     
-    # Generate positions
-    screen_size = win.size
-    will_show_labels = sequence_type and category_order and ('Experimental' in trial_name or 'Mixed' in trial_name)
-    positions = generate_positions(num_elements, circle_radius, win_size=screen_size, reserve_bottom=will_show_labels)
-    
-    # Create visual stimuli
-    stimuli = []
-    background_circles = []  # Background circles for all stimuli
-    
-    for i in range(num_elements):
-        # Create background circle with scaled radius
-        bg_circle = visual.Circle(win, radius=circle_radius, pos=positions[i], 
-                                fillColor='lightgray', lineColor='black', lineWidth=max(1, int(2 * scale_factor)))
-        background_circles.append(bg_circle)
-        
-        # Create the stimulus based on type
-        item = sequence[i]
-        
-        if isinstance(item, int):  # Number
-            stimulus = visual.TextStim(win, text=str(item), pos=positions[i], height=stimulus_text_size, color='black')
-        elif isinstance(item, str) and len(item) == 1:  # Letter
-            stimulus = visual.TextStim(win, text=item, pos=positions[i], height=stimulus_text_size, color='black')
-        else:  # Shape
-            stimulus = create_shape(win, item, positions[i], size=shape_size, fillColor='white', lineColor='black', scale_factor=1.0)
-        
-        stimuli.append(stimulus)
+    def bind_display(prepared):
+        positions, labels, label_image = prepared
+        return TrialDisplay(win, positions, labels, circle_radius, normal_outline_width,
+                            last_clicked_outline_width, line_width, label_image=label_image)
     
-    # Create bottom-center labels for experimental trials AND familiarization mixed trials
-    corner_labels = []
-    if sequence_type and category_order and ('Experimental' in trial_name or 'Mixed' in trial_name):
-        # Calculate scaled positions for labels
-        label_y_1 = -win.size[1]//2 + int(120 * scale_factor)
-        label_y_2 = -win.size[1]//2 + int(80 * scale_factor)
-        
-        # Order type label - centered at bottom in reserved space
-        order_label = visual.TextStim(win, 
-                                    text=f"Order: {sequence_type.capitalize()}", 
-                                    pos=(0, label_y_1),  # In reserved bottom area
-                                    height=label_text_size, color='red', bold=True,
-                                    anchorHoriz='center')
-        
-        # Category order label - centered at bottom in reserved space - FORCE ONE LINE
-        category_text = " → ".join(category_order)
-        category_label = visual.TextStim(win, 
-                                    text=f"Categories: {category_text}", 
-                                    pos=(0, label_y_2),  # In reserved bottom area
-                                    height=label_text_size, color='red', bold=True,
-                                    anchorHoriz='center',
-                                    wrapWidth=win.size[0])  # Set wrap width to full screen width
-        
-        corner_labels = [order_label, category_label]
-        print(f"Created {len(corner_labels)} labels")  # Debug print
+    display = wait_keys_while_binding(preparation, bind_display, wait=agent is None)
+    positions = display.positions
     
     # Trial execution
     responses = []
-    mouse = event.Mouse(win=win)
-    clock = core.Clock()
-    trial_start_time = core.Clock()
-    line_stimuli = []
+    mouse = event.Mouse(win=win) if agent is None else agent.mouse(win, positions, circle_radius)
+    circle_mouse = CircleMouse(mouse, positions, circle_radius)
+    # Cursor samples for the whole trial, one per frame; each sample's value is the connection in progress
+    trajectory = TrajectoryBuffer(capacity=2 ** 18)
+    connections = []
+    trial_start = None  # flip that first showed the trial
+    last_press_time = None
     total_errors = 0
     
     # Track errors per connection
     wrong_guesses_this_connection = 0
     previous_wrong_circles = set()  # Track which circles were clicked wrong this connection
     
+    # Frame timing: phases go to the profiler's preallocated buffer, late flips are counted
+    profiler = frame_profiler
+    profiler.reset()
+    dropped_frame_interval = DROPPED_FRAME_THRESHOLD * win.monitorFramePeriod
+    previous_flip = None
+    dropped_frames = 0
+    
     # Main trial loop
     for target_index in range(num_elements):
         found_target = False
-        clock.reset()  # Reset for this connection
+        circle_mouse.reset()
+        # The connection starts with the flip that first shows its state (set after the flip below)
+        connection_start = None
+        start_uncertainty = 0.0
         wrong_guesses_this_connection = 0
+        for i in previous_wrong_circles:
+            if display.states[i] == WRONG:  # completed and last-clicked circles keep their colour
+                display.set_state(i, PENDING)
         previous_wrong_circles.clear()
         
         while not found_target:
+            profiler.start_frame()
+            
             # CHECK FOR ESCAPE KEY DURING TRIAL
-            keys = event.getKeys(keyList=['escape'])
-            if keys:
+            keys = event.getKeys(keyList=['escape', 'f12'])
+            if 'escape' in keys:
                 print(f"Escape pressed during {trial_name}, skipping to next trial")
+                save_trial_movement(trajectory, connections, trial_name, sequence, positions, filename_prefix,
+                                    movement_log_writer, trajectory_folder)
+                save_trial_frame_times(frame_log_writer, filename_prefix, trial_name, num_elements, dropped_frames)
                 return False  # Skip to next trial
+            if 'f12' in keys:
+                print(f"Frame profiler {'enabled' if profiler.toggle() else 'disabled'}")
+            profiler.mark(PHASE_ESCAPE)
             
-            # DRAW LINES FIRST (so they appear underneath)
-            for line in line_stimuli:
-                line.draw()
+            # Draw connections and circles (colors only change on state transitions) and labels
+            display.update()
+            profiler.mark(PHASE_RECOLOUR)
+            display.draw_path()
+            profiler.mark(PHASE_DRAW_PATH)
+            display.draw_circles()
+            profiler.mark(PHASE_DRAW_CIRCLES)
+            display.draw_labels()
+            profiler.mark(PHASE_DRAW_LABELS)
+            flip_requested = core.getTime()
+            flip_time = win.flip()
+            profiler.mark(PHASE_FLIP)
+            if previous_flip is not None and flip_time - previous_flip > dropped_frame_interval:
+                dropped_frames += 1
+            previous_flip = flip_time
+            if connection_start is None:
+                # The buffer swap happened somewhere between the flip call and its return
+                connection_start = flip_time
+                start_uncertainty = flip_time - flip_requested
+                if trial_start is None:
+                    trial_start = flip_time
             
-            # Then draw background circles with appropriate colors
-            for i, bg_circle in enumerate(background_circles):
-                if i < len(responses):
-                    if i == responses[-1]:  # Last successfully clicked
-                        bg_circle.fillColor = 'lightgreen'  # Already completed
-                        bg_circle.lineColor = 'yellowgreen'
-                        bg_circle.lineWidth = max(1, int(8 * scale_factor))  # Thicker line for last clicked
+            # Press events on the circles (hit testing only runs when the mouse moved).
+            # Presses are edge-triggered, so holding the button never repeats a click
+            # and the display keeps updating until it is released. They are handled
+            # after the flip, so every connection starts from a frame that was shown.
+            for event_type, i, press_time in circle_mouse.poll():
+                if event_type == PRESS and i == target_index:  # Click on correct target
+                    # Record the connection, from the start flip to the button-down event
+                    reaction_time = (press_time - connection_start) * 1000
+                    total_time = (press_time - trial_start) * 1000
+                    timing_uncertainty = (start_uncertainty + circle_mouse.press_uncertainty) * 1000
+                    last_press_time = press_time
+                    
+                    if len(responses) > 0:
+                        connection = f"{sequence[responses[-1]]}-{sequence[i]}"
                     else:
-                        bg_circle.fillColor = 'lightgreen'  # Already completed
-                        bg_circle.lineColor = 'black'
-                        bg_circle.lineWidth = max(1, int(2 * scale_factor))  # Normal line for completed
-                elif i in previous_wrong_circles:
-                    bg_circle.fillColor = 'lightcoral'  # Previously clicked wrong this connection
-                else:
-                    bg_circle.fillColor = 'lightgray'
-                bg_circle.draw()
-            
-            # Then draw all stimuli on top
-            for stimulus in stimuli:
-                stimulus.draw()
-            
-            # Draw corner labels LAST (so they appear on top of everything)
-            for label in corner_labels:
-                label.draw()
-            
-            # Check mouse position and clicks
-            mouse_pos = mouse.getPos()
-            mouse_clicked = mouse.getPressed()[0]  # Left mouse button
+                        connection = f"Start-{sequence[i]}"
+                    # Extend the connecting line (drawn underneath the circles)
+                    display.add_to_path(i)
+                    
+                    # Completed circles turn green; the last one clicked gets a thicker outline
+                    if responses:
+                        display.set_state(responses[-1], COMPLETED)
+                    display.set_state(i, LAST_CLICKED)
+                    
+                    # Log only to master file
+                    master_log_writer.writerow([filename_prefix, trial_name, connection, 
+                                              reaction_time, total_time, wrong_guesses_this_connection,
+                                              round(timing_uncertainty, 3), spec.direction])
+                    
+                    responses.append(i)
+                    connections.append(connection)
+                    found_target = True
+                    break
+                
+                elif event_type == PRESS and i not in previous_wrong_circles:  # Click on wrong target
+                    if i > target_index:  # Completed circles stay green
+                        display.set_state(i, WRONG)
+                    wrong_guesses_this_connection += 1
+                    total_errors += 1
+                    previous_wrong_circles.add(i)
             
-            current_hover = None
-            for i, bg_circle in enumerate(background_circles):
-                if bg_circle.contains(mouse_pos):
-                    current_hover = i
-                    if i == target_index:  # Correct target
-                        bg_circle.fillColor = 'yellow'
-                        
-                        # Check for click on correct target
-                        if mouse_clicked:
-                            # Record the connection
-                            reaction_time = clock.getTime() * 1000
-                            total_time = trial_start_time.getTime() * 1000
-                            
-                            if len(responses) > 0:
-                                connection = f"{sequence[responses[-1]]}-{sequence[i]}"
-                                # Draw line UNDERNEATH (will be drawn first in next iteration)
-                                line_stimuli.append(visual.Line(win, 
-                                                              start=positions[responses[-1]], 
-                                                              end=positions[i], 
-                                                              color='red', lineWidth=line_width))
-                            else:
-                                connection = f"Start-{sequence[i]}"
-                            
-                            # Log only to master file
-                            master_log_writer.writerow([filename_prefix, trial_name, connection, 
-                                                      reaction_time, total_time, wrong_guesses_this_connection])
-                            
-                            responses.append(i)
-                            found_target = True
-                            
-                            # Wait for mouse release to prevent double-clicks
-                            while mouse.getPressed()[0]:
-                                core.wait(0.01)
-                            break
-                    else:  # Wrong target
-                        if i not in previous_wrong_circles:
-                            bg_circle.fillColor = 'orange'  # Hovering over wrong target
-                        
-                        # Check for click on wrong target
-                        if mouse_clicked and i not in previous_wrong_circles:
-                            bg_circle.fillColor = 'lightcoral'
-                            wrong_guesses_this_connection += 1
-                            total_errors += 1
-                            previous_wrong_circles.add(i)
-                            
-                            # Wait for mouse release
-                            while mouse.getPressed()[0]:
-                                core.wait(0.01)
+            # One cursor sample per frame, as read by the poll after the flip dispatched the input events
+            trajectory.append(circle_mouse.poll_time, circle_mouse.pos[0], circle_mouse.pos[1], len(responses),
+                              circle_mouse.button_down)
+            profiler.mark(PHASE_HIT_TEST)
             
-            win.flip()
-            core.wait(0.01)  # Small delay to prevent excessive CPU usage
+            # Small delay to prevent excessive CPU usage
+            core.wait(0.01)
+            profiler.mark(PHASE_WAIT)
+            profiler.end_frame()
+    
+    # Movement measures and frame timings are summarized once the trial is over
+    save_trial_movement(trajectory, connections, trial_name, sequence, positions, filename_prefix,
+                        movement_log_writer, trajectory_folder)
+    save_trial_frame_times(frame_log_writer, filename_prefix, trial_name, num_elements, dropped_frames)
+    if agent is not None:
+        agent.circle_states = display.states.copy()
     
     # Trial completion feedback with scaled text
-    completion_time = trial_start_time.getTime()
+    completion_time = last_press_time - trial_start
     feedback_text = f'Trial Complete!\n\nTotal Time: {completion_time:.2f} seconds\nTotal Errors: {total_errors}\n\nPress any key to continue.'
     feedback = visual.TextStim(win, text=feedback_text, height=feedback_text_size)
     feedback.draw()
     win.flip()
-    event.waitKeys()
+    if agent is None:
+        event.waitKeys()
     
     return True
 
-# Main experiment function
+# Function to define the session's trials
+def build_trials():
+    """TrialSpecs of a session in running order: familiarization, then randomized experimental trials"""
+    trials = []
+    
+    # Familiarization Trials
+    # Familiarization Trials
+    trials.extend([
+        # Numbers
+        make_trial('Familiarization_Numbers_Asc', ['numbers'], ASCENDING,
+         'Familiarization Trial: Numbers Ascending\n\nClick the numbers from 1 to 6 in ascending order.\n\nClick each number in sequence: 1 → 2 → 3 → 4 → 5 → 6\n\nPress any key to start.',
+         layout_group='Familiarization_Numbers'),
+        make_trial('Familiarization_Numbers_Desc', ['numbers'], DESCENDING,
+         'Familiarization Trial: Numbers Descending\n\nClick the numbers from 6 to 1 in descending order.\n\nClick each number in sequence: 6 → 5 → 4 → 3 → 2 → 1\n\nPress any key to start.',
+         layout_group='Familiarization_Numbers'),
+        
+        # Letters
+        make_trial('Familiarization_Letters_Asc', ['letters'], ASCENDING,
+         'Familiarization Trial: Letters Ascending\n\nClick the letters from A to F in ascending order.\n\nClick each letter in sequence: A → B → C → D → E → F\n\nPress any key to start.',
+         layout_group='Familiarization_Letters'),
+        make_trial('Familiarization_Letters_Desc', ['letters'], DESCENDING,
+         'Familiarization Trial: Letters Descending\n\nClick the letters from F to A in descending order.\n\nClick each letter in sequence: F → E → D → C → B → A\n\nPress any key to start.',
+         layout_group='Familiarization_Letters'),
+        
+        # Shapes
+        make_trial('Familiarization_Shapes_Asc', ['shapes'], ASCENDING,
+         'Familiarization Trial: Shapes Ascending\n\nClick the shapes from triangle to octagon\n(by increasing number of sides).\n\nSequence: triangle → square → pentagon → hexagon → heptagon → octagon\n\nFor your convenience, shapes are also colored in rainbow color order (Red → Orange → Yellow → Green → Blue → Indigo)\n\nPress any key to start.',
+         layout_group='Familiarization_Shapes'),
+        make_trial('Familiarization_Shapes_Desc', ['shapes'], DESCENDING,
+         'Familiarization Trial: Shapes Descending\n\nClick the shapes from octagon to triangle\n(by decreasing number of sides).\n\nSequence: octagon → heptagon → hexagon → pentagon → square → triangle\n\nPress any key to start.',
+         layout_group='Familiarization_Shapes'),
+        
+        # Mixed ascending
+        make_trial('Familiarization_Mixed_Asc', ['numbers', 'shapes', 'letters'], ASCENDING,
+         'Familiarization Trial: Mixed Ascending\n\nAlternate between numbers, shapes, and letters in ascending order.\n\nSequence: 1 → triangle → A → 2 → square → B → 3 → pentagon → C → 4 → hexagon → D → 5 → heptagon → E → 6 → octagon → F\n\nPress any key to start.',
+         layout_group='Familiarization_Mixed'),
+        
+        # Mixed descending  
+        make_trial('Familiarization_Mixed_Desc', ['numbers', 'shapes', 'letters'], DESCENDING,
+         'Familiarization Trial: Mixed Descending\n\nAlternate between numbers, shapes, and letters in descending order.\n\nSequence: 6 → octagon → F → 5 → heptagon → E → 4 → hexagon → D → 3 → pentagon → C → 2 → square → B → 1 → triangle → A\n\nPress any key to start.',
+         layout_group='Familiarization_Mixed')
+    ])
+    # Experimental Trials
+    # Experimental Trials - 3 ascending, 3 descending, alternating
+    ascending_conditions = [
+        (ASCENDING, ['numbers', 'shapes', 'letters']),
+        (ASCENDING, ['shapes', 'letters', 'numbers']),
+        (ASCENDING, ['letters', 'numbers', 'shapes'])
+    ]
+    
+    descending_conditions = [
+        (DESCENDING, ['numbers', 'shapes', 'letters']),
+        (DESCENDING, ['shapes', 'letters', 'numbers']),
+        (DESCENDING, ['letters', 'numbers', 'shapes'])
+    ]
+    
+    # Randomize within each direction type
+    random.shuffle(ascending_conditions)
+    random.shuffle(descending_conditions)
+    
+    # Randomly decide whether to start with ascending or descending
+    start_with_ascending = random.choice([True, False])
+    
+    # Alternate between ascending and descending
+    for i in range(3):
+        if start_with_ascending:
+            # Add ascending trial
+            direction, category_order = ascending_conditions[i]
+            trial_name = f'Experimental_Ascending_{i+1}'
+            category_str = ' → '.join(category_order)
+            instructions = f'Experimental Trial - Ascending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
+            trials.append(make_trial(trial_name, category_order, direction, instructions,
+                                     layout_group=f'Experimental_{i+1}'))
+            
+            # Add descending trial
+            direction, category_order = descending_conditions[i]
+            trial_name = f'Experimental_Descending_{i+1}'
+            category_str = ' → '.join(category_order)
+            instructions = f'Experimental Trial - Descending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
+            trials.append(make_trial(trial_name, category_order, direction, instructions,
+                                     layout_group=f'Experimental_{i+1}'))
+        else:
+            # Add descending trial
+            direction, category_order = descending_conditions[i]
+            trial_name = f'Experimental_Descending_{i+1}'
+            category_str = ' → '.join(category_order)
+            instructions = f'Experimental Trial - Descending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
+            trials.append(make_trial(trial_name, category_order, direction, instructions,
+                                     layout_group=f'Experimental_{i+1}'))
+            
+            # Add ascending trial
+            direction, category_order = ascending_conditions[i]
+            trial_name = f'Experimental_Ascending_{i+1}'
+            category_str = ' → '.join(category_order)
+            instructions = f'Experimental Trial - Ascending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
+            trials.append(make_trial(trial_name, category_order, direction, instructions,
+                                     layout_group=f'Experimental_{i+1}'))
+    
+    
+    # Standard 25-item TMT-A and TMT-B
+    if INCLUDE_STANDARD_TMT:
+        trials.extend(standard_tmt_trials())
+    
+    return trials
+
+# Function to pick the layout of each trial
+def trial_layouts(trials, win_size, rng=None):
+    """
+    Circle positions in pix for each trial. Layouts come from the precomputed bank (built
+    beforehand with tmt_layout.py): the trials of a layout group get two different layouts
+    matched on path length, target distance and crossings. Trials whose item count the bank lacks get None,
+    so run_trial places their circles at random.
+    """
+    layout_bank = load_layout_bank(rng=rng)
+    configs = sorted({(len(trial_sequence(spec)), bool(spec.show_order)) for spec in trials})
+    missing = [config for config in configs if not layout_bank.has(*config)]
+    if missing:
+        items = ' '.join(f"{num_elements}{'r' if reserve_bottom else ''}" for num_elements, reserve_bottom in missing)
+        print(f"Warning: the TMT layout bank has no layouts for {items} items; those trials use random "
+              f"layouts of unmatched difficulty. Build it with: python tmt_layout.py --items {items}")
+    layout_scale = min(win_size[0] / REFERENCE_SIZE[0], win_size[1] / REFERENCE_SIZE[1])
+    group_layouts = {}
+    layouts = []
+    for spec in trials:
+        num_elements = len(trial_sequence(spec))
+        if not layout_bank.has(num_elements, spec.show_order):
+            layouts.append(None)
+            continue
+        if spec.layout_group not in group_layouts:
+            group_layouts[spec.layout_group] = list(layout_bank.matched_pair(num_elements, spec.show_order))
+        layouts.append(group_layouts[spec.layout_group].pop(0) * layout_scale)
+    return layouts
+
 # Main experiment function
 def run_experiment():
     # Get participant information
@@ -407,6 +551,8 @@ def run_experiment():
     data_folder = "Trailmaking Data"
     if not os.path.exists(data_folder):
         os.makedirs(data_folder)
+    trajectory_folder = os.path.join(data_folder, "Trajectories")
+    os.makedirs(trajectory_folder, exist_ok=True)
 
     # Create master CSV file with treatment inside the subfolder
     if treatment:
@@ -415,6 +561,8 @@ def run_experiment():
     else:
         master_filename = os.path.join(data_folder, f'{participant_id}_TMT_Master.csv')
         filename_prefix = participant_id
+    movement_filename = os.path.join(data_folder, f'{filename_prefix}_TMT_Movement.csv')
+    frame_filename = os.path.join(data_folder, f'{filename_prefix}_TMT_FrameTimes.csv')
     
     # Set up PsychoPy window with proper close handling
     win = visual.Window(fullscr=True, monitor='testMonitor', color='black',units='pix', allowGUI=True)
@@ -425,10 +573,15 @@ def run_experiment():
     welcome_wrap_width = int(800 * scale_factor)
     
     try:
-        with open(master_filename, mode='w', newline='') as master_csvfile:
-            master_log_writer = csv.writer(master_csvfile)
-            master_log_writer.writerow(['Participant_Treatment', 'Trial_Name', 'Connection', 
-                          'Reaction_Time_ms', 'Total_Time_ms', 'Wrong_Guesses_Before_Correct_One'])
+        # Rows are queued during trials and written by background threads; each file gets a
+        # trailer row only if the session runs to the end without an error
+        with BackgroundCSVWriter(master_filename, header=MASTER_HEADER) as master_log_writer, \
+                BackgroundCSVWriter(movement_filename, header=['Participant_Treatment', 'Trial_Name', 'Connection',
+                          'Path_Length_px', 'Pause_Time_ms', 'Peak_Velocity_px_s', 'Straightness',
+                          'Samples']) as movement_log_writer, \
+                BackgroundCSVWriter(frame_filename, header=FRAME_HEADER) as frame_log_writer:
+            # Cursor movement of each connection, joined to the master file on trial and connection;
+            # frame timings of each trial and loop phase
             
             # Welcome message with scaled text
             welcome = visual.TextStim(win, 
@@ -436,108 +589,34 @@ def run_experiment():
                                     height=welcome_text_size, wrapWidth=welcome_wrap_width)
             welcome.draw()
             win.flip()
-            event.waitKeys()
             
             # Define all trials
-            trials = []
-            
-            # Familiarization Trials
-            # Familiarization Trials
-            trials.extend([
-                # Numbers
-                ('Familiarization_Numbers_Asc', ['numbers'], 'ascending', 
-                 'Familiarization Trial: Numbers Ascending\n\nClick the numbers from 1 to 6 in ascending order.\n\nClick each number in sequence: 1 → 2 → 3 → 4 → 5 → 6\n\nPress any key to start.'),
-                ('Familiarization_Numbers_Desc', ['numbers'], 'descending',
-                 'Familiarization Trial: Numbers Descending\n\nClick the numbers from 6 to 1 in descending order.\n\nClick each number in sequence: 6 → 5 → 4 → 3 → 2 → 1\n\nPress any key to start.'),
-                
-                # Letters
-                ('Familiarization_Letters_Asc', ['letters'], 'ascending',
-                 'Familiarization Trial: Letters Ascending\n\nClick the letters from A to F in ascending order.\n\nClick each letter in sequence: A → B → C → D → E → F\n\nPress any key to start.'),
-                ('Familiarization_Letters_Desc', ['letters'], 'descending',
-                 'Familiarization Trial: Letters Descending\n\nClick the letters from F to A in descending order.\n\nClick each letter in sequence: F → E → D → C → B → A\n\nPress any key to start.'),
-                
-                # Shapes
-                ('Familiarization_Shapes_Asc', ['shapes'], 'ascending',
-                 'Familiarization Trial: Shapes Ascending\n\nClick the shapes from triangle to octagon\n(by increasing number of sides).\n\nSequence: triangle → square → pentagon → hexagon → heptagon → octagon\n\nFor your convenience, shapes are also colored in rainbow color order (Red → Orange → Yellow → Green → Blue → Indigo)\n\nPress any key to start.'),
-                ('Familiarization_Shapes_Desc', ['shapes'], 'descending',
-                 'Familiarization Trial: Shapes Descending\n\nClick the shapes from octagon to triangle\n(by decreasing number of sides).\n\nSequence: octagon → heptagon → hexagon → pentagon → square → triangle\n\nPress any key to start.'),
-                
-                # Mixed ascending
-                ('Familiarization_Mixed_Asc', ['numbers', 'shapes', 'letters'], 'ascending',
-                 'Familiarization Trial: Mixed Ascending\n\nAlternate between numbers, shapes, and letters in ascending order.\n\nSequence: 1 → triangle → A → 2 → square → B → 3 → pentagon → C → 4 → hexagon → D → 5 → heptagon → E → 6 → octagon → F\n\nPress any key to start.'),
-                
-                # Mixed descending  
-                ('Familiarization_Mixed_Desc', ['numbers', 'shapes', 'letters'], 'descending',
-                 'Familiarization Trial: Mixed Descending\n\nAlternate between numbers, shapes, and letters in descending order.\n\nSequence: 6 → octagon → F → 5 → heptagon → E → 4 → hexagon → D → 3 → pentagon → C → 2 → square → B → 1 → triangle → A\n\nPress any key to start.')
-            ])
-            # Experimental Trials
-# Experimental Trials - 3 ascending, 3 descending, alternating
-            ascending_conditions = [
-                ('ascending', ['numbers', 'shapes', 'letters']),
-                ('ascending', ['shapes', 'letters', 'numbers']),
-                ('ascending', ['letters', 'numbers', 'shapes'])
-            ]
-            
-            descending_conditions = [
-                ('descending', ['numbers', 'shapes', 'letters']),
-                ('descending', ['shapes', 'letters', 'numbers']),
-                ('descending', ['letters', 'numbers', 'shapes'])
-            ]
+            trials = build_trials()
             
-            # Randomize within each direction type
-            random.shuffle(ascending_conditions)
-            random.shuffle(descending_conditions)
-            
-            # Randomly decide whether to start with ascending or descending
-            start_with_ascending = random.choice([True, False])
-            
-            # Alternate between ascending and descending
-            for i in range(3):
-                if start_with_ascending:
-                    # Add ascending trial
-                    direction, category_order = ascending_conditions[i]
-                    trial_name = f'Experimental_Ascending_{i+1}'
-                    category_str = ' → '.join(category_order)
-                    instructions = f'Experimental Trial - Ascending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
-                    trials.append((trial_name, category_order, direction, instructions))
-                    
-                    # Add descending trial
-                    direction, category_order = descending_conditions[i]
-                    trial_name = f'Experimental_Descending_{i+1}'
-                    category_str = ' → '.join(category_order)
-                    instructions = f'Experimental Trial - Descending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
-                    trials.append((trial_name, category_order, direction, instructions))
-                else:
-                    # Add descending trial
-                    direction, category_order = descending_conditions[i]
-                    trial_name = f'Experimental_Descending_{i+1}'
-                    category_str = ' → '.join(category_order)
-                    instructions = f'Experimental Trial - Descending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
-                    trials.append((trial_name, category_order, direction, instructions))
-                    
-                    # Add ascending trial
-                    direction, category_order = ascending_conditions[i]
-                    trial_name = f'Experimental_Ascending_{i+1}'
-                    category_str = ' → '.join(category_order)
-                    instructions = f'Experimental Trial - Ascending {i+1}\n\nCategory order: {category_str}\n\nPress any key to start.'
-                    trials.append((trial_name, category_order, direction, instructions))
+            # Build every sequence, load the layouts and render the instruction panels while the
+            # welcome message is up, then wait for the participant
+            for spec in trials:
+                trial_sequence(spec)
+            layouts = trial_layouts(trials, win.size)
+            prepare_instruction_panels(win, trials, scale_factor)
+            event.waitKeys()
             
             # Run all trials
-            for trial_info in trials:
-                trial_name, categories, sequence_type, instructions_text = trial_info
+            for spec, positions in zip(trials, layouts):
+                trial_name = spec.name
+                sequence = trial_sequence(spec)
                 
-                # Create sequence for this trial
-                sequence = create_trial_sequence(categories, sequence_type, categories if len(categories) > 1 else None)
+                # Get earlier trials' rows onto the disk now, outside any timed loop
+                master_log_writer.sync()
+                movement_log_writer.sync()
+                frame_log_writer.sync()
                 
                 print(f"Running {trial_name}: {len(sequence)} items")
                 
-                # Run trial with labels for experimental trials AND mixed familiarization trials
-                if 'Experimental' in trial_name or 'Mixed' in trial_name:
-                    if not run_trial(win, trial_name, sequence, instructions_text, filename_prefix, master_log_writer, sequence_type, categories):
-                        continue  # Skip to next trial if escape pressed
-                else:
-                    if not run_trial(win, trial_name, sequence, instructions_text, filename_prefix, master_log_writer):
-                        continue  # Skip to next trial if escape pressed
+                # Order/category labels and instruction rows are shown when the trial's spec asks for them
+                if not run_trial(win, spec, filename_prefix, master_log_writer, positions,
+                                 movement_log_writer, trajectory_folder, frame_log_writer):
+                    continue  # Skip to next trial if escape pressed
                 
                 print(f"Completed {trial_name}")
             
@@ -560,50 +639,184 @@ def run_experiment():
         core.quit()
 
 
-def draw_instruction_visuals(win, categories, sequence_type, category_order=None, scale_factor=1.0, y_offset=0, do_flip=True):
-    """Draws a horizontal row of dots for each category in the order, with their labels."""
+# Function to run every trial with a synthetic participant
+def run_headless(error_rate=0.05, speed=1.0, seed=None, win_size=(1920, 1080), max_frame_ms=None,
+                 max_rt_error_ms=None):
+    """
+    Run the session's trials with a synthetic mouse agent in a hidden window and report frame time,
+    hit-test latency and logged-RT error per trial. Returns False if the log does not match what the
+    agent did or a limit is exceeded. Without a GPU, run it on a virtual display with software
+    OpenGL (e.g. xvfb-run with Mesa).
+    """
+    random.seed(seed)
+    agent = MouseAgent(error_rate=error_rate, speed=speed, seed=seed)
+    
+    # Benchmark files are kept out of the participant data
+    data_folder = os.path.join("Trailmaking Data", "Benchmark")
+    os.makedirs(data_folder, exist_ok=True)
+    filename_prefix = f"Agent_{time.strftime('%Y%m%d_%H%M%S')}"
+    master_filename = os.path.join(data_folder, f'{filename_prefix}_TMT_Master.csv')
+    report_filename = os.path.join(data_folder, f'{filename_prefix}_TMT_Benchmark.csv')
+    frame_filename = os.path.join(data_folder, f'{filename_prefix}_TMT_FrameTimes.csv')
+    
+    # Frames are not held to the refresh, so frame times show the work done per frame
+    win = visual.Window(size=win_size, fullscr=False, color='black', units='pix', allowGUI=False,
+                        waitBlanking=False)
+    try:
+        win.winHandle.set_visible(False)
+    except Exception:
+        pass
+    
+    # Timestamp of every flip, for frame times
+    flip_times = []
+    window_flip = win.flip
+    def timed_flip(*args, **kwargs):
+        flip_time = window_flip(*args, **kwargs)
+        flip_times.append(flip_time)
+        return flip_time
+    win.flip = timed_flip
+    
+    trials = build_trials()
+    prepare_instruction_panels(win, trials, get_scaling_factors(win.size))
+    layouts = trial_layouts(trials, win.size, rng=np.random.default_rng(seed))
+    
+    runs = []
+    try:
+        with BackgroundCSVWriter(master_filename, header=MASTER_HEADER) as master_log_writer, \
+                BackgroundCSVWriter(frame_filename, header=FRAME_HEADER) as frame_log_writer:
+            for spec, positions in zip(trials, layouts):
+                del flip_times[:]
+                run_trial(win, spec, filename_prefix, master_log_writer, positions,
+                          frame_log_writer=frame_log_writer, agent=agent)
+                runs.append((spec.name, agent.current, list(flip_times), agent.circle_states))
+    finally:
+        win.close()
+    
+    # What each trial logged, read back from the file
+    logged = {}
+    with open(master_filename, newline='') as f:
+        for row in csv.DictReader(line for line in f if not line.startswith('#')):
+            logged.setdefault(row['Trial_Name'], []).append(row)
+    
+    passed = True
+    report = []
+    for trial_name, mouse, trial_flips, circle_states in runs:
+        rows = logged.get(trial_name, [])
+        timing = trial_timing(mouse, trial_flips, [float(row['Total_Time_ms']) for row in rows],
+                              sum(int(row['Wrong_Guesses_Before_Correct_One']) for row in rows))
+        problems = []
+        if timing['clicks_logged'] != timing['clicks_made']:
+            problems.append('clicks')
+        if timing['errors_logged'] != timing['errors_made']:
+            problems.append('errors')
+        # Every circle ends green, the last one clicked with its thick outline, whatever was clicked wrong
+        if (list(circle_states[:-1]) != [COMPLETED] * (len(circle_states) - 1)
+                or circle_states[-1] != LAST_CLICKED):
+            problems.append('colours')
+        if max_frame_ms is not None and timing['frame_p95_ms'] > max_frame_ms:
+            problems.append('frame time')
+        if max_rt_error_ms is not None and timing['rt_error_max_ms'] > max_rt_error_ms:
+            problems.append('RT error')
+        passed = passed and not problems
+        report.append(dict(trial=trial_name, **timing, problems=' '.join(problems)))
+    
+    with open(report_filename, mode='w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(report[0]))
+        writer.writeheader()
+        writer.writerows(report)
+    
+    for result in report:
+        print(f"{result['trial']:32} frames {result['frames']:5}  frame mean/p95/max "
+              f"{result['frame_mean_ms']:.2f}/{result['frame_p95_ms']:.2f}/{result['frame_max_ms']:.2f} ms  "
+              f"hit test mean/max {result['hit_test_mean_ms']:.2f}/{result['hit_test_max_ms']:.2f} ms  "
+              f"RT error max {result['rt_error_max_ms']:.3f} ms  errors {result['errors_logged']}"
+              f"{'  FAILED: ' + result['problems'] if result['problems'] else ''}")
+    print(f"Benchmark saved to: {report_filename}, frame timing to: {frame_filename}")
+    print("✅ Benchmark passed" if passed else "❌ Benchmark failed")
+    return passed
+
+
+def draw_instruction_visuals(win, rows, scale_factor=1.0, y_offset=0, do_flip=True):
+    """
+    Draws a horizontal row of dots for each (category, items) row, with their labels;
+    returns their (top, bottom) y in pix. Long rows are spaced closer to fit the window.
+    """
     y_start = (200 + y_offset) * scale_factor  # vertical offset for first row
     row_gap = 80 * scale_factor
-    dot_radius = 25 * scale_factor
     text_height = 32 * scale_factor
-    shape_size = 22 * scale_factor
-
-    # Prepare items for each category
-    items = {}
-    if 'numbers' in categories:
-        items['numbers'] = list(range(1, 7)) if sequence_type == 'ascending' else list(range(6, 0, -1))
-    if 'letters' in categories:
-        letters = ['A', 'B', 'C', 'D', 'E', 'F']
-        items['letters'] = letters if sequence_type == 'ascending' else letters[::-1]
-    if 'shapes' in categories:
-        shapes = get_shape_names(6)
-        items['shapes'] = shapes if sequence_type == 'ascending' else shapes[::-1]
-
-    # Determine order to display rows
-    if category_order:
-        display_order = category_order
-    else:
-        display_order = [cat for cat in ['numbers', 'letters', 'shapes'] if cat in categories]
-
+    
+    # Shapes from earlier screens are repositioned rather than rebuilt
+    pool = shape_pool(win)
+    pool.release_all()
+    
     # Do NOT clearBuffer or flip here!
-    for idx, cat in enumerate(display_order):
+    for idx, (cat, items) in enumerate(rows):
         y = y_start - idx * row_gap
-        x_start = -180 * scale_factor
-        for i, val in enumerate(items[cat]):
-            x = x_start + i * 65 * scale_factor
+        spacing = min(65 * scale_factor, 0.7 * win.size[0] / max(len(items), 1))
+        dot_radius = min(25 * scale_factor, 0.4 * spacing)
+        shape_size = min(22 * scale_factor, 0.35 * spacing)
+        # Rows are centred where the original six-item rows were
+        x_start = -17.5 * scale_factor - (len(items) - 1) * spacing / 2
+        for i, val in enumerate(items):
+            x = x_start + i * spacing
             if cat == 'shapes':
-                stim = create_shape(win, val, (x, y), size=shape_size, fillColor='white', lineColor='black', scale_factor=1.0)
+                stim = create_shape(win, val, (x, y), size=shape_size, fillColor='white', lineColor='black', scale_factor=1.0, pool=pool)
                 stim.draw()
             else:
                 stim = visual.Circle(win, radius=dot_radius, pos=(x, y), fillColor='white', lineColor='black')
                 stim.draw()
-                label = visual.TextStim(win, text=str(val), pos=(x, y), height=text_height, color='black')
+                label = visual.TextStim(win, text=str(val), pos=(x, y), height=min(text_height, dot_radius * 1.3), color='black')
                 label.draw()
         # Draw category label at left
         cat_label = visual.TextStim(win, text=cat.capitalize(), pos=(x_start - 120 * scale_factor, y), height=text_height, color='red', bold=True)
         cat_label.draw()
     if do_flip:
         win.flip()
+    margin = 40 * scale_factor  # dot radius and half the text height, with a little room
+    return y_start + margin, y_start - (len(rows) - 1) * row_gap - margin
+
+# Function to get the pre-rendered instruction panel for a trial's rows
+def instruction_panel(win, rows, scale_factor=1.0, y_offset=0):
+    """
+    The rows of draw_instruction_visuals rendered once into a BufferImageStim and reused on
+    every later showing. Rendering goes through the back buffer, so call this before drawing
+    anything else for the screen.
+    """
+    key = (win, rows, scale_factor, y_offset)
+    panel = instruction_panels.get(key)
+    if panel is None:
+        win.clearBuffer()
+        top, bottom = draw_instruction_visuals(win, rows, scale_factor, y_offset, do_flip=False)
+        half_height = win.size[1] / 2
+        panel = visual.BufferImageStim(win, rect=(-1, top / half_height, 1, bottom / half_height),
+                                       pos=(0, (top + bottom) / 2))
+        win.clearBuffer()
+        instruction_panels[key] = panel
+    return panel
+
+# Function to render the instruction panels of every trial ahead of time
+def prepare_instruction_panels(win, trials, scale_factor):
+    """Render the panels of all trials that show the category order, e.g. while the welcome message is up"""
+    for spec in trials:
+        if spec.show_order:
+            instruction_panel(win, instruction_rows(spec), scale_factor,
+                              y_offset=INSTRUCTION_PANEL_OFFSET * scale_factor)
+
 # Run the experiment
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Trail Making Test")
+    parser.add_argument('--agent', action='store_true',
+                        help="run headless with a synthetic participant and report frame and input timing")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="agent's chance of a wrong click per connection")
+    parser.add_argument('--speed', type=float, default=1.0, help="agent speed multiplier (default: typical adult)")
+    parser.add_argument('--seed', type=int, help="random seed for trials, layouts and the agent")
+    parser.add_argument('--size', type=int, nargs=2, default=(1920, 1080), metavar=('WIDTH', 'HEIGHT'),
+                        help="headless window size in pix")
+    parser.add_argument('--max-frame-ms', type=float, help="fail if a trial's 95th percentile frame time is longer")
+    parser.add_argument('--max-rt-error-ms', type=float, help="fail if a logged click time is off by more")
+    args = parser.parse_args()
+    if args.agent:
+        sys.exit(0 if run_headless(args.error_rate, args.speed, args.seed, tuple(args.size),
+                                   args.max_frame_ms, args.max_rt_error_ms) else 1)
     run_experiment()
@@ -0,0 +1,127 @@
+"""
+CSV logging from a background thread for timed task loops.
+
+writerow() only puts the row on a queue, so a task can log in the middle of
+a timed frame without waiting on the disk. A worker thread writes the rows
+with this flush policy:
+    - the file is flushed to the OS whenever the queue runs empty, so rows
+      survive a crash of the task itself within a few milliseconds
+    - the file is fsynced to disk at most every fsync_interval seconds while
+      rows keep coming, once the writer has been idle that long, whenever
+      sync() is called and on close, so rows survive a power loss or OS crash
+
+finish() writes a trailer row starting with TRAILER_MARKER before closing. It
+marks a cleanly completed file; a file without it was cut short. The trailer
+begins with '#', so readers can skip it as a comment (pandas comment='#').
+"""
+import csv
+import os
+import queue
+import threading
+import time
+
+TRAILER_MARKER = '#complete'
+
+_SYNC = object()
+_CLOSE = object()
+
+
+class BackgroundCSVWriter:
+    """csv.writer look-alike whose rows are written by a worker thread"""
+
+    def __init__(self, filepath, header=None, fsync_interval=1.0):
+        self.filepath = filepath
+        self.fsync_interval = fsync_interval
+        self.rows_queued = 0  # data rows, excluding header and trailer
+        self.error = None
+        self.closed = False
+        self.queue = queue.SimpleQueue()
+        # Opened here so a bad path fails in the caller, not in the thread
+        self.file = open(filepath, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        if header is not None:
+            self.writer.writerow(header)
+        self.thread = threading.Thread(target=self._run, name=f'CSV writer {os.path.basename(filepath)}',
+                                       daemon=True)
+        self.thread.start()
+
+    def writerow(self, row):
+        """Queue one row; returns immediately"""
+        self.queue.put(list(row))
+        self.rows_queued += 1
+
+    def sync(self):
+        """Ask the worker to flush and fsync now, e.g. between trials"""
+        self.queue.put(_SYNC)
+
+    def finish(self):
+        """Write the trailer marking clean completion, then close"""
+        if self.closed:
+            return
+        self.queue.put([TRAILER_MARKER, self.rows_queued, time.strftime('%Y-%m-%d %H:%M:%S')])
+        self.close()
+
+    def close(self):
+        """Write every queued row, sync and close the file; waits for the worker"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        if self.error is not None:
+            print(f"Warning: error writing {self.filepath}: {self.error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only a block that ran to the end counts as clean completion
+        if exc_type is None:
+            self.finish()
+        else:
+            self.close()
+        return False
+
+    def _sync_file(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _run(self):
+        last_sync = time.monotonic()
+        unsynced = False
+        while True:
+            try:
+                item = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                item = _SYNC if unsynced else None
+            if item is None:
+                continue
+            try:
+                if item is _CLOSE:
+                    self._sync_file()
+                    break
+                if item is _SYNC:
+                    self._sync_file()
+                    last_sync = time.monotonic()
+                    unsynced = False
+                    continue
+                self.writer.writerow(item)
+                unsynced = True
+                if self.queue.empty():
+                    self.file.flush()
+                    if time.monotonic() - last_sync >= self.fsync_interval:
+                        os.fsync(self.file.fileno())
+                        last_sync = time.monotonic()
+                        unsynced = False
+            except Exception as e:  # keep draining so close() never hangs
+                self.error = e
+        self.file.close()
+
+
+def is_complete(filepath):
+    """True if a CSV written by BackgroundCSVWriter ends with its completion trailer"""
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 256))
+        tail = f.read().decode('utf-8', errors='replace').rstrip().splitlines()
+    return bool(tail) and tail[-1].startswith(TRAILER_MARKER)
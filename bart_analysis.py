@@ -0,0 +1,119 @@
+"""
+Cohort-level analysis of BART sessions in the "Bart Data" directory.
+
+Loads every BART_TopOff_data_*.csv in parallel into one table and reports,
+per participant, per treatment, per block and per Topoff Option:
+    - adjusted average pumps (total pumps on balloons that did not explode)
+    - explosion rate
+    - top-off uptake (share of offered, unexploded balloons that were topped off)
+      and mean top-off size
+
+Parsed files are cached by name, size and modification time (see
+cohort_loader), so a rerun only reads files that are new or have changed
+since the last run.
+
+Usage:
+    python bart_analysis.py ["Bart Data"] [--output "Bart Data/Analysis"]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from cohort_loader import load_files
+
+DATA_PATTERN = 'BART_TopOff_data_*.csv'
+CACHE_FILENAME = '.bart_analysis_cache.pkl'
+TRIALS_PER_BLOCK = 10
+
+COLUMN_TYPES = {
+    'ID': 'string',
+    'Treatment': 'string',
+    'Trial': 'int16',
+    'Explosion Point': 'int16',
+    'Initial Pump': 'int16',
+    'Top Off': 'int16',
+}
+
+
+def load_session_file(filepath):
+    """Read one BART CSV into a typed frame with derived per-balloon columns"""
+    frame = pd.read_csv(filepath, dtype={'ID': str, 'Treatment': str}, keep_default_na=False)
+    if frame.empty:
+        return frame
+    frame = frame.astype(COLUMN_TYPES)
+    frame['Topoff Option'] = frame['Topoff Option'].astype(str).str.lower() == 'true'
+    frame['Session'] = os.path.basename(filepath)
+    frame['Block'] = ((frame['Trial'] - 1) // TRIALS_PER_BLOCK + 1).astype('int8')
+    frame['Total Pumps'] = frame['Initial Pump'] + frame['Top Off']
+    frame['Exploded'] = frame['Total Pumps'] >= frame['Explosion Point']
+    frame['Topped Off'] = frame['Top Off'] > 0
+    # Top-off is only possible when offered and the initial pumps did not pop the balloon
+    frame['Topoff Possible'] = frame['Topoff Option'] & (frame['Initial Pump'] < frame['Explosion Point'])
+    return frame
+
+
+def load_cohort(data_dir='Bart Data', use_cache=True, workers=8):
+    """Load every BART session in data_dir into one table, reusing cached files"""
+    return load_files(data_dir, DATA_PATTERN, load_session_file, CACHE_FILENAME, use_cache=use_cache,
+                      workers=workers, label='BART session')
+
+
+def summarize(table, by):
+    """Grouped BART measures for the given grouping columns"""
+    table = table.assign(
+        safe_pumps=table['Total Pumps'].where(~table['Exploded']),
+        topoff_size=table['Top Off'].where(table['Topped Off']),
+        topped_when_possible=table['Topped Off'].astype(float).where(table['Topoff Possible']),
+    )
+    summary = table.groupby(by, observed=True).agg(
+        balloons=('Trial', 'size'),
+        adjusted_avg_pumps=('safe_pumps', 'mean'),
+        explosion_rate=('Exploded', 'mean'),
+        topoff_offered=('Topoff Option', 'sum'),
+        topoff_uptake=('topped_when_possible', 'mean'),
+        mean_topoff_size=('topoff_size', 'mean'),
+    )
+    return summary.round(4).reset_index()
+
+
+def cohort_report(table):
+    """All summary tables, keyed by name"""
+    return {
+        'by_participant': summarize(table, ['ID', 'Treatment']),
+        'by_treatment': summarize(table, ['Treatment']),
+        'by_block': summarize(table, ['Treatment', 'Block']),
+        'by_participant_block': summarize(table, ['ID', 'Treatment', 'Block']),
+        'by_topoff_option': summarize(table, ['Treatment', 'Topoff Option']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort-level BART analysis")
+    parser.add_argument('data_dir', nargs='?', default='Bart Data')
+    parser.add_argument('--output', help="directory for summary CSVs (default: <data_dir>/Analysis)")
+    parser.add_argument('--no-cache', action='store_true', help="re-read every file")
+    args = parser.parse_args()
+
+    table = load_cohort(args.data_dir, use_cache=not args.no_cache)
+    if table.empty:
+        print("No BART data found.")
+        return
+
+    report = cohort_report(table)
+    output_dir = args.output or os.path.join(args.data_dir, 'Analysis')
+    os.makedirs(output_dir, exist_ok=True)
+    with pd.option_context('display.width', 160, 'display.max_columns', 20):
+        for name, summary in report.items():
+            summary.to_csv(os.path.join(output_dir, f'BART_{name}.csv'), index=False)
+            if name in ('by_treatment', 'by_block', 'by_topoff_option'):
+                print(f"\n=== {name} ===")
+                print(summary.to_string(index=False))
+    print(f"\nSummary tables saved to: {output_dir}")
+    print(f"Participants: {table['ID'].nunique()}, sessions: {table['Session'].nunique()}, "
+          f"balloons: {len(table)}, overall explosion rate: {np.mean(table['Exploded']):.1%}")
+
+
+if __name__ == '__main__':
+    main()
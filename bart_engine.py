@@ -0,0 +1,450 @@
+"""
+Display-free BART game logic.
+
+BartEngine holds all balloon, bank and top-off state and applies participant
+actions (select pumps, pump, collect, top off). It never touches a window,
+stimulus or sound, so it can be driven by the PsychoPy BART class (which only
+animates and renders the transitions it returns) or run headless for
+simulation, replay and payout validation.
+
+The payout rules (how far a session pumps before the break point, the top-off
+limit and the bank) are written once, as plain arithmetic in session_pumps,
+capped_topoff and balloon_outcome. BartEngine applies them step by step for
+the task, simulate_trial/simulate_session apply them to whole balloons, and
+bart_montecarlo applies the same functions to NumPy arrays.
+
+While playing, the engine only keeps compact SessionResult/TrialResult tuples
+with a raw clock time. The record dicts of the saved data (with their
+pump_sessions_detail string and formatted timestamps) are built from them on
+first access to trial_data, so batch runs never pay for records they do not read.
+
+Throughput: only the batched simulate_session, with arrays of many sessions,
+reaches the target of about a million trials per second (tens of millions on
+a current desktop). BartEngine.play_trial steps the full state machine and
+keeps its results, so it manages about 10^5 trials per second; simulate_trial
+and a single-session simulate_session stay in the 10^5 to 10^6 range, since
+each call pays Python call overhead. Batch and Monte Carlo users should build
+arrays of sessions and call simulate_session once (as bart_montecarlo does).
+"""
+import ast
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+# Transitions returned by BartEngine.pump_once() / BartEngine.pump()
+PUMPED = 'pumped'                  # one pump added, session still running
+POPPED = 'popped'                  # balloon exploded, trial recorded
+TOPOFF_OFFERED = 'topoff_offered'  # first session done, top-off slider shown
+COLLECTED = 'collected'            # session done and bank auto-collected
+SESSION_COMPLETE = 'session_complete'  # session done, waiting for COLLECT
+
+BASE_BALLOON_SIZE = 50
+BALLOON_GROWTH_PER_PUMP = 8
+
+# Columns of the saved BART_TopOff_data CSV
+CSV_FIELDNAMES = ['Timestamp', 'ID', 'Treatment', 'Trial', 'Explosion Point', 'Initial Pump', 'Top Off', 'Topoff Option']
+
+
+# One pump session and one balloon as played; times are clock() values (seconds)
+SessionResult = namedtuple('SessionResult', ['trial', 'session', 'explosion_point', 'pumps_selected', 'pumps_actual',
+                                             'total_pumps', 'temporary_bank', 'was_topoff', 'exploded',
+                                             'annotations', 'time'])
+TrialResult = namedtuple('TrialResult', ['trial', 'explosion_point', 'sessions', 'total_pumps', 'exploded', 'earned',
+                                         'total_earned', 'used_topoff', 'topoff_option', 'time'])
+
+
+def format_timestamp(seconds):
+    """Timestamp format used in every BART record"""
+    return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def session_record(session, participant_id='', treatment=''):
+    """Record dict of a SessionResult, as stored in pump_sessions_detail"""
+    session_data = {
+        'participant_id': participant_id,
+        'treatment': treatment,
+        'trial': session.trial,
+        'session': session.session,
+        'explosion_point': session.explosion_point,
+        'pumps_selected_this_session': session.pumps_selected,  # INTENDED pumps
+        'pumps_actual_this_session': session.pumps_actual,      # ACTUAL pumps
+        'total_pumps_so_far': session.total_pumps,
+        'temporary_bank': session.temporary_bank,
+        'was_topoff': session.was_topoff,
+    }
+    if session.exploded:
+        session_data['exploded_during_session'] = True
+    session_data.update(session.annotations)
+    session_data['timestamp'] = format_timestamp(session.time)
+    return session_data
+
+
+def trial_record(result, participant_id='', treatment=''):
+    """Record dict of a TrialResult including all its pump sessions"""
+    return {
+        'participant_id': participant_id,
+        'treatment': treatment,
+        'trial': result.trial,
+        'explosion_point': result.explosion_point,
+        'total_pump_sessions': len(result.sessions),
+        'total_pumps_final': result.total_pumps,
+        'exploded': result.exploded,
+        'earned_this_balloon': result.earned,
+        'total_earned': result.total_earned,
+        'used_topoff': result.used_topoff,
+        'topoff_option': result.topoff_option,  # TRUE if user had the option to top off, FALSE otherwise
+        'pump_sessions_detail': str([session_record(session, participant_id, treatment)
+                                     for session in result.sessions]),
+        'timestamp': format_timestamp(result.time)
+    }
+
+
+def simplified_row(trial):
+    """Saved CSV row for one trial record: initial and top-off pumps are taken from its pump sessions"""
+    initial_pump = 0
+    top_off = 0
+
+    if 'pump_sessions_detail' in trial and trial['pump_sessions_detail'] != '[]':
+        try:
+            sessions = ast.literal_eval(trial['pump_sessions_detail'])
+            for session in sessions:
+                if session.get('was_topoff', False):
+                    top_off = session.get('pumps_selected_this_session', 0)
+                else:
+                    initial_pump = session.get('pumps_selected_this_session', 0)
+        except Exception as e:
+            print(f"ERROR parsing sessions: {e}")
+            # Fallback: use total pumps as initial if can't parse sessions
+            initial_pump = trial.get('total_pumps_final', 0)
+            top_off = 0
+    else:
+        # No sessions recorded, use total pumps as initial
+        initial_pump = trial.get('total_pumps_final', 0)
+
+    return {
+        'Timestamp': trial.get('timestamp', ''),
+        'ID': trial.get('participant_id', ''),
+        'Treatment': trial.get('treatment', ''),
+        'Trial': trial.get('trial', 0),
+        'Explosion Point': trial.get('explosion_point', 0),
+        'Initial Pump': initial_pump,
+        'Top Off': top_off,
+        'Topoff Option': trial.get('topoff_option', False)  # TRUE if user had the option to top off, FALSE otherwise
+    }
+
+
+def session_pumps(current_pumps, pumps, explosion_point):
+    """
+    (pumps added, popped) for a pump session of pumps on a balloon that already has
+    current_pumps: pumping stops at the break point. Plain arithmetic on purpose, so the
+    same rule works on numbers (BartEngine) and elementwise on NumPy arrays (bart_montecarlo).
+    """
+    popped = current_pumps + pumps >= explosion_point
+    return pumps - (current_pumps + pumps - explosion_point) * popped, popped
+
+
+def capped_topoff(pumps, topoff_limit):
+    """Top-off pumps after applying the top-off limit"""
+    return pumps - (pumps - topoff_limit) * (pumps > topoff_limit)
+
+
+def balloon_outcome(explosion_point, initial_pumps, topoff_pumps, offered, points_per_pump=0.01, topoff_limit=9):
+    """
+    (total_pumps, exploded, earned, topped_off) of one balloon: an initial session, then a
+    top-off of topoff_pumps if one is offered and the balloon survived (topoff_pumps=0 means
+    collecting instead). Built from session_pumps and capped_topoff, so it applies BartEngine's
+    rules and works on numbers and on NumPy arrays alike.
+    """
+    total, exploded = session_pumps(0, initial_pumps, explosion_point)
+    topped_off = offered & (topoff_pumps > 0) & (initial_pumps < explosion_point)
+    added, exploded = session_pumps(total, capped_topoff(topoff_pumps, topoff_limit) * topped_off, explosion_point)
+    total = total + added
+    return total, exploded, total * points_per_pump * (total < explosion_point), topped_off
+
+
+def simulate_trial(explosion_point, initial_pumps, topoff_pumps=0, topoff_offered=False,
+                   points_per_pump=0.01, topoff_limit=9):
+    """
+    Resolve one balloon with BART payout rules without building any records.
+    Returns (total_pumps, exploded, earned). topoff_pumps=0 means the participant
+    collected instead of topping off (or was not offered a top-off).
+    """
+    total, exploded, earned, topped_off = balloon_outcome(explosion_point, initial_pumps, topoff_pumps,
+                                                          topoff_offered, points_per_pump, topoff_limit)
+    return total, exploded, earned
+
+
+def simulate_session(break_points, topoff_assignment, initial_pumps, topoff_pumps,
+                     points_per_pump=0.01, topoff_limit=9):
+    """
+    Resolve a whole session of balloons at once; initial_pumps and topoff_pumps are per-trial
+    sequences (or arrays, with any leading batch dimensions). Returns (total_earned, explosions,
+    topoffs_used), summed over the last axis.
+    """
+    total, exploded, earned, topped_off = balloon_outcome(
+        np.asarray(break_points), np.asarray(initial_pumps), np.asarray(topoff_pumps),
+        np.asarray(topoff_assignment, dtype=bool), points_per_pump, topoff_limit)
+    if earned.ndim == 1:
+        return float(earned.sum()), int(exploded.sum()), int(topped_off.sum())
+    return earned.sum(axis=-1), exploded.sum(axis=-1), topped_off.sum(axis=-1)
+
+
+class BartEngine:
+    """Pure BART state machine: actions in, state transitions and records out"""
+
+    def __init__(self, break_points, topoff_assignment, participant_id='', treatment='',
+                 points_per_pump=0.01, array_size=128, topoff_limit=9, clock=time.time):
+        self.break_points = list(break_points)
+        self.topoff_assignment = list(topoff_assignment)
+        self.participant_id = participant_id
+        self.treatment = treatment
+        self.points_per_pump = points_per_pump
+        self.array_size = array_size
+        self.topoff_limit = topoff_limit
+        self.total_trials = len(self.break_points)
+        self.clock = clock  # seconds since the epoch, formatted only when records are built
+
+        # Session-level results; record dicts are built from them on demand (see trial_data)
+        self.results = []
+        self._trial_records = []
+        self.total_earned = 0.0
+        self.current_trial = 0
+
+        # Last balloon summary (shown in the status bar)
+        self.last_balloon_earned = 0.0
+        self.last_balloon_pumps = 0
+        self.last_balloon_exploded = False
+
+        self.start_new_balloon()
+
+    @property
+    def finished(self):
+        """True once every balloon has been played"""
+        return self.current_trial >= self.total_trials
+
+    @property
+    def trial_data(self):
+        """Record dicts of the balloons played so far, built on first access"""
+        records = self._trial_records
+        for result in self.results[len(records):]:
+            records.append(trial_record(result, self.participant_id, self.treatment))
+        return records
+
+    @property
+    def explosion_point(self):
+        """Break point of the current balloon"""
+        return self.break_points[self.current_trial]
+
+    @property
+    def balloon_size(self):
+        """Radius of the balloon after the pumps made so far"""
+        return BASE_BALLOON_SIZE + self.current_pumps * BALLOON_GROWTH_PER_PUMP
+
+    @property
+    def max_selectable_pumps(self):
+        """Upper slider bound: the top-off limit in top-off mode, otherwise array_size"""
+        return self.topoff_limit if self.in_topoff_mode else self.array_size
+
+    def predicted_pumps(self):
+        """Total pumps the balloon would have after pumping the selected amount"""
+        if self.in_topoff_mode:
+            return self.current_pumps + self.selected_pumps
+        return self.selected_pumps
+
+    def start_new_balloon(self):
+        """Reset all per-balloon state for the current trial"""
+        self.current_pumps = 0
+        self.temporary_bank = 0.0
+        self.balloon_exploded = False
+        self.is_pumping = False
+        self.in_topoff_mode = False
+        self.has_topped_off = False
+
+        # Intended pump tracking
+        self.intended_pumps_total = 0
+        self.initial_pumps_selected = 0
+        self.topoff_pumps_selected = 0
+        self.current_session_is_topoff = False
+
+        # Session tracking
+        self.pump_sessions = []
+        self.session_number = 0
+        self.pumps_to_simulate = 0
+        self.pumps_simulated = 0
+        self.session_annotations = {}
+
+        self.selected_pumps = 1
+
+    # ------------------------------------------------------------------ actions
+
+    def select_pumps(self, pumps):
+        """Set the slider value (clamped to the current mode). Returns True if it changed."""
+        if self.is_pumping or self.finished:
+            return False
+        pumps = max(1, min(self.max_selectable_pumps, int(pumps)))
+        if pumps == self.selected_pumps:
+            return False
+        self.selected_pumps = pumps
+        return True
+
+    def start_pumping(self, annotations=None):
+        """
+        Begin a pump session with the selected pumps. Returns True if a session started.
+        annotations (e.g. slider decision metrics) are stored in the session record.
+        """
+        if self.is_pumping or self.finished:
+            return False
+
+        # Track intended pumps based on session
+        if self.session_number == 0:  # First session
+            self.initial_pumps_selected = self.selected_pumps
+            self.intended_pumps_total = self.selected_pumps
+            self.current_session_is_topoff = False
+        elif self.in_topoff_mode:  # Top-off session
+            self.selected_pumps = capped_topoff(self.selected_pumps, self.topoff_limit)
+            self.topoff_pumps_selected = self.selected_pumps
+            self.intended_pumps_total = self.initial_pumps_selected + self.selected_pumps
+            self.current_session_is_topoff = True
+
+        self.is_pumping = True
+        self.pumps_to_simulate = self.selected_pumps
+        self.pumps_simulated = 0
+        self.session_annotations = annotations or {}
+        return True
+
+    def pump_once(self):
+        """Add a single pump to the running session and return the resulting transition"""
+        if not self.is_pumping:
+            return None
+
+        added, popped = session_pumps(self.current_pumps, 1, self.explosion_point)
+        self.pumps_simulated += added
+        self.current_pumps += added
+        self.temporary_bank = self.current_pumps * self.points_per_pump
+
+        if popped:
+            return self._pop()
+        if self.pumps_simulated >= self.pumps_to_simulate:
+            return self._complete_session()
+        return PUMPED
+
+    def pump(self, annotations=None):
+        """Start a session with the selected pumps and resolve it in one step"""
+        if not self.start_pumping(annotations):
+            return None
+
+        # Pumping stops at the break point
+        added, popped = session_pumps(self.current_pumps, self.pumps_to_simulate, self.explosion_point)
+        self.pumps_simulated = added
+        self.current_pumps += added
+        self.temporary_bank = self.current_pumps * self.points_per_pump
+
+        if popped:
+            return self._pop()
+        return self._complete_session()
+
+    def top_off(self, pumps):
+        """Add 1 to topoff_limit pumps while a top-off is on offer"""
+        if not self.in_topoff_mode or self.is_pumping:
+            return None
+        self.select_pumps(pumps)
+        return self.pump()
+
+    def collect(self):
+        """Move the temporary bank into the total. Returns the TrialResult, or None."""
+        if self.temporary_bank <= 0 or self.is_pumping or self.finished:
+            return None
+
+        self.in_topoff_mode = False
+        self.last_balloon_pumps = self.intended_pumps_total
+        self.last_balloon_exploded = False
+        self.last_balloon_earned = self.temporary_bank
+        self.total_earned += self.temporary_bank
+
+        record = self._record_trial(exploded=False)
+        self._next_balloon()
+        return record
+
+    def play_trial(self, initial_pumps, topoff_pumps=0):
+        """
+        Play a whole balloon: pump, optionally top off, and collect. Returns its TrialResult.
+        For large batches use simulate_session instead (see the module docstring).
+        """
+        self.select_pumps(initial_pumps)
+        transition = self.pump()
+        if transition == TOPOFF_OFFERED:
+            if topoff_pumps > 0:
+                self.top_off(topoff_pumps)
+            else:
+                self.collect()
+        elif transition == SESSION_COMPLETE:
+            self.collect()
+        return self.results[-1]
+
+    # ---------------------------------------------------------------- internals
+
+    def _complete_session(self):
+        """Record the finished session and decide what happens next"""
+        self.is_pumping = False
+        self._record_session(exploded=False)
+
+        if self.current_session_is_topoff:
+            # Top-off session completed - auto-collect
+            self.collect()
+            return COLLECTED
+        if self.session_number == 1 and not self.has_topped_off:
+            if self.topoff_assignment[self.current_trial]:
+                self.in_topoff_mode = True
+                self.selected_pumps = 1
+                return TOPOFF_OFFERED
+            self.collect()
+            return COLLECTED
+        return SESSION_COMPLETE
+
+    def _pop(self):
+        """Handle the balloon reaching its break point"""
+        self.balloon_exploded = True
+        self.is_pumping = False
+        self._record_session(exploded=True)
+
+        self.last_balloon_pumps = self.intended_pumps_total
+        self.last_balloon_exploded = True
+        self.last_balloon_earned = 0.0
+
+        self._record_trial(exploded=True)
+        self._next_balloon()
+        return POPPED
+
+    def _next_balloon(self):
+        """Close the current trial and reset for the next one"""
+        self.temporary_bank = 0.0
+        self.current_trial += 1
+        if not self.finished:
+            self.start_new_balloon()
+
+    def _record_session(self, exploded):
+        """Record the pump session that just ended with its INTENDED pumps"""
+        self.session_number += 1
+        was_topoff_session = self.current_session_is_topoff
+        session = SessionResult(self.current_trial + 1, self.session_number, self.explosion_point,
+                                self.selected_pumps, self.pumps_simulated, self.current_pumps,
+                                self.temporary_bank, was_topoff_session, exploded,
+                                self.session_annotations, self.clock())
+        self.pump_sessions.append(session)
+
+        # Mark top-off as used if this was a top-off session
+        if was_topoff_session:
+            self.has_topped_off = True
+            self.in_topoff_mode = False
+        return session
+
+    def _record_trial(self, exploded):
+        """Record the current trial including all pump sessions"""
+        topoff_option = self.topoff_assignment[self.current_trial] if self.current_trial < len(self.topoff_assignment) else False
+        result = TrialResult(self.current_trial + 1, self.explosion_point, self.pump_sessions, self.current_pumps,
+                             exploded, 0.0 if exploded else self.temporary_bank, self.total_earned,
+                             self.has_topped_off, topoff_option, self.clock())
+        self.results.append(result)
+        return result
@@ -0,0 +1,227 @@
+"""
+Vectorized Monte Carlo evaluation of BART break-point schedules and strategies.
+
+Simulates arrays of strategies x schedules x sessions in NumPy, one balloon at a
+time, with bart_engine.balloon_outcome, the payout rules BartEngine itself
+uses: points_per_pump per pump, a temporary bank that is lost on explosion, a
+top-off of at most 9 pumps on balloons with a top-off offer, and explosion
+once total pumps reach the break point. Use it to judge a generate_break_points
+configuration before it is deployed.
+
+Schedules come from the break-point generator of either task version
+(--generator v2 or v3, see bart_schedules), so payoffs describe the sessions
+of that version.
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from bart_engine import balloon_outcome
+from bart_schedules import GENERATORS
+
+# A participant strategy. target is the initial pump goal; after each balloon
+# it moves up by step_up (collected) or down by step_down (popped), which makes
+# a strategy risk-adaptive. topoff is the pumps added when a top-off is offered
+# (0 = never top off). noise is the SD of the trial-to-trial jitter on target.
+Strategy = namedtuple('Strategy', ['name', 'target', 'topoff', 'step_up', 'step_down', 'noise'])
+
+
+def fixed_strategy(target, topoff=0, noise=0.0):
+    """Always aim for the same number of pumps"""
+    name = f"fixed {target}" + (f" +{topoff}" if topoff else "")
+    return Strategy(name, target, topoff, 0.0, 0.0, noise)
+
+
+def adaptive_strategy(target, step_up=2.0, step_down=8.0, topoff=0, noise=0.0):
+    """Pump a little more after each collect and back off after each pop"""
+    name = f"adaptive {target} (+{step_up:g}/-{step_down:g})" + (f" +{topoff}" if topoff else "")
+    return Strategy(name, target, topoff, step_up, step_down, noise)
+
+
+def default_strategies():
+    """Strategy grid used when none is given: fixed targets and one adaptive, with top-off never/always"""
+    strategies = []
+    for topoff in (0, 9):
+        for target in (16, 32, 48, 64):
+            strategies.append(fixed_strategy(target, topoff=topoff, noise=4.0))
+        strategies.append(adaptive_strategy(32, topoff=topoff, noise=4.0))
+    return strategies
+
+
+def generate_schedules(n_schedules, array_size=128, target_avg=64, block_size=10, n_blocks=3, generator='v3',
+                       rng=None):
+    """
+    Break-point schedules made block by block with the task's own generator from
+    bart_schedules: 'v2' keeps every block average exactly at target_avg, 'v3' draws
+    from N(target_avg, array_size/6) and nudges each break point at most once by +/-1,
+    so its block averages only approach target_avg. Returns an int array
+    (n_schedules, n_blocks*block_size).
+    """
+    rng = np.random.default_rng(rng)
+    py_rng = random.Random(int(rng.integers(2 ** 63)))
+    make_block = GENERATORS[generator]
+    kwargs = {'np_rng': rng} if generator == 'v3' else {}
+    blocks = [make_block(array_size, target_avg, block_size, rng=py_rng, **kwargs)
+              for _ in range(n_schedules * n_blocks)]
+    return np.array(blocks, dtype=np.int64).reshape(n_schedules, n_blocks * block_size)
+
+
+def generate_topoff_assignments(schedules, n_topoff=15, n_guaranteed=3, rng=None):
+    """
+    Vectorized version of the BART top-off assignment: the n_guaranteed highest
+    break points always get a top-off offer, plus random others up to n_topoff.
+    Returns a bool array shaped like schedules.
+    """
+    rng = np.random.default_rng(rng)
+    n_schedules, n_trials = schedules.shape
+    rows = np.arange(n_schedules)[:, None]
+
+    guaranteed = np.argsort(-schedules, axis=1, kind='stable')[:, :n_guaranteed]
+    keys = rng.random(schedules.shape)
+    keys[rows, guaranteed] = -1.0  # sort guaranteed indices first
+    chosen = np.argsort(keys, axis=1)[:, :n_topoff]
+
+    assignment = np.zeros(schedules.shape, dtype=bool)
+    assignment[rows, chosen] = True
+    return assignment
+
+
+def simulate(schedules, topoff_assignment, strategies, sessions_per_schedule=1000,
+             points_per_pump=0.01, array_size=128, topoff_limit=9, rng=None):
+    """
+    Simulate every strategy on every schedule sessions_per_schedule times.
+
+    Returns a dict of arrays shaped (n_strategies, n_schedules, sessions_per_schedule):
+    'earned' (total earned), 'explosions', 'topoffs_used' and 'topoff_gain'
+    (earnings from topping off relative to collecting the initial pumps instead;
+    negative when the top-off popped the balloon).
+    """
+    rng = np.random.default_rng(rng)
+    schedules = np.asarray(schedules)
+    topoff_assignment = np.asarray(topoff_assignment, dtype=bool)
+    n_schedules, n_trials = schedules.shape
+    shape = (len(strategies), n_schedules, sessions_per_schedule)
+
+    # Strategy parameters broadcast over (strategy, schedule, session)
+    params = np.array([s[1:] for s in strategies], dtype=np.float64).reshape(-1, 1, 1, 5)
+    start_target = params[..., 0]
+    topoff = np.maximum(params[..., 1], 0)  # balloon_outcome applies the top-off limit
+    step_up = params[..., 2]
+    step_down = params[..., 3]
+    noise = params[..., 4]
+
+    target = np.broadcast_to(start_target, shape).copy()
+    earned = np.zeros(shape)
+    explosions = np.zeros(shape, dtype=np.int32)
+    topoffs_used = np.zeros(shape, dtype=np.int32)
+    topoff_gain = np.zeros(shape)
+
+    for t in range(n_trials):
+        explosion_point = schedules[None, :, t, None]
+        offered = topoff_assignment[None, :, t, None]
+
+        initial = np.rint(target + noise * rng.standard_normal(shape))
+        np.clip(initial, 1, array_size, out=initial)
+
+        total, exploded, balloon_earned, use_topoff = balloon_outcome(explosion_point, initial, topoff, offered,
+                                                                      points_per_pump, topoff_limit)
+        earned += balloon_earned
+        explosions += exploded
+        topoffs_used += use_topoff
+        topoff_gain += np.where(use_topoff, balloon_earned - initial * points_per_pump, 0.0)
+
+        # Risk-adaptive strategies move their target after every balloon
+        target += np.where(exploded, -step_down, step_up)
+        np.clip(target, 1, array_size, out=target)
+
+    return {
+        'earned': earned,
+        'explosions': explosions,
+        'topoffs_used': topoffs_used,
+        'topoff_gain': topoff_gain,
+    }
+
+
+def payoff_table(results, strategies, n_trials):
+    """
+    Summarize simulate() output into one row per strategy x schedule with mean
+    earnings, earnings SD, explosion rate, top-off uptake and mean top-off gain.
+    """
+    earned = results['earned']
+    mean_earned = earned.mean(axis=2)
+    sd_earned = earned.std(axis=2)
+    explosion_rate = results['explosions'].mean(axis=2) / n_trials
+    topoffs = results['topoffs_used'].mean(axis=2)
+    topoff_gain = results['topoff_gain'].mean(axis=2)
+
+    rows = []
+    for k, strategy in enumerate(strategies):
+        for s in range(earned.shape[1]):
+            rows.append({
+                'strategy': strategy.name,
+                'schedule': s,
+                'mean_earned': mean_earned[k, s],
+                'sd_earned': sd_earned[k, s],
+                'explosion_rate': explosion_rate[k, s],
+                'mean_topoffs': topoffs[k, s],
+                'mean_topoff_gain': topoff_gain[k, s],
+            })
+    return rows
+
+
+def print_strategy_summary(results, strategies, n_trials):
+    """Print strategies averaged over all schedules, best earners first"""
+    earned = results['earned'].mean(axis=(1, 2))
+    worst_schedule = results['earned'].mean(axis=2).min(axis=1)
+    best_schedule = results['earned'].mean(axis=2).max(axis=1)
+    explosion_rate = results['explosions'].mean(axis=(1, 2)) / n_trials
+    topoff_gain = results['topoff_gain'].mean(axis=(1, 2))
+
+    print(f"{'Strategy':<32}{'Earned':>9}{'Min sched':>11}{'Max sched':>11}{'Pop rate':>10}{'Top-off gain':>14}")
+    for k in np.argsort(-earned):
+        print(f"{strategies[k].name:<32}${earned[k]:>8.2f} ${worst_schedule[k]:>9.2f} ${best_schedule[k]:>9.2f}"
+              f"{explosion_rate[k]:>10.1%} ${topoff_gain[k]:>12.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo payoff tables for BART schedules and strategies")
+    parser.add_argument('--schedules', type=int, default=100, help="number of break-point schedules")
+    parser.add_argument('--sessions', type=int, default=1000, help="simulated sessions per schedule and strategy")
+    parser.add_argument('--target-avg', type=int, default=64, help="block average break point")
+    parser.add_argument('--array-size', type=int, default=128, help="maximum break point")
+    parser.add_argument('--generator', choices=sorted(GENERATORS), default='v3',
+                        help="break-point generator of the task version to model (default: v3)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--csv', help="write the strategy x schedule payoff table to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    strategies = default_strategies()
+    schedules = generate_schedules(args.schedules, array_size=args.array_size, target_avg=args.target_avg,
+                                   generator=args.generator, rng=rng)
+    topoff_assignment = generate_topoff_assignments(schedules, rng=rng)
+
+    start = time.perf_counter()
+    results = simulate(schedules, topoff_assignment, strategies, sessions_per_schedule=args.sessions,
+                       array_size=args.array_size, rng=rng)
+    elapsed = time.perf_counter() - start
+    n_sessions = len(strategies) * args.schedules * args.sessions
+    print(f"Simulated {n_sessions:,} sessions in {elapsed:.2f} s")
+
+    print_strategy_summary(results, strategies, schedules.shape[1])
+
+    if args.csv:
+        import csv
+        rows = payoff_table(results, strategies, schedules.shape[1])
+        with open(args.csv, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Payoff table saved to: {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
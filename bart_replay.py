@@ -0,0 +1,175 @@
+"""
+Record and replay BART participant actions.
+
+During run_trial_loop the BART task logs every accepted action (slider
+selections, pump and top-off clicks, collect clicks) with its time since the
+first balloon. The log is saved next to the data CSV together with the break
+points and top-off assignment, so a session can be re-run through BartEngine
+later, either as fast as possible or paced at real time / N x speed, and the
+regenerated trial data checked against the saved CSV.
+
+Headless replay:
+    python bart_replay.py "Bart Data/BART_TopOff_actions_<id>_<treatment>_<timestamp>.json" --speed 10
+
+Replay with rendering: run the BART script with --replay <log> [--speed N];
+the explosion and money collection animations are sped up by the same factor.
+Logged pump and top-off counts are checked against the engine, so a replay
+that diverges from the recorded session raises ValueError.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+from bart_engine import BartEngine, capped_topoff, simplified_row
+
+# Action names stored in the log
+SELECT = 'select'
+PUMP = 'pump'
+TOPOFF = 'topoff'
+COLLECT = 'collect'
+
+# Saved CSV columns compared by verify_against_csv (Timestamp naturally differs)
+VERIFIED_COLUMNS = ['ID', 'Treatment', 'Trial', 'Explosion Point', 'Initial Pump', 'Top Off', 'Topoff Option']
+
+
+class ActionLog:
+    """Timestamped list of accepted participant actions for one BART session"""
+
+    def __init__(self):
+        self.actions = []
+
+    def record(self, time_s, action, value=None):
+        """Append one action; time_s is seconds since the first balloon was shown"""
+        self.actions.append([round(time_s, 4), action, value])
+
+    def save(self, filepath, engine, data_file=None):
+        """Write the log with everything needed to rebuild the engine"""
+        log = {
+            'participant_id': engine.participant_id,
+            'treatment': engine.treatment,
+            'break_points': [int(bp) for bp in engine.break_points],
+            'topoff_assignment': [bool(t) for t in engine.topoff_assignment],
+            'points_per_pump': engine.points_per_pump,
+            'array_size': engine.array_size,
+            'topoff_limit': engine.topoff_limit,
+            'data_file': os.path.basename(data_file) if data_file else None,
+            'actions': self.actions,
+        }
+        with open(filepath, 'w') as f:
+            json.dump(log, f)
+
+
+def load_action_log(filepath):
+    """Load a saved action log"""
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def engine_from_log(log):
+    """Fresh BartEngine with the schedule and settings of the logged session"""
+    return BartEngine(
+        log['break_points'],
+        log['topoff_assignment'],
+        participant_id=log['participant_id'],
+        treatment=log['treatment'],
+        points_per_pump=log['points_per_pump'],
+        array_size=log['array_size'],
+        topoff_limit=log['topoff_limit']
+    )
+
+
+def check_pump_action(engine, action, value):
+    """Raise ValueError if a logged pump or top-off does not match what the engine is about to pump"""
+    if (action == TOPOFF) != engine.in_topoff_mode:
+        mode = 'top-off' if engine.in_topoff_mode else 'initial pump'
+        raise ValueError(f"Replay diverged on trial {engine.current_trial + 1}: logged {action} during the {mode} session")
+    pumps = capped_topoff(engine.selected_pumps, engine.topoff_limit) if engine.in_topoff_mode else engine.selected_pumps
+    if pumps != value:
+        raise ValueError(f"Replay diverged on trial {engine.current_trial + 1}: logged {action} of {value} pumps, "
+                         f"engine would pump {pumps}")
+
+
+def apply_action(engine, action, value=None):
+    """Apply one logged action to the engine; pump sessions resolve immediately"""
+    if action == SELECT:
+        return engine.select_pumps(value)
+    if action in (PUMP, TOPOFF):
+        check_pump_action(engine, action, value)
+        return engine.pump()
+    if action == COLLECT:
+        return engine.collect()
+    raise ValueError(f"Unknown BART action: {action}")
+
+
+def replay(log, speed=None):
+    """
+    Re-run a logged session through a headless engine and return the engine.
+    speed=None replays as fast as possible; otherwise actions are paced at their
+    recorded times divided by speed (1 = real time).
+    """
+    engine = engine_from_log(log)
+    start = time.perf_counter()
+    for time_s, action, value in log['actions']:
+        if speed:
+            delay = start + time_s / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        apply_action(engine, action, value)
+    return engine
+
+
+def data_file_for_log(log, log_path):
+    """Path of the data CSV saved alongside the action log"""
+    if log.get('data_file'):
+        return os.path.join(os.path.dirname(log_path), log['data_file'])
+    return log_path.replace('_actions_', '_data_').replace('.json', '.csv')
+
+
+def verify_against_csv(trial_data, csv_path):
+    """Compare regenerated trial records with a saved BART CSV. Returns a list of mismatch messages."""
+    with open(csv_path, newline='') as csvfile:
+        saved_rows = list(csv.DictReader(csvfile))
+    regenerated = [simplified_row(trial) for trial in trial_data]
+
+    mismatches = []
+    if len(saved_rows) != len(regenerated):
+        mismatches.append(f"row count: saved {len(saved_rows)}, replayed {len(regenerated)}")
+    for saved, row in zip(saved_rows, regenerated):
+        for column in VERIFIED_COLUMNS:
+            if str(saved[column]) != str(row[column]):
+                mismatches.append(f"trial {saved['Trial']} {column}: saved {saved[column]}, replayed {row[column]}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded BART session and verify its saved data")
+    parser.add_argument('log', help="BART_TopOff_actions_*.json file")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="replay speed (1 = real time); default is as fast as possible")
+    parser.add_argument('--csv', help="saved data CSV to verify against (default: the file paired with the log)")
+    args = parser.parse_args()
+
+    log = load_action_log(args.log)
+    start = time.perf_counter()
+    engine = replay(log, speed=args.speed)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(log['actions'])} actions, {len(engine.trial_data)} balloons in {elapsed:.3f} s")
+    print(f"Total Earned: ${engine.total_earned:.2f}")
+
+    csv_path = args.csv or data_file_for_log(log, args.log)
+    if not os.path.exists(csv_path):
+        print(f"No saved data found at {csv_path}; skipping verification")
+        return
+    mismatches = verify_against_csv(engine.trial_data, csv_path)
+    if mismatches:
+        print(f"❌ Replay does not match {csv_path}:")
+        for mismatch in mismatches:
+            print(f"  {mismatch}")
+        raise SystemExit(1)
+    print(f"✅ Replay matches {csv_path}")
+
+
+if __name__ == '__main__':
+    main()
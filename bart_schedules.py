@@ -0,0 +1,156 @@
+"""
+BART break-point block generators.
+
+The two task versions build each block of break points differently:
+    - v2 (exact_average_sequence) starts every balloon at the target average
+      and makes random sum-preserving swaps between pairs, so every block
+      average is exactly the target
+    - v3 (normal_sequence) draws from a normal distribution around the target
+      (SD array_size/6), clamped to [1, array_size], then nudges each
+      break point at most once by +/-1 towards the target sum, so a block
+      average is only close to the target
+
+Both task scripts and bart_montecarlo call these functions, so simulated
+schedules come from the same code as the ones participants see. Each takes
+the random source to use (the random module by default), so a simulation can
+seed its own.
+"""
+import random
+
+import numpy as np
+
+
+def exact_average_sequence(array_size, target_avg, sequence_length, rng=random):
+    """Generate a sequence of break points with exact target average"""
+    max_attempts = 10000
+
+    for attempt in range(max_attempts):
+        # Start with the target average for all positions
+        sequence = [target_avg] * sequence_length
+
+        # Add random variation while maintaining the exact sum
+        target_sum = target_avg * sequence_length
+
+        # Make random swaps to add variation
+        for _ in range(sequence_length * 2):
+            # Pick two random positions
+            i, j = rng.sample(range(sequence_length), 2)
+
+            # Try to make a random change that preserves the sum
+            max_change = min(
+                sequence[i] - 1,           # Can't go below 1
+                array_size - sequence[j],  # Can't go above array_size
+                sequence[j] - 1,           # Can't go below 1
+                array_size - sequence[i]   # Can't go above array_size
+            )
+
+            if max_change > 0:
+                change = rng.randint(1, max_change)
+
+                # Randomly decide direction
+                if rng.choice([True, False]):
+                    sequence[i] += change
+                    sequence[j] -= change
+                else:
+                    sequence[i] -= change
+                    sequence[j] += change
+
+        # Ensure all values are in valid range
+        sequence = [max(1, min(array_size, x)) for x in sequence]
+
+        # Adjust to get exact average
+        current_sum = sum(sequence)
+        difference = target_sum - current_sum
+
+        # Distribute the difference across random positions
+        attempts_to_fix = 100
+        for _ in range(attempts_to_fix):
+            if difference == 0:
+                break
+
+            pos = rng.randint(0, sequence_length - 1)
+
+            if difference > 0:  # Need to increase sum
+                increase = min(difference, array_size - sequence[pos])
+                sequence[pos] += increase
+                difference -= increase
+            elif difference < 0:  # Need to decrease sum
+                decrease = min(-difference, sequence[pos] - 1)
+                sequence[pos] -= decrease
+                difference += decrease
+
+        # Check if we achieved the exact average
+        if abs(sum(sequence) - target_sum) < 0.001:
+            actual_avg = sum(sequence) / sequence_length
+            if abs(actual_avg - target_avg) < 0.001:
+                return sequence
+
+    # Fallback
+    print(f"Warning: Using fallback method for sequence generation")
+    return fallback_sequence(array_size, target_avg, sequence_length, rng)
+
+
+def fallback_sequence(array_size, target_avg, sequence_length, rng=random):
+    """Create a sequence with exact average using a deterministic method"""
+    target_sum = target_avg * sequence_length
+
+    # Start with all values at target_avg (rounded down)
+    base_value = int(target_avg)
+    sequence = [base_value] * sequence_length
+
+    # Calculate how much we need to add to reach the exact sum
+    current_sum = sum(sequence)
+    remainder = target_sum - current_sum
+
+    # Distribute the remainder
+    positions = list(range(sequence_length))
+    rng.shuffle(positions)
+
+    for i, pos in enumerate(positions):
+        if remainder <= 0:
+            break
+
+        if sequence[pos] < array_size:
+            add_amount = min(1, remainder, array_size - sequence[pos])
+            sequence[pos] += add_amount
+            remainder -= add_amount
+
+    return sequence
+
+
+def normal_sequence(array_size, target_avg, sequence_length, rng=random, np_rng=np.random):
+    """
+    Generate a sequence of break points sampled from a normal distribution (bell curve)
+    with the specified target average (mean/median), clamped to [1, array_size].
+    The sum is then moved towards the target by at most one pump per break point, so
+    the average is close to, but not always exactly, target_avg.
+    """
+    mu = target_avg
+    sigma = array_size / 6  # 99.7% of values within [mu-3*sigma, mu+3*sigma]
+    # Sample from normal distribution
+    sequence = np_rng.normal(loc=mu, scale=sigma, size=sequence_length)
+    # Clamp to valid range and round
+    sequence = [int(round(max(1, min(array_size, x)))) for x in sequence]
+    # Adjust to get exact average if needed
+    target_sum = target_avg * sequence_length
+    current_sum = sum(sequence)
+    difference = int(round(target_sum - current_sum))
+    # Distribute difference to bring average closer to target
+    indices = list(range(sequence_length))
+    rng.shuffle(indices)
+    for i in indices:
+        if difference == 0:
+            break
+        if difference > 0 and sequence[i] < array_size:
+            sequence[i] += 1
+            difference -= 1
+        elif difference < 0 and sequence[i] > 1:
+            sequence[i] -= 1
+            difference += 1
+    # Final clamp
+    sequence = [max(1, min(array_size, x)) for x in sequence]
+    return sequence
+
+
+# Block generator of each task version
+GENERATORS = {'v2': exact_average_sequence, 'v3': normal_sequence}
@@ -0,0 +1,63 @@
+"""
+Parallel, cached loading of a directory of per-session data files.
+
+The cohort analyses (bart_analysis, tmt_analysis) each reduce one session
+file to a table; load_files runs that reduction over every matching file in
+a thread pool and concatenates the results. Reduced tables are cached in a
+pickle in the data directory, keyed by file name, size and modification
+time, so a rerun only reads files that are new or have changed since the
+last run; files that have been deleted are dropped from the cache.
+"""
+import glob
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+def load_files(data_dir, pattern, load_file, cache_filename, use_cache=True, workers=8, label='session'):
+    """
+    load_file(filepath) applied to every file in data_dir matching pattern, concatenated in file
+    name order (an empty DataFrame if there is no data), reusing the cache in cache_filename
+    """
+    cache_path = os.path.join(data_dir, cache_filename)
+    cache = {}
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: ignoring unreadable cache {cache_path}: {e}")
+
+    filepaths = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    frames = {}
+    to_load = []
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        key = os.path.basename(filepath)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if key in cache and cache[key][0] == signature:
+            frames[key] = cache[key][1]
+        else:
+            to_load.append((key, filepath, signature))
+
+    if to_load:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = pool.map(lambda item: load_file(item[1]), to_load)
+            for (key, filepath, signature), frame in zip(to_load, loaded):
+                frames[key] = frame
+                cache[key] = (signature, frame)
+
+    # Drop files that no longer exist, and save the cache if anything was loaded or dropped
+    cached_count = len(cache)
+    cache = {key: cache[key] for key in frames}
+    if use_cache and (to_load or len(cache) < cached_count):
+        with open(cache_path, 'wb') as f:
+            pickle.dump(cache, f)
+
+    print(f"Loaded {len(filepaths)} {label}s ({len(to_load)} new or changed, {len(filepaths) - len(to_load)} cached)")
+    non_empty = [frames[key] for key in sorted(frames) if not frames[key].empty]
+    if not non_empty:
+        return pd.DataFrame()
+    return pd.concat(non_empty, ignore_index=True)
@@ -0,0 +1,112 @@
+"""
+Lightweight per-phase frame profiler for PsychoPy task loops.
+
+Each frame is split into named phases. Call start_frame() at the top of the
+loop, mark(phase) after each phase and end_frame() at the bottom. The time
+since the previous mark is added to that phase's column in a preallocated
+NumPy array, so profiling allocates nothing per frame and costs a few
+perf_counter() calls. A frame that runs something outside the normal loop
+(e.g. a blocking animation with its own flips) can be left out with
+discard_frame(), so the percentiles only describe regular loop frames. When profiling is disabled every call returns
+immediately, so it can be switched on and off at runtime in production.
+"""
+import csv
+import time
+
+import numpy as np
+
+
+class FrameProfiler:
+    """Per-phase frame timings stored in a preallocated ring buffer"""
+
+    def __init__(self, phases, max_frames=100000, enabled=True):
+        self.phases = list(phases)
+        self.phase_index = {name: i for i, name in enumerate(self.phases)}
+        self.max_frames = max_frames
+        self.samples = np.zeros((max_frames, len(self.phases)))  # seconds
+        self.enabled = enabled
+        self.frames_recorded = 0  # total frames, including any that wrapped around
+        self.frames_discarded = 0  # frames left out with discard_frame()
+        self._row = 0
+        self._last = 0.0
+        self._in_frame = False
+
+    def toggle(self):
+        """Switch profiling on or off; returns the new state"""
+        self.enabled = not self.enabled
+        self._in_frame = False
+        return self.enabled
+
+    def reset(self):
+        """Forget every recorded frame, e.g. at the start of a trial; keeps the buffer and the on/off state"""
+        self.frames_recorded = 0
+        self.frames_discarded = 0
+        self._in_frame = False
+
+    def start_frame(self):
+        """Begin timing a new frame"""
+        if not self.enabled:
+            return
+        self._row = self.frames_recorded % self.max_frames
+        self.samples[self._row] = 0.0
+        self._last = time.perf_counter()
+        self._in_frame = True
+
+    def mark(self, phase):
+        """Attribute the time since the previous mark to phase (an index into phases)"""
+        if not self._in_frame:
+            return
+        now = time.perf_counter()
+        self.samples[self._row, phase] += now - self._last
+        self._last = now
+
+    def discard_frame(self):
+        """Leave the current frame out of the recorded timings"""
+        if not self._in_frame:
+            return
+        self._in_frame = False
+        self.frames_discarded += 1
+
+    def end_frame(self):
+        """Finish the current frame"""
+        if not self._in_frame:
+            return
+        self._in_frame = False
+        self.frames_recorded += 1
+
+    def recorded(self):
+        """Array (frames, phases) of the frames currently held in the buffer"""
+        return self.samples[:min(self.frames_recorded, self.max_frames)]
+
+    def summary(self):
+        """Per-phase and whole-frame statistics in milliseconds"""
+        samples = self.recorded() * 1000
+        rows = []
+        if not len(samples):
+            return rows
+        columns = np.column_stack([samples, samples.sum(axis=1)])
+        p50, p95, p99 = np.percentile(columns, [50, 95, 99], axis=0)
+        means = columns.mean(axis=0)
+        maxima = columns.max(axis=0)
+        for i, name in enumerate(self.phases + ['frame_total']):
+            rows.append({
+                'Phase': name,
+                'Frames': len(samples),
+                'Mean_ms': round(means[i], 4),
+                'P50_ms': round(p50[i], 4),
+                'P95_ms': round(p95[i], 4),
+                'P99_ms': round(p99[i], 4),
+                'Max_ms': round(maxima[i], 4),
+            })
+        return rows
+
+    def write_summary(self, filepath):
+        """Write summary() to a CSV file; returns False if nothing was recorded"""
+        rows = self.summary()
+        if not rows:
+            return False
+        with open(filepath, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        return True
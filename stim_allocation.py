@@ -0,0 +1,56 @@
+"""
+Check that a PsychoPy task loop does not construct stimuli while it runs.
+
+Building a stimulus (especially a TextStim, which lays out its text) inside
+the trial loop costs time on the frame where it happens. Stimuli should be
+created once during setup and only repositioned or updated afterwards.
+StimulusAllocationCheck counts every stimulus constructed between start()
+and stop(), so a loop can report any allocation it was not meant to make.
+"""
+from psychopy import visual
+
+
+class StimulusAllocationCheck:
+    """Records the class of every PsychoPy stimulus constructed while active"""
+
+    def __init__(self):
+        self.allocated = []
+        self._original_init = None
+
+    @property
+    def active(self):
+        return self._original_init is not None
+
+    def start(self):
+        """Begin counting stimulus constructions"""
+        if self.active:
+            return
+        self.allocated = []
+        original_init = self._original_init = visual.BaseVisualStim.__init__
+        allocated = self.allocated
+
+        def counting_init(stim, *args, **kwargs):
+            allocated.append(type(stim).__name__)
+            original_init(stim, *args, **kwargs)
+
+        visual.BaseVisualStim.__init__ = counting_init
+
+    def stop(self):
+        """Stop counting; returns the list of stimulus class names constructed"""
+        if self.active:
+            visual.BaseVisualStim.__init__ = self._original_init
+            self._original_init = None
+        return self.allocated
+
+    def report(self, context):
+        """Print the result of the check; returns True if nothing was allocated"""
+        allocated = self.stop()
+        if not allocated:
+            print(f"✅ No stimuli allocated in {context}")
+            return True
+        counts = {}
+        for name in allocated:
+            counts[name] = counts.get(name, 0) + 1
+        details = ', '.join(f"{name} x{count}" for name, count in sorted(counts.items()))
+        print(f"⚠️ {len(allocated)} stimuli allocated in {context}: {details}")
+        return False
@@ -0,0 +1,218 @@
+"""
+Synthetic participant for running Trail Making trials without a human.
+
+SyntheticMouse stands in for a PsychoPy event.Mouse (getPos, getPressed,
+clickReset and the no-op setters), so run_trial can be driven headless. It
+clicks the circles of one trial in order, on the core.getTime() clock:
+    - each movement follows a minimum-jerk path, whose position along the
+      straight line from start to end is 10s^3 - 15s^4 + 6s^5 of the way at
+      fraction s of the movement time, as in fast aimed human movements
+    - the movement time follows Fitts' law for the distance and circle size,
+      divided by the speed factor, and ends at a point scattered inside the
+      target circle
+    - after each movement the agent dwells (decision time), presses and
+      holds the button briefly, then waits until the trial has polled the
+      press before it starts the next movement, the way a participant waits
+      for the circle to turn green
+    - with probability error_rate a connection starts with a click on any
+      other circle, pending or already completed, before the agent moves to
+      the right one (at most one per connection)
+
+The agent also records what actually happened, so a headless run can check
+the trial's timing against it: the true time of every press, and how long
+each press took to be seen by a poll asking for press times (CircleMouse,
+once per frame), which is the hit-test latency of the trial loop.
+"""
+import math
+import random
+
+import numpy as np
+from psychopy import core
+
+# Movement time = (FITTS_A + FITTS_B * log2(distance / width + 1)) / speed, in seconds
+FITTS_A = 0.1
+FITTS_B = 0.15
+
+
+def minimum_jerk(start, end, s):
+    """Point a fraction s (0 to 1) of the way through a minimum-jerk movement from start to end"""
+    s = min(max(s, 0.0), 1.0)
+    shape = s ** 3 * (10 - 15 * s + 6 * s * s)
+    return (start[0] + (end[0] - start[0]) * shape, start[1] + (end[1] - start[1]) * shape)
+
+
+def movement_time(distance, width, speed=1.0):
+    """Fitts' law movement time in seconds for a target of the given width"""
+    return (FITTS_A + FITTS_B * math.log2(distance / width + 1)) / speed
+
+
+class SyntheticMouse:
+    """event.Mouse look-alike that clicks the circles of one trial in order"""
+
+    def __init__(self, centres, radius, error_rate=0.0, speed=1.0, dwell=0.25, press_duration=0.08,
+                 start_pos=(0.0, 0.0), rng=None):
+        self.centres = np.asarray(centres, dtype=float)
+        self.radius = radius
+        self.error_rate = error_rate
+        self.speed = speed
+        self.dwell = dwell
+        self.press_duration = press_duration
+        self.rng = rng if rng is not None else random.Random()
+
+        self.pos = tuple(start_pos)
+        self.reset_time = core.getTime()
+        self.start_time = None  # first poll of the trial, when the agent starts moving
+        self.end_time = None  # release of the last correct press
+        self.target = 0  # index of the circle the trial expects next
+        self.step = None  # current movement and click, see _next_step
+        self.erred = False  # a wrong click was made in the current connection
+        self.last_press = None
+
+        # What actually happened, for checking the trial's log
+        self.press_times = []  # true time of each correct press, in click order
+        self.errors = 0  # wrong clicks made
+        self.detection_latencies = []  # seconds from each press to the poll that saw it
+
+    # --- event.Mouse interface ---
+
+    def getPos(self):
+        self._advance(core.getTime())
+        return np.array(self.pos)
+
+    def getPressed(self, getTime=False):
+        now = core.getTime()
+        if getTime and self.start_time is None:
+            self.start_time = now  # the trial's first poll: it is showing, start moving
+        self._advance(now)
+        down = self.step is not None and self.step['press'] <= now < self.step['release']
+        buttons = [int(down), 0, 0]
+        if not getTime:
+            return buttons
+        if self.step is not None and self.step['press'] <= now and self.step['seen'] is None:
+            self.step['seen'] = now
+            self.detection_latencies.append(now - self.step['press'])
+        pressed_at = 0.0
+        if self.last_press is not None and self.last_press > self.reset_time:
+            pressed_at = self.last_press - self.reset_time
+        return buttons, [pressed_at, 0.0, 0.0]
+
+    def clickReset(self, buttons=(0, 1, 2)):
+        self.reset_time = core.getTime()
+
+    def setPos(self, newPos=(0, 0)):
+        self.pos = (float(newPos[0]), float(newPos[1]))
+
+    def setVisible(self, visible):
+        pass
+
+    def isPressedIn(self, shape, buttons=(0, 1, 2)):
+        return False
+
+    # --- agent ---
+
+    @property
+    def finished(self):
+        return self.target >= len(self.centres)
+
+    def _next_step(self, now):
+        """Plan the movement to the next click, starting now from the current position"""
+        target = self.target
+        others = [i for i in range(len(self.centres)) if i != target]
+        # At most one wrong click per connection, so each one is logged
+        correct = not (others and not self.erred and self.rng.random() < self.error_rate)
+        circle = target if correct else self.rng.choice(others)
+
+        # Aim at a point scattered inside the circle
+        angle = self.rng.uniform(0, 2 * math.pi)
+        offset = self.radius * 0.5 * math.sqrt(self.rng.random())
+        end = (self.centres[circle][0] + offset * math.cos(angle), self.centres[circle][1] + offset * math.sin(angle))
+        distance = math.hypot(end[0] - self.pos[0], end[1] - self.pos[1])
+        arrive = now + movement_time(distance, 2 * self.radius, self.speed)
+        press = arrive + self.dwell * self.rng.uniform(0.5, 1.5) / self.speed
+        self.step = {'start': now, 'arrive': arrive, 'from': self.pos, 'to': end, 'press': press,
+                     'release': press + self.press_duration, 'correct': correct, 'seen': None}
+
+    def _advance(self, now):
+        """Move the agent on to time now"""
+        if self.start_time is None or self.finished:
+            return
+        while True:
+            if self.step is None:
+                self._next_step(now)
+            step = self.step
+            if now < step['arrive']:
+                duration = step['arrive'] - step['start']
+                self.pos = minimum_jerk(step['from'], step['to'], (now - step['start']) / duration)
+                return
+            self.pos = step['to']
+            if now < step['press']:
+                return
+            if self.last_press != step['press']:
+                self.last_press = step['press']
+                if step['correct']:
+                    self.press_times.append(step['press'])
+                else:
+                    self.errors += 1
+                    self.erred = True
+            # The next movement starts once the press is released and the trial has seen it
+            if now < step['release'] or step['seen'] is None:
+                return
+            if step['correct']:
+                self.target += 1
+                self.erred = False
+                if self.finished:
+                    self.end_time = step['release']
+                    return
+            self.step = None
+
+
+class MouseAgent:
+    """Hands each trial a new SyntheticMouse with the same parameters and one random stream"""
+
+    def __init__(self, error_rate=0.05, speed=1.0, seed=None):
+        self.error_rate = error_rate
+        self.speed = speed
+        self.rng = random.Random(seed)
+        self.current = None  # mouse of the latest trial
+        self.circle_states = None  # circle states at the end of the latest trial, set by run_trial
+
+    def mouse(self, win, positions, radius):
+        """Mouse for a trial with circles of the given radius at positions"""
+        self.current = SyntheticMouse(positions, radius, error_rate=self.error_rate, speed=self.speed, rng=self.rng)
+        return self.current
+
+
+def trial_timing(mouse, flip_times, logged_total_times_ms, logged_errors):
+    """
+    Frame, hit-test and logged-RT measures of one agent-driven trial, with what the trial logged
+    next to what the agent did. flip_times are win.flip() timestamps (only those while the agent
+    was active are used); logged_total_times_ms are the trial's Total_Time_ms values in click
+    order and logged_errors its total wrong clicks. The RT error
+    compares the logged time between consecutive correct clicks with the agent's true one.
+    """
+    flips = np.asarray(flip_times, dtype=float)
+    if mouse.start_time is not None and mouse.end_time is not None:
+        flips = flips[(flips >= mouse.start_time) & (flips <= mouse.end_time)]
+    frames = np.diff(flips) * 1000
+    latencies = np.asarray(mouse.detection_latencies) * 1000
+    logged = np.diff(np.asarray(logged_total_times_ms, dtype=float))
+    true = np.diff(np.asarray(mouse.press_times)) * 1000
+    n = min(len(logged), len(true))
+    rt_errors = np.abs(logged[:n] - true[:n])
+
+    def stat(values, f):
+        return round(float(f(values)), 3) if len(values) else float('nan')
+
+    return {
+        'frames': len(frames),
+        'frame_mean_ms': stat(frames, np.mean),
+        'frame_p95_ms': stat(frames, lambda v: np.percentile(v, 95)),
+        'frame_max_ms': stat(frames, np.max),
+        'hit_test_mean_ms': stat(latencies, np.mean),
+        'hit_test_max_ms': stat(latencies, np.max),
+        'rt_error_max_ms': stat(rt_errors, np.max),
+        'clicks_logged': len(logged_total_times_ms),
+        'clicks_made': len(mouse.press_times),
+        'errors_logged': logged_errors,
+        'errors_made': mouse.errors,
+    }
@@ -0,0 +1,179 @@
+"""
+Cohort-level analysis of Trail Making sessions in the "Trailmaking Data" directory.
+
+Loads every *_TMT_Master.csv in parallel, reduces each file to one row per
+trial and reports:
+    - per-trial completion time, mean connection time and error totals
+    - ascending vs descending cost per participant and trial type
+    - mixed vs single-category switch cost (mean connection time in trials that
+      alternate between categories minus trials with one category)
+    - category-order effects across the experimental trials
+
+A trial's direction is read from the log's Direction column (from the trial
+name in files written before it was logged). Its category order is read from
+the items it was clicked in, so it does not need to be logged separately. Trials with fewer connections than the most
+any participant made in a trial of that name (skipped with escape) are kept
+in the per-trial table but left out of the summaries.
+
+Per-file trial tables are cached by name, size and modification time (see
+cohort_loader), so a rerun only reads files that are new or have changed
+since the last run.
+
+Usage:
+    python tmt_analysis.py ["Trailmaking Data"] [--output "Trailmaking Data/Analysis"]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from background_csv import is_complete
+from cohort_loader import load_files
+
+DATA_PATTERN = '*_TMT_Master.csv'
+CACHE_FILENAME = '.tmt_analysis_cache.pkl'
+
+COLUMN_TYPES = {
+    'Participant_Treatment': 'string',
+    'Trial_Name': 'string',
+    'Connection': 'string',
+    'Reaction_Time_ms': 'float64',
+    'Total_Time_ms': 'float64',
+    'Wrong_Guesses_Before_Correct_One': 'int16',
+}
+
+
+def item_categories(items):
+    """Category of each clicked item: numbers, letters or shapes"""
+    return pd.Series(
+        np.select([items.str.isdigit(), items.str.len() == 1], ['numbers', 'letters'], 'shapes'),
+        index=items.index
+    )
+
+
+def load_session_file(filepath):
+    """Read one TMT master CSV and reduce it to one typed row per trial"""
+    frame = pd.read_csv(filepath, dtype=str, keep_default_na=False, comment='#')
+    if frame.empty:
+        return pd.DataFrame()
+    frame = frame.astype(COLUMN_TYPES)
+    if 'Timing_Uncertainty_ms' in frame:
+        frame['Timing_Uncertainty_ms'] = frame['Timing_Uncertainty_ms'].astype(float)
+    else:  # written before timing uncertainty was logged
+        frame['Timing_Uncertainty_ms'] = np.nan
+
+    if 'Direction' not in frame:  # written before the direction was logged: read it from the trial name
+        frame['Direction'] = np.where(frame['Trial_Name'].str.contains('Desc'), 'descending', 'ascending')
+
+    # Category order: categories of the clicked items in order of first appearance
+    frame['Category'] = item_categories(frame['Connection'].str.rsplit('-', n=1).str[-1])
+    order = (frame.drop_duplicates(['Trial_Name', 'Category'])
+             .groupby('Trial_Name', sort=False)['Category'].agg(' → '.join))
+
+    trials = frame.groupby('Trial_Name', sort=False).agg(
+        Participant_Treatment=('Participant_Treatment', 'first'),
+        Direction=('Direction', 'first'),
+        Connections=('Connection', 'size'),
+        Completion_Time_ms=('Total_Time_ms', 'max'),
+        Mean_RT_ms=('Reaction_Time_ms', 'mean'),
+        Median_RT_ms=('Reaction_Time_ms', 'median'),
+        Errors=('Wrong_Guesses_Before_Correct_One', 'sum'),
+        Max_Timing_Uncertainty_ms=('Timing_Uncertainty_ms', 'max'),
+    ).reset_index()
+    trials['Error_Free'] = trials['Errors'] == 0
+    trials['Categories'] = trials['Trial_Name'].map(order)
+    trials['Num_Categories'] = trials['Categories'].str.count('→') + 1
+    trials['Mixed'] = trials['Num_Categories'] > 1
+    trials['Category_Mix'] = np.where(trials['Mixed'], 'mixed', 'single')
+    trials['Phase'] = trials['Trial_Name'].str.split('_').str[0]
+    trials['Trial_Order'] = np.arange(len(trials), dtype=np.int16)
+    trials['Session'] = os.path.basename(filepath)
+    trials['Session_Complete'] = is_complete(filepath)
+    return trials
+
+
+def load_cohort(data_dir='Trailmaking Data', use_cache=True, workers=8):
+    """Per-trial table of every TMT session in data_dir, reusing cached files"""
+    table = load_files(data_dir, DATA_PATTERN, load_session_file, CACHE_FILENAME, use_cache=use_cache,
+                       workers=workers, label='TMT session')
+    if table.empty:
+        return table
+    for column in ('Trial_Name', 'Categories', 'Category_Mix', 'Direction', 'Phase'):
+        table[column] = table[column].astype('category')
+    # A trial is complete if it has as many connections as the longest trial of that name
+    table['Complete'] = table['Connections'] == table.groupby('Trial_Name', observed=True)['Connections'].transform('max')
+    return table
+
+
+def summarize(table, by):
+    """Grouped trial measures for the given grouping columns"""
+    summary = table.groupby(by, observed=True).agg(
+        trials=('Trial_Name', 'size'),
+        completion_time_ms=('Completion_Time_ms', 'mean'),
+        mean_rt_ms=('Mean_RT_ms', 'mean'),
+        errors=('Errors', 'mean'),
+        error_free_rate=('Error_Free', 'mean'),
+    )
+    return summary.round(2).reset_index()
+
+
+def paired_cost(table, condition, first, second, measures, by=('Participant_Treatment',)):
+    """Per-group mean of measures under two levels of condition, with second minus first as the cost"""
+    means = table.pivot_table(index=list(by), columns=condition, values=measures, aggfunc='mean', observed=True)
+    costs = pd.DataFrame(index=means.index)
+    for measure in measures:
+        if (measure, first) not in means or (measure, second) not in means:
+            continue
+        costs[f'{measure}_{first}'] = means[(measure, first)]
+        costs[f'{measure}_{second}'] = means[(measure, second)]
+        costs[f'{measure}_cost'] = means[(measure, second)] - means[(measure, first)]
+    return costs.round(2).reset_index()
+
+
+def cohort_report(table):
+    """All summary tables, keyed by name"""
+    complete = table[table['Complete']]
+    experimental = complete[complete['Phase'] == 'Experimental']
+    return {
+        'by_trial': table,
+        'by_participant': summarize(complete, ['Participant_Treatment', 'Phase']),
+        'by_trial_name': summarize(complete, ['Trial_Name']),
+        'direction_cost': paired_cost(complete, 'Direction', 'ascending', 'descending',
+                                      ['Completion_Time_ms', 'Mean_RT_ms', 'Errors'],
+                                      by=('Participant_Treatment', 'Phase', 'Category_Mix')),
+        'switch_cost': paired_cost(complete, 'Category_Mix', 'single', 'mixed', ['Mean_RT_ms', 'Errors'],
+                                   by=('Participant_Treatment', 'Direction')),
+        'category_order': summarize(experimental, ['Direction', 'Categories']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort-level Trail Making analysis")
+    parser.add_argument('data_dir', nargs='?', default='Trailmaking Data')
+    parser.add_argument('--output', help="directory for summary CSVs (default: <data_dir>/Analysis)")
+    parser.add_argument('--no-cache', action='store_true', help="re-read every file")
+    args = parser.parse_args()
+
+    table = load_cohort(args.data_dir, use_cache=not args.no_cache)
+    if table.empty:
+        print("No TMT data found.")
+        return
+
+    report = cohort_report(table)
+    output_dir = args.output or os.path.join(args.data_dir, 'Analysis')
+    os.makedirs(output_dir, exist_ok=True)
+    with pd.option_context('display.width', 160, 'display.max_columns', 20):
+        for name, summary in report.items():
+            summary.to_csv(os.path.join(output_dir, f'TMT_{name}.csv'), index=False)
+            if name in ('by_trial_name', 'category_order'):
+                print(f"\n=== {name} ===")
+                print(summary.to_string(index=False))
+    print(f"\nSummary tables saved to: {output_dir}")
+    print(f"Participants: {table['Participant_Treatment'].nunique()}, sessions: {table['Session'].nunique()}, "
+          f"trials: {len(table)} ({(~table['Complete']).sum()} incomplete), "
+          f"sessions without completion trailer: {(~table.groupby('Session')['Session_Complete'].first()).sum()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+Batched rendering for Trail Making trials.
+
+A trial is drawn with four draw calls whatever the number of items:
+    - completed connections as one growing ShapeStim line strip
+    - circle outlines and circle fills as two ElementArrayStims with per-element
+      colours and sizes (an outline is a slightly larger disc behind the fill)
+    - every static label (numbers, letters, shapes and the order/category text)
+      composited once per trial into a single transparent texture
+
+Each circle has a retained state (pending, completed, last clicked, wrong).
+Colours and outline widths live in NumPy arrays that are only written when a
+circle changes state, and pushed to the element arrays at the next draw, so a
+frame in which nothing happened costs no per-circle work at all.
+
+Shapes drawn as separate stimuli (the instruction rows) take their vertices
+from a cache keyed by shape and size, and come from a per-window ShapePool
+that repositions existing stimuli instead of building new ones.
+"""
+import functools
+import weakref
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from psychopy import visual
+from psychopy.colors import colorNames
+
+# Rainbow colours for shapes, in order of increasing sides
+SHAPE_COLORS = {
+    'triangle': 'red',      # 3 sides
+    'square': 'orange',     # 4 sides
+    'pentagon': 'yellow',   # 5 sides
+    'hexagon': 'green',     # 6 sides
+    'heptagon': 'blue',     # 7 sides
+    'octagon': 'indigo',    # 8 sides
+    'nonagon': 'purple',    # 9 sides (using purple for indigo)
+    'decagon': 'violet'     # 10 sides
+}
+
+SHAPE_SIDES = {
+    'triangle': 3, 'pentagon': 5, 'hexagon': 6, 'heptagon': 7, 'octagon': 8,
+    'nonagon': 9, 'decagon': 10
+}
+
+# Circle states and their (fill colour, outline colour, highlighted outline)
+PENDING, COMPLETED, LAST_CLICKED, WRONG = range(4)
+CIRCLE_STYLES = {
+    PENDING: ('lightgray', 'black', False),
+    COMPLETED: ('lightgreen', 'black', False),
+    LAST_CLICKED: ('lightgreen', 'yellowgreen', True),
+    WRONG: ('lightcoral', 'black', False),  # clicked wrong during the current connection
+}
+
+# Font files tried in order for the label layer (Windows names first, then common Linux/macOS fonts)
+FONT_FILES = ['arial.ttf', 'Arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf']
+BOLD_FONT_FILES = ['arialbd.ttf', 'Arial Bold.ttf', 'DejaVuSans-Bold.ttf', 'LiberationSans-Bold.ttf']
+
+
+def named_rgb(color):
+    """PsychoPy rgb (-1 to 1) triple for a colour name"""
+    return np.array(colorNames[color.lower()][:3], dtype=float)
+
+
+@functools.lru_cache(maxsize=None)
+def shape_vertices(shape_name, size):
+    """Polygon vertices (k, 2) in pix of a regular shape with the given radius, cached and read-only"""
+    n_sides = SHAPE_SIDES[shape_name]
+    angles = np.arange(n_sides) * 2 * np.pi / n_sides - np.pi / 2
+    vertices = size * np.column_stack([np.cos(angles), np.sin(angles)])
+    vertices.flags.writeable = False
+    return vertices
+
+
+def build_shape(win, shape_name, size, fill_color, line_color, line_width):
+    """New stimulus for a named shape: a square, a regular polygon or, for unknown names, a circle"""
+    if shape_name == 'square':
+        return visual.Rect(win, width=size * 1.8, height=size * 1.8,
+                           fillColor=fill_color, lineColor=line_color, lineWidth=line_width)
+    if shape_name in SHAPE_SIDES:
+        return visual.ShapeStim(win, vertices=shape_vertices(shape_name, size),
+                                fillColor=fill_color, lineColor=line_color, lineWidth=line_width)
+    return visual.Circle(win, radius=size, fillColor=fill_color, lineColor=line_color, lineWidth=line_width)
+
+
+class ShapePool:
+    """Shape stimuli of one window, reused and repositioned instead of rebuilt"""
+
+    def __init__(self, win):
+        self.win = win
+        self.free = {}  # (shape, size, fill, line, line width) -> stimuli not in use
+        self.in_use = []
+
+    def acquire(self, shape_name, pos, size, fill_color, line_color, line_width):
+        """A shape stimulus at pos, built only if no matching one is free"""
+        key = (shape_name, size, fill_color, line_color, line_width)
+        free = self.free.get(key)
+        stim = free.pop() if free else build_shape(self.win, shape_name, size, fill_color, line_color, line_width)
+        stim.pos = pos
+        self.in_use.append((key, stim))
+        return stim
+
+    def release_all(self):
+        """Return every acquired stimulus to the pool, e.g. when a new screen starts"""
+        for key, stim in self.in_use:
+            self.free.setdefault(key, []).append(stim)
+        self.in_use = []
+
+
+_shape_pools = weakref.WeakKeyDictionary()
+
+
+def shape_pool(win):
+    """The ShapePool of a window, created on first use"""
+    pool = _shape_pools.get(win)
+    if pool is None:
+        pool = _shape_pools[win] = ShapePool(win)
+    return pool
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(size, bold=False):
+    """TrueType font of the given pixel size, falling back to Pillow's built-in font"""
+    for font_file in (BOLD_FONT_FILES if bold else FONT_FILES):
+        try:
+            return ImageFont.truetype(font_file, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size default font
+        return ImageFont.load_default()
+
+
+def render_label_layer(win_size, labels):
+    """
+    Transparent RGBA image of the whole window with every static label drawn on it.
+    labels is a list of dicts with 'pos' (pix, origin at the centre) and either
+    'text', 'height', 'color', 'bold' for text or 'shape', 'size', 'color',
+    'line_width' for shapes.
+    """
+    width, height = int(win_size[0]), int(win_size[1])
+    image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+
+    for label in labels:
+        x = label['pos'][0] + width / 2
+        y = height / 2 - label['pos'][1]
+        if 'text' in label:
+            font = load_font(int(label['height']), label.get('bold', False))
+            left, top, right, bottom = draw.textbbox((0, 0), label['text'], font=font)
+            draw.text((x - (left + right) / 2, y - (top + bottom) / 2), label['text'],
+                      font=font, fill=label['color'])
+        elif label['shape'] == 'square':
+            half = label['size'] * 0.9
+            draw.rectangle([x - half, y - half, x + half, y + half], fill=label['color'],
+                           outline='black', width=label['line_width'])
+        elif label['shape'] in SHAPE_SIDES:
+            # Image rows run downwards, pix coordinates upwards
+            points = [(x + vx, y - vy) for vx, vy in shape_vertices(label['shape'], label['size'])]
+            draw.polygon(points, fill=label['color'], outline='black', width=label['line_width'])
+        else:
+            # Fallback to circle if shape not recognized
+            r = label['size']
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=label['color'],
+                         outline='black', width=label['line_width'])
+    return image
+
+
+def item_labels(sequence, positions, text_height, shape_size, line_width=2):
+    """Label layer entries for the items of a trial sequence"""
+    labels = []
+    for item, pos in zip(sequence, positions):
+        if isinstance(item, int) or len(item) == 1:  # Number or letter
+            labels.append({'pos': pos, 'text': str(item), 'height': text_height, 'color': 'black'})
+        else:  # Shape
+            labels.append({'pos': pos, 'shape': item, 'size': shape_size,
+                           'color': SHAPE_COLORS.get(item, 'white'), 'line_width': line_width})
+    return labels
+
+
+class TrialDisplay:
+    """Circles, completed path and label layer of one TMT trial, drawn in four calls"""
+
+    def __init__(self, win, positions, labels, circle_radius, outline_width, highlight_width, line_width,
+                 path_color='red', label_image=None):
+        self.win = win
+        self.positions = np.asarray(positions, dtype=float)
+        self.circle_radius = circle_radius
+        n = len(self.positions)
+
+        # Fill colour, outline colour and outline width of each state, converted once
+        self.styles = {
+            state: (named_rgb(fill), named_rgb(outline), float(highlight_width if highlighted else outline_width))
+            for state, (fill, outline, highlighted) in CIRCLE_STYLES.items()
+        }
+
+        # Per-circle state, pushed to the element arrays when it changes
+        self.states = np.full(n, PENDING, dtype=np.int8)
+        fill, outline, width = self.styles[PENDING]
+        self.fill_colors = np.tile(fill, (n, 1))
+        self.outline_colors = np.tile(outline, (n, 1))
+        self.outline_widths = np.full(n, width)
+        self._dirty = False
+
+        self.outlines = visual.ElementArrayStim(
+            win, units='pix', nElements=n, xys=self.positions,
+            sizes=2 * circle_radius + self.outline_widths, colors=self.outline_colors, colorSpace='rgb',
+            elementTex=None, elementMask='circle', texRes=256, fieldShape='sqr'
+        )
+        self.fills = visual.ElementArrayStim(
+            win, units='pix', nElements=n, xys=self.positions,
+            sizes=2 * circle_radius - self.outline_widths, colors=self.fill_colors, colorSpace='rgb',
+            elementTex=None, elementMask='circle', texRes=256, fieldShape='sqr'
+        )
+
+        # Completed connections: one line strip through the clicked circles
+        self.path_points = np.zeros((n, 2))
+        self.path_count = 0
+        self.path = visual.ShapeStim(
+            win, units='pix', vertices=self.positions[:2] if n > 1 else [[0, 0], [0, 0]],
+            closeShape=False, fillColor=None, lineColor=path_color, lineWidth=line_width
+        )
+
+        # The label image can be rendered beforehand (e.g. in a worker thread) and passed in
+        if label_image is None:
+            label_image = render_label_layer(win.size, labels)
+        self.label_layer = visual.ImageStim(
+            win, image=label_image, units='pix',
+            size=(int(win.size[0]), int(win.size[1])), interpolate=False
+        )
+
+    def set_state(self, index, state):
+        """Move circle index to a new state; its colours change at the next draw"""
+        if self.states[index] == state:
+            return
+        self.states[index] = state
+        self.fill_colors[index], self.outline_colors[index], self.outline_widths[index] = self.styles[state]
+        self._dirty = True
+
+    def add_to_path(self, index):
+        """Extend the completed path to circle index"""
+        self.path_points[self.path_count] = self.positions[index]
+        self.path_count += 1
+        if self.path_count >= 2:
+            self.path.vertices = self.path_points[:self.path_count]
+
+    def update(self):
+        """Push circle state changes since the last frame to the element arrays"""
+        if self._dirty:
+            self.outlines.colors = self.outline_colors
+            self.outlines.sizes = 2 * self.circle_radius + self.outline_widths
+            self.fills.colors = self.fill_colors
+            self.fills.sizes = 2 * self.circle_radius - self.outline_widths
+            self._dirty = False
+
+    def draw_path(self):
+        if self.path_count >= 2:
+            self.path.draw()
+
+    def draw_circles(self):
+        self.outlines.draw()
+        self.fills.draw()
+
+    def draw_labels(self):
+        self.label_layer.draw()
+
+    def draw(self):
+        """Update and draw everything; a profiled loop can call the four steps itself"""
+        self.update()
+        self.draw_path()
+        self.draw_circles()
+        self.draw_labels()
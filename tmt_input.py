@@ -0,0 +1,89 @@
+"""
+Mouse input for Trail Making trials as circle events.
+
+CircleMouse polls a PsychoPy mouse once per frame and reports what happened
+in terms of the trial's circles: the button being pressed over one and
+released again. The circle under the mouse is tracked in hover to place
+presses, but not reported as an event, since the trial loop has no use for
+it. Presses and releases are edge-triggered, so a held button produces one
+press however many frames it stays down and the trial loop never has to wait
+for the release. Each
+press carries the time PsychoPy recorded for the button-down event, on the
+core.getTime() clock that win.flip() timestamps also use, rather than the
+time of the frame that noticed it. PsychoPy stamps the event when it is
+dispatched, so press_uncertainty gives the span since the previous poll in
+which the button actually went down.
+
+The circle under the mouse is found with one vectorized distance test against
+all circle centres, and only when the mouse has moved since the last poll, so
+hit testing costs the same for any number of circles.
+"""
+import numpy as np
+from psychopy import core
+
+# Event types returned by CircleMouse.poll, each paired with a circle index
+PRESS = 'press'
+RELEASE = 'release'
+
+
+class CircleMouse:
+    """Press and release events on a set of equal-sized circles"""
+
+    def __init__(self, mouse, centres, radius):
+        self.mouse = mouse
+        self.centres = np.asarray(centres, dtype=float)
+        self.radius_sq = radius * radius
+        self.pos = None
+        self.hover = None  # index of the circle under the mouse
+        self.button_down = False
+        self.press_time = 0.0  # PsychoPy's time of the last button-down, from the last reset
+        self.pressed_circle = None  # circle the button went down over, reported with the release
+        self.reset_time = core.getTime()
+        self.poll_time = self.reset_time
+        self.press_uncertainty = 0.0  # seconds between the previous poll and the one that saw the last press
+
+    def reset(self):
+        """Restart PsychoPy's click clock, keeping press times on the core.getTime() clock"""
+        self.mouse.clickReset()
+        self.reset_time = core.getTime()
+        self.press_time = 0.0
+
+    def circle_at(self, pos):
+        """Index of the circle containing pos, or None"""
+        if not len(self.centres):
+            return None
+        dx = self.centres[:, 0] - pos[0]
+        dy = self.centres[:, 1] - pos[1]
+        distances_sq = dx * dx + dy * dy
+        nearest = int(np.argmin(distances_sq))
+        return nearest if distances_sq[nearest] <= self.radius_sq else None
+
+    def poll(self):
+        """List of (event type, circle index, time) for this frame; time is only set for presses"""
+        events = []
+        previous_poll, self.poll_time = self.poll_time, core.getTime()
+        pos = self.mouse.getPos()
+        if self.pos is None or pos[0] != self.pos[0] or pos[1] != self.pos[1]:
+            self.pos = (pos[0], pos[1])
+            self.hover = self.circle_at(self.pos)
+
+        buttons, times = self.mouse.getPressed(getTime=True)
+        down = bool(buttons[0])
+        # A new button-down time also catches a press released again within one frame
+        new_press = (down and not self.button_down) or times[0] > self.press_time
+        if new_press:
+            if self.button_down:
+                events.append((RELEASE, self.pressed_circle, None))
+            self.press_time = times[0]
+            self.pressed_circle = self.hover
+            self.press_uncertainty = self.poll_time - previous_poll
+            # Without a recorded button-down time, the press is only known to precede this poll
+            press_time = self.reset_time + self.press_time if self.press_time > 0 else self.poll_time
+            if self.hover is not None:
+                events.append((PRESS, self.hover, press_time))
+            if not down:
+                events.append((RELEASE, self.pressed_circle, None))
+        elif self.button_down and not down:
+            events.append((RELEASE, self.pressed_circle, None))
+        self.button_down = down
+        return events
@@ -0,0 +1,388 @@
+"""
+Circle layouts for the Trail Making Test.
+
+poisson_disk_sample first throws uniform random darts in vectorized batches:
+each batch is tested against the accepted points through a SpatialHash, whose
+cells of min_distance / sqrt(2) hold at most one point each, so a candidate
+only looks at a fixed 5x5 block of cells. This places typical layouts in well
+under a millisecond. Layouts too dense for that fall back to Bridson's
+Poisson-disk algorithm, which fills the whole area until no more points fit
+in O(N); the requested number of points is then drawn at random from that
+sample, so points are spread evenly over the whole area. If even that cannot
+hold the requested count, a ValueError is raised instead of silently
+returning fewer points.
+
+LayoutBank holds thousands of layouts per item count, generated offline at a
+reference screen size and scored by path length, mean inter-target distance
+and crossings between path segments, so trials can use layouts of matched
+difficulty instead of whatever a random draw produces. Layouts count as
+matched when each of the three measures is separately close to the bank's
+median (MATCH_TOLERANCE, CROSSING_TOLERANCE), so no measure can make up for
+another. The bank file is not
+part of the repository and the task never builds it (that takes minutes), so
+build or rebuild it once per installation with:
+    python tmt_layout.py [--count 5000] [--items 6 18r 25]
+where an "r" suffix reserves the bottom of the screen for the order/category labels.
+"""
+import argparse
+import os
+
+import numpy as np
+
+# Layouts in the bank are generated for this screen and circle radius and scaled to the actual screen
+REFERENCE_SIZE = (1920, 1080)
+REFERENCE_RADIUS = 45
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmt_layout_bank.npz')
+# (item count, bottom of screen reserved for labels) combinations used by the task
+DEFAULT_LAYOUT_CONFIGS = ((6, False), (18, True))
+# Matched layouts: path length and mean target distance within this fraction of the bank's
+# median, and crossings within CROSSING_TOLERANCE of its median count
+MATCH_TOLERANCE = 0.03
+CROSSING_TOLERANCE = 1
+
+
+def layout_bounds(circle_radius, win_size, reserve_bottom=False):
+    """(x_min, x_max, y_min, y_max) area for circle centres, optionally keeping the bottom 30% free for labels"""
+    margin = circle_radius * 2
+    bottom_margin = int(win_size[1] * 0.3) if reserve_bottom else margin
+    return (-win_size[0]//2 + margin, win_size[0]//2 - margin,
+            -win_size[1]//2 + bottom_margin, win_size[1]//2 - margin)
+
+
+def poisson_disk_sample(num_points, min_distance, bounds, rng=None, candidates=30, max_passes=10):
+    """
+    Array (num_points, 2) of points at least min_distance apart inside
+    bounds = (x_min, x_max, y_min, y_max). Raises ValueError if they do not fit.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    x_min, x_max, y_min, y_max = bounds
+    if num_points <= 0:
+        return np.zeros((0, 2))
+    if x_max <= x_min or y_max <= y_min:
+        raise ValueError(f"Layout area {bounds} is empty; cannot place {num_points} circles")
+
+    points = _dart_throw(num_points, min_distance, bounds, rng)
+    if points is not None:
+        return points
+
+    most_placed = 0
+    for _ in range(max_passes):
+        points = _bridson_pass(min_distance, bounds, rng, candidates)
+        if len(points) >= num_points:
+            chosen = rng.choice(len(points), size=num_points, replace=False)
+            return points[chosen]
+        most_placed = max(most_placed, len(points))
+
+    raise ValueError(f"Could only fit {most_placed} of {num_points} circles "
+                     f"{min_distance:.0f} px apart in area {bounds}")
+
+
+def overlapping(points, existing, min_distance):
+    """Boolean mask of the points that lie closer than min_distance to any existing point"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    existing = np.asarray(existing, dtype=float).reshape(-1, 2)
+    if not len(existing):
+        return np.zeros(len(points), dtype=bool)
+    dx = points[:, 0, None] - existing[None, :, 0]
+    dy = points[:, 1, None] - existing[None, :, 1]
+    return (dx * dx + dy * dy < min_distance * min_distance).any(axis=1)
+
+
+def overlapping_pairs(points, min_distance):
+    """Boolean matrix of which pairs of points lie closer than min_distance (diagonal included)"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    dx = points[:, 0, None] - points[None, :, 0]
+    dy = points[:, 1, None] - points[None, :, 1]
+    return dx * dx + dy * dy < min_distance * min_distance
+
+
+class SpatialHash:
+    """
+    Uniform grid over a fixed area holding at most one point per cell, for
+    neighbour lookups in constant time. cell_size must not exceed the smallest
+    spacing between points divided by sqrt(2).
+    """
+
+    def __init__(self, bounds, cell_size):
+        self.x_min, x_max, self.y_min, y_max = bounds
+        self.cell_size = cell_size
+        self.cols = max(int(np.ceil((x_max - self.x_min) / cell_size)), 1)
+        self.rows = max(int(np.ceil((y_max - self.y_min) / cell_size)), 1)
+        self.grid = np.full((self.rows, self.cols), -1, dtype=np.int32)  # point index per cell
+        self.points = np.zeros((self.rows * self.cols, 2))
+        self.count = 0
+
+    def cells(self, points):
+        """(row, col) arrays of the cells containing points, clipped to the grid"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cols = ((points[:, 0] - self.x_min) // self.cell_size).astype(np.int64)
+        rows = ((points[:, 1] - self.y_min) // self.cell_size).astype(np.int64)
+        return np.clip(rows, 0, self.rows - 1), np.clip(cols, 0, self.cols - 1)
+
+    def insert(self, point):
+        """Add a point; returns its index"""
+        rows, cols = self.cells(point)
+        index = self.count
+        self.grid[rows[0], cols[0]] = index
+        self.points[index] = point
+        self.count += 1
+        return index
+
+    def insert_many(self, points):
+        """Add several points at once; returns their indices"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        indices = np.arange(self.count, self.count + len(points))
+        rows, cols = self.cells(points)
+        self.grid[rows, cols] = indices
+        self.points[indices] = points
+        self.count += len(points)
+        return indices
+
+    def neighbours(self, points, distance):
+        """(len(points), m) array of indices of points in the cells within distance of each point; -1 pads"""
+        reach = int(np.ceil(distance / self.cell_size))
+        rows, cols = self.cells(points)
+        offsets = np.arange(-reach, reach + 1)
+        rows = rows[:, None, None] + offsets[None, :, None]
+        cols = cols[:, None, None] + offsets[None, None, :]
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        indices = self.grid[np.clip(rows, 0, self.rows - 1), np.clip(cols, 0, self.cols - 1)]
+        return np.where(inside, indices, -1).reshape(len(indices), -1)
+
+    def within(self, points, distance):
+        """Boolean mask of the points that lie closer than distance to any stored point"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        indices = self.neighbours(points, distance)
+        neighbours = self.points[indices]
+        dx = neighbours[:, :, 0] - points[:, 0, None]
+        dy = neighbours[:, :, 1] - points[:, 1, None]
+        return ((dx * dx + dy * dy < distance * distance) & (indices >= 0)).any(axis=1)
+
+
+def _dart_throw(num_points, min_distance, bounds, rng, batches=8):
+    """Uniform random points in vectorized batches; None if they do not all fit within the batch budget"""
+    x_min, x_max, y_min, y_max = bounds
+    spatial_hash = SpatialHash(bounds, min_distance / np.sqrt(2))
+    for _ in range(batches):
+        needed = num_points - spatial_hash.count
+        trial_points = rng.random((2 * needed + 16, 2)) * (x_max - x_min, y_max - y_min) + (x_min, y_min)
+        trial_points = trial_points[~spatial_hash.within(trial_points, min_distance)]
+        # Within the batch, keep a point only if no earlier point in the batch is too close to it
+        close = np.triu(overlapping_pairs(trial_points, min_distance), 1)
+        trial_points = trial_points[~close.any(axis=0)]
+        spatial_hash.insert_many(trial_points[:needed])
+        if spatial_hash.count == num_points:
+            return spatial_hash.points[:num_points].copy()
+    return None
+
+
+def _bridson_pass(min_distance, bounds, rng, candidates):
+    """One maximal Poisson-disk sample of the whole area"""
+    x_min, x_max, y_min, y_max = bounds
+    width = x_max - x_min
+    height = y_max - y_min
+    spatial_hash = SpatialHash(bounds, min_distance / np.sqrt(2))
+    active = [spatial_hash.insert((x_min + rng.random() * width, y_min + rng.random() * height))]
+
+    while active:
+        slot = int(rng.integers(len(active)))
+        # Candidates spread uniformly over the annulus between r and 2r around the active point
+        radii = min_distance * np.sqrt(1 + 3 * rng.random(candidates))
+        angles = 2 * np.pi * rng.random(candidates)
+        trial_points = spatial_hash.points[active[slot]] + np.column_stack([radii * np.cos(angles),
+                                                                              radii * np.sin(angles)])
+        inside = ((trial_points[:, 0] >= x_min) & (trial_points[:, 0] < x_max) &
+                  (trial_points[:, 1] >= y_min) & (trial_points[:, 1] < y_max))
+        free = np.flatnonzero(inside)
+        free = free[~spatial_hash.within(trial_points[free], min_distance)]
+        if len(free):
+            active.append(spatial_hash.insert(trial_points[free[0]]))
+        else:
+            active[slot] = active[-1]
+            active.pop()
+
+    return spatial_hash.points[:spatial_hash.count].copy()
+
+
+def count_crossings(layouts):
+    """Number of pairs of non-adjacent path segments that cross, for each layout in an array (L, n, 2)"""
+    starts = layouts[:, :-1, None, :]
+    ends = layouts[:, 1:, None, :]
+    other_starts = layouts[:, None, :-1, :]
+    other_ends = layouts[:, None, 1:, :]
+
+    def side(a, b, c):
+        # Sign of the cross product (b - a) x (c - a): which side of line a-b point c lies on
+        return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) -
+                       (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+
+    crosses = ((side(starts, ends, other_starts) * side(starts, ends, other_ends) < 0) &
+               (side(other_starts, other_ends, starts) * side(other_starts, other_ends, ends) < 0))
+    segments = layouts.shape[1] - 1
+    non_adjacent = np.triu(np.ones((segments, segments), dtype=bool), 2)
+    return (crosses & non_adjacent).sum(axis=(1, 2))
+
+
+def score_layouts(layouts):
+    """
+    Path length, mean distance between targets and number of path crossings for an
+    array (L, n, 2) of layouts whose points are in the order they are clicked.
+    """
+    layouts = np.asarray(layouts, dtype=float)
+    steps = np.diff(layouts, axis=1)
+    path_length = np.hypot(steps[..., 0], steps[..., 1]).sum(axis=1)
+    n = layouts.shape[1]
+    offsets = layouts[:, :, None, :] - layouts[:, None, :, :]
+    mean_distance = np.hypot(offsets[..., 0], offsets[..., 1]).sum(axis=(1, 2)) / (n * (n - 1))
+    return path_length, mean_distance, count_crossings(layouts)
+
+
+def layout_key(num_elements, reserve_bottom):
+    """Name of one item count / label reservation combination in the bank file"""
+    return f"{num_elements}_reserve" if reserve_bottom else f"{num_elements}"
+
+
+def build_layouts(num_elements, reserve_bottom, count=5000, rng=None, chunk=500):
+    """Generate and score count layouts at the reference screen size, sorted by difficulty"""
+    rng = rng if rng is not None else np.random.default_rng()
+    bounds = layout_bounds(REFERENCE_RADIUS, REFERENCE_SIZE, reserve_bottom)
+    layouts = np.array([poisson_disk_sample(num_elements, REFERENCE_RADIUS * 2, bounds, rng=rng)
+                        for _ in range(count)], dtype=np.float32)
+
+    path_length = np.zeros(count)
+    mean_distance = np.zeros(count)
+    crossings = np.zeros(count, dtype=np.int32)
+    for start in range(0, count, chunk):
+        part = slice(start, start + chunk)
+        path_length[part], mean_distance[part], crossings[part] = score_layouts(layouts[part])
+
+    # Difficulty: mean of the z-scored measures (longer, more spread out and more tangled paths take longer)
+    measures = np.column_stack([path_length, mean_distance, crossings])
+    spread = measures.std(axis=0)
+    spread[spread == 0] = 1
+    difficulty = ((measures - measures.mean(axis=0)) / spread).mean(axis=1)
+
+    order = np.argsort(difficulty)
+    return {
+        'positions': layouts[order],
+        'path_length': path_length[order],
+        'mean_distance': mean_distance[order],
+        'crossings': crossings[order],
+        'difficulty': difficulty[order],
+    }
+
+
+class LayoutBank:
+    """Precomputed TMT layouts per item count, sorted by difficulty"""
+
+    def __init__(self, arrays, rng=None):
+        self.arrays = arrays  # '<field>_<key>' -> array, as stored in the bank file
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.used = {}  # key -> indices already handed out this session
+        self.matched_indices = {}  # key -> indices of its matched layouts
+
+    def has(self, num_elements, reserve_bottom):
+        return f"positions_{layout_key(num_elements, reserve_bottom)}" in self.arrays
+
+    def add(self, num_elements, reserve_bottom, layouts):
+        """Store the output of build_layouts"""
+        key = layout_key(num_elements, reserve_bottom)
+        for field, values in layouts.items():
+            self.arrays[f"{field}_{key}"] = values
+
+    def save(self, path=DEFAULT_BANK_PATH):
+        np.savez_compressed(path, **self.arrays)
+
+    def matched(self, num_elements, reserve_bottom):
+        """Indices of the matched layouts of one combination (at least the two closest to the median)"""
+        key = layout_key(num_elements, reserve_bottom)
+        if key not in self.matched_indices:
+            self.matched_indices[key] = matched_indices(*(self.arrays[f"{field}_{key}"] for field in
+                                                          ('path_length', 'mean_distance', 'crossings')))
+        return self.matched_indices[key]
+
+    def draw(self, num_elements, reserve_bottom, count=1):
+        """
+        count different layouts (n, 2) in reference pixels, picked at random from the matched
+        layouts, never repeating one already used this session while enough others remain.
+        """
+        key = layout_key(num_elements, reserve_bottom)
+        matched = self.matched(num_elements, reserve_bottom)
+        used = self.used.setdefault(key, set())
+        unused = [index for index in matched if index not in used]
+        indices = self.rng.choice(unused if len(unused) >= count else matched, count, replace=False)
+        used.update(int(index) for index in indices)
+        return [self.arrays[f"positions_{key}"][index].astype(float) for index in indices]
+
+    def matched_pair(self, num_elements, reserve_bottom):
+        """
+        Two different matched layouts, for the two trials of a layout group. They are not
+        mirror images of one layout, so the second trial does not repeat the path shape of the first.
+        """
+        return self.draw(num_elements, reserve_bottom, count=2)
+
+
+def matched_indices(path_length, mean_distance, crossings):
+    """
+    Indices of the layouts whose path length, mean target distance and crossings are each
+    within tolerance of their median. If fewer than two are, the two with the smallest
+    largest deviation (relative to its tolerance) are used, so a pair can always be drawn.
+    """
+    deviation = np.maximum.reduce([
+        np.abs(path_length / np.median(path_length) - 1) / MATCH_TOLERANCE,
+        np.abs(mean_distance / np.median(mean_distance) - 1) / MATCH_TOLERANCE,
+        np.abs(crossings - np.median(crossings)) / CROSSING_TOLERANCE,
+    ])
+    matched = np.flatnonzero(deviation <= 1)
+    if len(matched) < 2:
+        matched = np.argsort(deviation)[:2]
+    return matched
+
+
+def load_layout_bank(path=DEFAULT_BANK_PATH, rng=None):
+    """Load the layout bank; it is empty if the file has not been built"""
+    arrays = dict(np.load(path)) if os.path.exists(path) else {}
+    return LayoutBank(arrays, rng=rng)
+
+
+def build_layout_bank(path=DEFAULT_BANK_PATH, configs=DEFAULT_LAYOUT_CONFIGS, count=5000):
+    """Build and save any (item count, reserve) combination the bank at path lacks"""
+    bank = load_layout_bank(path)
+    missing = [config for config in configs if not bank.has(*config)]
+    for num_elements, reserve_bottom in missing:
+        print(f"Building TMT layout bank for {num_elements} items ({count} layouts)...")
+        bank.add(num_elements, reserve_bottom, build_layouts(num_elements, reserve_bottom, count,
+                                                             rng=np.random.default_rng(num_elements)))
+    if missing:
+        bank.save(path)
+    return bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the difficulty-scored TMT layout bank")
+    parser.add_argument('--count', type=int, default=5000, help="layouts per item count")
+    parser.add_argument('--output', default=DEFAULT_BANK_PATH)
+    parser.add_argument('--items', nargs='+', metavar='N[r]',
+                        help="item counts to build, 'r' reserving the label area (default: 6 18r)")
+    args = parser.parse_args()
+
+    configs = DEFAULT_LAYOUT_CONFIGS
+    if args.items:
+        configs = [(int(item.rstrip('r')), item.endswith('r')) for item in args.items]
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    bank = build_layout_bank(args.output, configs=configs, count=args.count)
+    for num_elements, reserve_bottom in configs:
+        key = layout_key(num_elements, reserve_bottom)
+        matched = bank.matched(num_elements, reserve_bottom)
+        print(f"\n{num_elements} items{' (labels reserved)' if reserve_bottom else ''}: "
+              f"{len(matched)} matched layouts")
+        for field in ('path_length', 'mean_distance', 'crossings', 'difficulty'):
+            values = bank.arrays[f"{field}_{key}"]
+            print(f"  {field:14s} all {values.min():8.2f} - {values.max():8.2f}   "
+                  f"matched {values[matched].min():8.2f} - {values[matched].max():8.2f}")
+    print(f"\nLayout bank saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
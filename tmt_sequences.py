@@ -0,0 +1,114 @@
+"""
+Trail Making sequences and trial definitions.
+
+Each category lists its items in ascending order: numbers 1, 2, 3...,
+letters A-Z and shapes by number of sides (triangle to decagon). A sequence
+alternates between its categories in the given order, each running ascending
+or descending; when the categories have different lengths, a category that
+has run out is skipped, so 13 numbers and 12 letters give the standard
+TMT-B 1-A-2-B-...-L-13. Sequences are built once and cached.
+
+TrialSpec carries everything a trial needs explicitly: the categories and
+their lengths, the direction, whether the order/category labels and the
+instruction rows are shown, and the layout group whose trials get a matched
+pair of layouts. Trial code reads these fields instead of inferring the
+trial type from its name or sequence length.
+"""
+import functools
+import string
+from collections import namedtuple
+
+ASCENDING = 'ascending'
+DESCENDING = 'descending'
+
+SHAPE_ORDER = ('triangle', 'square', 'pentagon', 'hexagon', 'heptagon', 'octagon', 'nonagon', 'decagon')
+
+# Largest number of items each category can supply (None: unlimited)
+CATEGORY_LIMITS = {'numbers': None, 'letters': len(string.ascii_uppercase), 'shapes': len(SHAPE_ORDER)}
+
+TrialSpec = namedtuple('TrialSpec', ['name', 'categories', 'direction', 'lengths', 'instructions',
+                                     'show_order', 'layout_group'])
+
+
+@functools.lru_cache(maxsize=None)
+def category_items(category, count):
+    """The first count items of a category in ascending order"""
+    if category not in CATEGORY_LIMITS:
+        raise ValueError(f"Unknown TMT category: {category}")
+    limit = CATEGORY_LIMITS[category]
+    if limit is not None and count > limit:
+        raise ValueError(f"Category {category} has only {limit} items, {count} requested")
+    if category == 'numbers':
+        return tuple(range(1, count + 1))
+    if category == 'letters':
+        return tuple(string.ascii_uppercase[:count])
+    return SHAPE_ORDER[:count]
+
+
+def split_length(length, num_categories):
+    """Items per category for a sequence of length items, earlier categories getting any extra"""
+    base, extra = divmod(length, num_categories)
+    return tuple(base + (1 if i < extra else 0) for i in range(num_categories))
+
+
+@functools.lru_cache(maxsize=None)
+def build_sequence(categories, direction, lengths):
+    """Tuple of items alternating between categories (in order), each with its own length"""
+    runs = []
+    for category, count in zip(categories, lengths):
+        items = category_items(category, count)
+        runs.append(items if direction == ASCENDING else items[::-1])
+    sequence = []
+    for k in range(max(lengths, default=0)):
+        for items in runs:
+            if k < len(items):
+                sequence.append(items[k])
+    return tuple(sequence)
+
+
+def trial_sequence(spec):
+    """Cached item sequence of a trial"""
+    return build_sequence(spec.categories, spec.direction, spec.lengths)
+
+
+def instruction_rows(spec):
+    """(category, items in the order they are clicked) for each instruction row of a trial"""
+    return tuple(
+        (category, build_sequence((category,), spec.direction, (count,)))
+        for category, count in zip(spec.categories, spec.lengths)
+    )
+
+
+def make_trial(name, categories, direction, instructions, length=None, items_per_category=6,
+               show_order=None, layout_group=None):
+    """
+    TrialSpec for a sequence of length items split over the categories, or of items_per_category
+    items each when no length is given. By default trials with several categories show the
+    order/category labels, and each trial has its own layout.
+    """
+    categories = tuple(categories)
+    if length is None:
+        lengths = (items_per_category,) * len(categories)
+    else:
+        lengths = split_length(length, len(categories))
+    for category, count in zip(categories, lengths):
+        category_items(category, count)  # validate now rather than mid-session
+    return TrialSpec(name, categories, direction, lengths, instructions,
+                     len(categories) > 1 if show_order is None else show_order,
+                     name if layout_group is None else layout_group)
+
+
+def standard_tmt_trials(length=25):
+    """The standard TMT-A (numbers) and TMT-B (numbers alternating with letters) trials"""
+    numbers_b, letters_b = split_length(length, 2)
+    last_letter = string.ascii_uppercase[letters_b - 1]
+    return [
+        make_trial('TMT_A', ['numbers'], ASCENDING,
+                   f'Trail Making Test - Part A\n\nClick the numbers from 1 to {length} in ascending order.\n\n'
+                   f'Click each number in sequence: 1 → 2 → 3 → ... → {length}\n\nPress any key to start.',
+                   length=length),
+        make_trial('TMT_B', ['numbers', 'letters'], ASCENDING,
+                   f'Trail Making Test - Part B\n\nAlternate between numbers and letters in ascending order.\n\n'
+                   f'Sequence: 1 → A → 2 → B → 3 → C → ... → {last_letter} → {numbers_b}\n\nPress any key to start.',
+                   length=length, show_order=False),
+    ]
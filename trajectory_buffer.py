@@ -0,0 +1,139 @@
+"""
+Fixed-capacity mouse trajectory storage for the PsychoPy tasks.
+
+Samples (time, x, y, value, pressed) are written into preallocated NumPy
+columns used as a ring buffer, so recording creates no Python object per
+sample. The buffer only overwrites its oldest samples once it holds more than
+its capacity, so slices taken by sample count stay valid until then.
+
+The task loops append one sample per displayed frame, right after the
+window's input events have been dispatched (every flip and key poll), since
+that is when the mouse backend updates the cursor position. The effective
+rate is the frame rate (about 60 Hz), and each sample carries the time it was
+read; sampling between frames would only repeat the last position.
+"""
+import numpy as np
+
+
+class TrajectoryBuffer:
+    """Preallocated ring buffer of mouse samples, one per displayed frame"""
+
+    def __init__(self, capacity=2 ** 20):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.value = np.zeros(capacity, dtype=np.int32)
+        self.pressed = np.zeros(capacity, dtype=np.bool_)
+        self.count = 0  # samples ever appended
+
+    def append(self, t, x, y, value, pressed):
+        """Store one sample, overwriting the oldest once the buffer is full"""
+        i = self.count % self.capacity
+        self.t[i] = t
+        self.x[i] = x
+        self.y[i] = y
+        self.value[i] = value
+        self.pressed[i] = pressed
+        self.count += 1
+
+    def indices(self, start_count=0, end_count=None):
+        """Buffer positions of samples start_count..end_count (only those still held)"""
+        end_count = self.count if end_count is None else end_count
+        start_count = max(start_count, end_count - self.capacity, 0)
+        return np.arange(start_count, end_count) % self.capacity
+
+    def since(self, start_count=0, end_count=None):
+        """Dict of column arrays for the samples between two sample counts, in time order"""
+        idx = self.indices(start_count, end_count)
+        return {
+            't': self.t[idx],
+            'x': self.x[idx],
+            'y': self.y[idx],
+            'value': self.value[idx],
+            'pressed': self.pressed[idx],
+        }
+
+    def save(self, filepath, **metadata):
+        """Write every held sample to a compressed .npz file"""
+        columns = self.since(0)
+        np.savez_compressed(filepath, **columns, **metadata)
+
+
+def slider_decision_metrics(samples, start_time, end_time, start_value=1):
+    """
+    Summarize one slider decision from its per-frame samples: dwell time, number of direction
+    reversals in the selected value, largest value visited, number of value changes, and the
+    number of frames sampled with their effective rate.
+    """
+    values = np.concatenate(([start_value], samples['value']))
+    steps = np.diff(values)
+    steps = steps[steps != 0]
+    reversals = np.count_nonzero(np.diff(np.sign(steps)))
+    return {
+        'slider_dwell_s': round(float(end_time - start_time), 4),
+        'slider_reversals': int(reversals),
+        'slider_max_value': int(values.max()),
+        'slider_value_changes': int(len(steps)),
+        'slider_frames': int(len(samples['t'])),
+        'slider_frame_rate_hz': round(len(samples['t']) / (end_time - start_time), 1) if end_time > start_time else 0.0,
+    }
+
+
+def segment_movement_metrics(samples, num_segments, pause_speed=50.0):
+    """
+    Movement measures of consecutive trajectory segments, where each sample's value is the
+    index of the segment it belongs to and values never decrease. The step between two samples
+    counts towards the segment of the later one, so a segment starts where the previous one
+    ended. Returns arrays of length num_segments: path length, time spent moving slower than
+    pause_speed (units per second), peak speed, straightness (distance between the segment's
+    start and end over its path length, NaN when it did not move) and sample count.
+
+    Speeds only use samples where the position changed, at the time it first appeared, plus
+    the first and last sample of each segment. A position repeated because the cursor was not
+    updated in between is one step over its real duration, not a pause followed by a jump.
+    """
+    t = samples['t']
+    x = samples['x'].astype(np.float64)
+    y = samples['y'].astype(np.float64)
+    segment = samples['value']
+    in_range = (segment >= 0) & (segment < num_segments)
+    metrics = {
+        'path_length': np.zeros(num_segments),
+        'pause_time': np.zeros(num_segments),
+        'peak_speed': np.zeros(num_segments),
+        'straightness': np.full(num_segments, np.nan),
+        'sample_count': np.bincount(segment[in_range], minlength=num_segments)[:num_segments],
+    }
+    if len(t) < 2:
+        return metrics
+
+    # Drop repeated positions, keeping the samples at segment boundaries
+    keep = np.ones(len(t), dtype=np.bool_)
+    keep[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1])
+    new_segment = segment[1:] != segment[:-1]
+    keep[1:] |= new_segment
+    keep[:-1] |= new_segment
+    keep[-1] = True
+    t, x, y, segment, in_range = t[keep], x[keep], y[keep], segment[keep], in_range[keep]
+
+    dt = np.diff(t)
+    step = np.hypot(np.diff(x), np.diff(y))
+    speed = np.divide(step, dt, out=np.zeros_like(step), where=dt > 0)
+    step_segment = segment[1:]
+    keep = in_range[1:]
+    metrics['path_length'] = np.bincount(step_segment[keep], weights=step[keep], minlength=num_segments)
+    paused = keep & (speed < pause_speed)
+    metrics['pause_time'] = np.bincount(step_segment[paused], weights=dt[paused], minlength=num_segments)
+
+    # Steps are sorted by segment, so each segment's steps are one contiguous run
+    present = np.unique(step_segment[keep])
+    if len(present):
+        first_step = np.searchsorted(step_segment, present, side='left')
+        end_step = np.searchsorted(step_segment, present, side='right')
+        metrics['peak_speed'][present] = np.maximum.reduceat(speed[:end_step[-1]], first_step)
+        # Step i runs from sample i to sample i + 1
+        chord = np.hypot(x[end_step] - x[first_step], y[end_step] - y[first_step])
+        path = metrics['path_length'][present]
+        metrics['straightness'][present] = np.divide(chord, path, out=np.full(len(path), np.nan), where=path > 0)
+    return metrics